@@ -0,0 +1,161 @@
+# portfolio/adjustments.py
+"""
+Split / bonus adjustments as a precomputed index.
+
+For every stock with corporate actions, AdjustmentFactor holds one row per
+interval between ex-dates with the cumulative quantity factor of all later
+actions. Consumers never walk actions row by row; they join the index:
+
+    qs = with_adjustment(Transaction.objects.all(), "trade_time")
+    # -> .adj_factor, .adjusted_quantity, .adjusted_price on every row
+
+and aggregate in SQL (see adjusted_positions). The index for a stock is
+rebuilt whenever one of its actions changes (signals, after commit), so
+adding an action touches a handful of rows rather than all history.
+"""
+import logging
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    Case, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, TruncDate
+
+from portfolio.models import AdjustmentFactor, CorporateAction, Transaction
+
+logger = logging.getLogger(__name__)
+
+ONE = Decimal("1")
+BEGINNING = date.min
+FACTOR = DecimalField(max_digits=24, decimal_places=10)
+MONEY = DecimalField(max_digits=40, decimal_places=10)
+
+
+def quantity_factor(action):
+    """How many shares one pre-action share becomes."""
+    ratio_from, ratio_to = Decimal(action.ratio_from), Decimal(action.ratio_to)
+    if action.action_type == CorporateAction.BONUS:
+        return (ratio_from + ratio_to) / ratio_from
+    # split and consolidation: ratio_from old shares -> ratio_to new shares
+    return ratio_to / ratio_from
+
+
+def build_intervals(actions):
+    """
+    [(valid_from, valid_to, factor)] for actions sorted by ex_date. A date
+    before the first ex-date gets the product of all factors, a date between
+    two ex-dates the product of the later ones; after the last, none.
+    """
+    by_date = {}
+    for action in actions:
+        by_date[action.ex_date] = by_date.get(action.ex_date, ONE) * quantity_factor(action)
+    ex_dates = sorted(by_date)
+
+    # suffix[i] = product of the factors of ex_dates[i:]
+    suffix = [ONE] * (len(ex_dates) + 1)
+    for i in range(len(ex_dates) - 1, -1, -1):
+        suffix[i] = suffix[i + 1] * by_date[ex_dates[i]]
+
+    intervals = []
+    previous = BEGINNING
+    for i, ex_date in enumerate(ex_dates):
+        intervals.append((previous, ex_date, suffix[i]))
+        previous = ex_date
+    return intervals
+
+
+def rebuild_adjustment_index(stock_ids):
+    """Recompute AdjustmentFactor rows for the given stocks only."""
+    stock_ids = list(set(stock_ids))
+    if not stock_ids:
+        return 0
+    actions = {}
+    for action in CorporateAction.objects.filter(stock_id__in=stock_ids).order_by("ex_date"):
+        actions.setdefault(action.stock_id, []).append(action)
+
+    rows = []
+    for stock_id in stock_ids:
+        for valid_from, valid_to, factor in build_intervals(actions.get(stock_id, [])):
+            rows.append(AdjustmentFactor(stock_id=stock_id, valid_from=valid_from, valid_to=valid_to, factor=factor))
+
+    with transaction.atomic():
+        AdjustmentFactor.objects.filter(stock_id__in=stock_ids).delete()
+        AdjustmentFactor.objects.bulk_create(rows, batch_size=1000)
+    logger.info("Rebuilt adjustment index for %d stock(s): %d interval(s)", len(stock_ids), len(rows))
+    return len(rows)
+
+
+def rebuild_all():
+    return rebuild_adjustment_index(
+        CorporateAction.objects.values_list("stock_id", flat=True).distinct()
+    )
+
+
+def factor_subquery(stock_ref, day_ref):
+    """Cumulative factor for (stock, day) from the index, 1 if no interval matches."""
+    matching = AdjustmentFactor.objects.filter(
+        stock_id=OuterRef(stock_ref),
+        valid_from__lte=OuterRef(day_ref),
+        valid_to__gt=OuterRef(day_ref),
+    ).values("factor")[:1]
+    return Coalesce(Subquery(matching, output_field=FACTOR), Value(ONE), output_field=FACTOR)
+
+
+def with_adjustment(qs, date_field, stock_field="stock_id", quantity_field="quantity", price_field="price"):
+    """
+    Annotate `qs` with adj_factor, adjusted_quantity and adjusted_price
+    (today's share terms) from the index, as one correlated lookup per row
+    in SQL. `date_field` may be a date or datetime field.
+    """
+    qs = qs.annotate(_adj_day=TruncDate(date_field)).annotate(
+        adj_factor=factor_subquery(stock_field, "_adj_day"),
+    )
+    annotations = {}
+    if quantity_field:
+        annotations["adjusted_quantity"] = ExpressionWrapper(F(quantity_field) * F("adj_factor"), output_field=MONEY)
+    if price_field:
+        annotations["adjusted_price"] = ExpressionWrapper(F(price_field) / F("adj_factor"), output_field=MONEY)
+    return qs.annotate(**annotations)
+
+
+def adjusted_positions(portfolio_ids=None, broker_account_ids=None):
+    """
+    Split/bonus-adjusted net quantity and buy-side cost basis per
+    (broker_account, stock) from transactions, in one aggregate query.
+    Cost is unaffected by adjustments; only quantities (and thus the
+    average price) are. Returns a list of dicts.
+    """
+    qs = Transaction.objects.all()
+    if portfolio_ids is not None:
+        qs = qs.filter(broker_account__portfolio_id__in=list(portfolio_ids))
+    if broker_account_ids is not None:
+        qs = qs.filter(broker_account_id__in=list(broker_account_ids))
+
+    qs = with_adjustment(qs, "trade_time", price_field=None)
+    buy = Q(trade_type__iexact="BUY")
+    sell = Q(trade_type__iexact="SELL")
+    rows = (
+        qs.values("broker_account_id", "stock_id")
+        .annotate(
+            bought=Sum(Case(When(buy, then=F("adjusted_quantity")), default=Value(0), output_field=MONEY)),
+            sold=Sum(Case(When(sell, then=F("adjusted_quantity")), default=Value(0), output_field=MONEY)),
+            buy_cost=Sum(Case(
+                When(buy, then=ExpressionWrapper(F("quantity") * F("price"), output_field=MONEY)),
+                default=Value(0), output_field=MONEY,
+            )),
+        )
+        .order_by()
+    )
+    out = []
+    for row in rows:
+        bought = row["bought"] or Decimal("0")
+        sold = row["sold"] or Decimal("0")
+        out.append({
+            "broker_account_id": row["broker_account_id"],
+            "stock_id": row["stock_id"],
+            "quantity": bought - sold,
+            "avg_price": (row["buy_cost"] / bought) if bought else None,
+        })
+    return out
@@ -1,6 +1,137 @@
 from decimal import Decimal
-from django.contrib import admin
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import Http404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+from django.utils.functional import cached_property
+
 from . import models
+from .bulk_sync import bulk_sync_progress, enqueue_bulk_sync
+from .db_router import replica_reads
+from .services import portfolio_valuation
+
+DASHBOARD_CACHE_KEY = "admin:portfolio:dashboard"
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that, for an unfiltered changelist on Postgres, takes the row
+    count from the planner statistics (pg_class.reltuples, summed over the
+    partitions of a partitioned table) instead of COUNT(*). Below
+    ADMIN_ESTIMATED_COUNT_THRESHOLD rows, or when filters are applied, the
+    exact count is used.
+    """
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        query = getattr(qs, "query", None)
+        if query is not None and not query.where:
+            estimate = self._estimate(qs)
+            if estimate is not None and estimate >= getattr(settings, "ADMIN_ESTIMATED_COUNT_THRESHOLD", 100000):
+                return estimate
+        return super().count
+
+    @staticmethod
+    def _estimate(qs):
+        connection = connections[qs.db]
+        if connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            # A partitioned parent (relkind 'p', e.g. portfolio_transaction)
+            # has no rows of its own: add up its partitions instead.
+            cursor.execute(
+                """
+                SELECT CASE WHEN c.relkind = 'p' THEN (
+                    SELECT sum(GREATEST(child.reltuples, 0)) FROM pg_inherits i
+                    JOIN pg_class child ON child.oid = i.inhrelid
+                    WHERE i.inhparent = c.oid
+                ) ELSE c.reltuples END::bigint
+                FROM pg_class c WHERE c.oid = to_regclass(%s)
+                """,
+                [qs.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 / 0 for tables that were never analyzed.
+        if not row or row[0] is None or row[0] <= 0:
+            return None
+        return int(row[0])
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist defaults for tables that grow with every sync."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False      # skip the second, unfiltered COUNT(*)
+
+    def changelist_view(self, request, extra_context=None):
+        # Lists are read from a replica; change forms stay on the primary.
+        with replica_reads():
+            return super().changelist_view(request, extra_context)
+
+
+def build_dashboard():
+    valuation = portfolio_valuation()
+    names = dict(
+        models.Portfolio.objects.filter(id__in=list(valuation))
+        .values_list('id', 'name')
+    )
+
+    portfolios = []
+    by_asset_type = {}
+    totals = {"cost_value": Decimal("0"), "market_value": Decimal("0"), "holdings": 0}
+    for pid, summary in sorted(valuation.items()):
+        portfolios.append({
+            "id": pid,
+            "name": names.get(pid, pid),
+            "cost_value": summary["cost_value"],
+            "market_value": summary["market_value"],
+            "pnl": summary["market_value"] - summary["cost_value"],
+            "holdings": summary["holdings"],
+            "by_asset_type": sorted(summary["by_asset_type"].items()),
+        })
+        for key in totals:
+            totals[key] += summary[key]
+        for asset_type, values in summary["by_asset_type"].items():
+            bucket = by_asset_type.setdefault(
+                asset_type, {"cost_value": Decimal("0"), "market_value": Decimal("0"), "holdings": 0}
+            )
+            for key in bucket:
+                bucket[key] += values[key]
+
+    totals["pnl"] = totals["market_value"] - totals["cost_value"]
+    return {
+        "portfolios": portfolios,
+        "asset_types": sorted(by_asset_type.items()),
+        "totals": totals,
+    }
+
+
+def _enqueue_sync(modeladmin, request, accounts):
+    summary = enqueue_bulk_sync(accounts)
+    coalesced = sum(b["coalesced"] for b in summary["brokers"].values())
+    if summary["group_id"] is None:
+        modeladmin.message_user(
+            request, f"Nothing enqueued: {coalesced} account(s) already syncing.", messages.WARNING,
+        )
+        return
+    url = reverse("admin:portfolio_sync_status", args=[summary["group_id"]])
+    modeladmin.message_user(request, format_html(
+        'Enqueued {} sync(s), {} already in flight. <a href="{}">Follow progress</a>.',
+        summary["total"], coalesced, url,
+    ), messages.SUCCESS)
+    if summary["deferred"]:
+        modeladmin.message_user(
+            request,
+            f"{summary['deferred']} account(s) deferred: they do not fit in BULK_SYNC_MAX_SPREAD_SECONDS "
+            f"at the broker rate limits. Run the action again later for them.",
+            messages.WARNING,
+        )
 
 
 @admin.register(models.User)
@@ -12,6 +143,33 @@ class UserAdmin(admin.ModelAdmin):
 class PortfolioAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'is_default', 'active', 'created_at')
     list_filter = ('active', 'is_default')
+    list_select_related = ('user',)
+    actions = ['sync_now']
+
+    @admin.action(description="Sync holdings now")
+    def sync_now(self, request, queryset):
+        accounts = models.BrokerAccount.objects.filter(portfolio__in=queryset)
+        _enqueue_sync(self, request, accounts)
+
+    def get_urls(self):
+        urls = [
+            path('dashboard/', self.admin_site.admin_view(self.dashboard_view), name='portfolio_portfolio_dashboard'),
+        ]
+        return urls + super().get_urls()
+
+    def dashboard_view(self, request):
+        """Valuation per portfolio and asset type, from one aggregate query."""
+        context = cache.get(DASHBOARD_CACHE_KEY)
+        if context is None:
+            with replica_reads():
+                context = build_dashboard()
+            cache.set(DASHBOARD_CACHE_KEY, context, getattr(settings, "ADMIN_DASHBOARD_CACHE_SECONDS", 60))
+        return TemplateResponse(request, "admin/portfolio/dashboard.html", {
+            **self.admin_site.each_context(request),
+            **context,
+            "opts": self.model._meta,
+            "title": "Portfolio dashboard",
+        })
 
 
 @admin.register(models.BrokerType)
@@ -23,6 +181,30 @@ class BrokerTypeAdmin(admin.ModelAdmin):
 class BrokerAccountAdmin(admin.ModelAdmin):
     list_display = ('display_name_or_ext', 'portfolio', 'broker_type', 'status', 'created_at')
     list_filter = ('broker_type', 'status')
+    list_select_related = ('portfolio__user', 'broker_type')
+    actions = ['sync_now']
+
+    @admin.action(description="Sync holdings now")
+    def sync_now(self, request, queryset):
+        _enqueue_sync(self, request, queryset)
+
+    def get_urls(self):
+        urls = [
+            path('sync-status/<str:group_id>/', self.admin_site.admin_view(self.sync_status_view),
+                 name='portfolio_sync_status'),
+        ]
+        return urls + super().get_urls()
+
+    def sync_status_view(self, request, group_id):
+        progress = bulk_sync_progress(group_id)
+        if progress is None:
+            raise Http404("Unknown or expired sync batch.")
+        return TemplateResponse(request, "admin/portfolio/sync_status.html", {
+            **self.admin_site.each_context(request),
+            **progress,
+            "opts": self.model._meta,
+            "title": "Bulk sync progress",
+        })
 
     @admin.display(description="Account")
     def display_name_or_ext(self, obj: models.BrokerAccount):
@@ -32,21 +214,79 @@ class BrokerAccountAdmin(admin.ModelAdmin):
 @admin.register(models.BrokerAccountCredential)
 class BrokerAccountCredentialAdmin(admin.ModelAdmin):
     list_display = ('broker_account', 'encrypted', 'created_at', 'updated_at')
+    list_select_related = ('broker_account__broker_type',)
 
 
 @admin.register(models.Stock)
-class StockAdmin(admin.ModelAdmin):
+class StockAdmin(LargeTableAdmin):
     list_display = ('symbol', 'isin', 'asset_type', 'close_price', 'last_price', 'as_of', 'received_at')
     list_filter = ('asset_type',)
     search_fields = ('symbol', 'isin')
 
 
+@admin.register(models.FxRate)
+class FxRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'rate_date', 'rate', 'source', 'fetched_at')
+    list_filter = ('currency', 'source')
+    date_hierarchy = 'rate_date'
+
+
+@admin.register(models.CorporateAction)
+class CorporateActionAdmin(admin.ModelAdmin):
+    list_display = ('stock', 'action_type', 'ratio_from', 'ratio_to', 'ex_date', 'created_at')
+    list_filter = ('action_type',)
+    search_fields = ('stock__symbol', 'stock__isin')
+    list_select_related = ('stock',)
+    raw_id_fields = ('stock',)
+    date_hierarchy = 'ex_date'
+
+
+@admin.register(models.AdjustmentFactor)
+class AdjustmentFactorAdmin(admin.ModelAdmin):
+    """Derived from CorporateAction; rebuilt automatically, so read-only."""
+    list_display = ('stock', 'valid_from', 'valid_to', 'factor')
+    search_fields = ('stock__symbol',)
+    list_select_related = ('stock',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(models.StockDailyPrice)
+class StockDailyPriceAdmin(LargeTableAdmin):
+    list_display = ('stock', 'price_date', 'close', 'recorded_at')
+    search_fields = ('stock__symbol',)
+    list_select_related = ('stock',)
+    raw_id_fields = ('stock',)
+
+
+@admin.register(models.PortfolioDailyValue)
+class PortfolioDailyValueAdmin(LargeTableAdmin):
+    list_display = ('portfolio', 'value_date', 'market_value', 'net_flow', 'currency', 'computed_at')
+    list_select_related = ('portfolio__user',)
+    raw_id_fields = ('portfolio',)
+
+
+@admin.register(models.RawSnapshot)
+class RawSnapshotAdmin(LargeTableAdmin):
+    list_display = ('digest', 'codec', 'raw_size', 'created_at')
+    exclude = ('payload',)
+    readonly_fields = ('digest', 'codec', 'raw_size', 'created_at')
+
+
 @admin.register(models.Holding)
-class HoldingAdmin(admin.ModelAdmin):
+class HoldingAdmin(LargeTableAdmin):
     list_display = ('stock_symbol', 'broker_account', 'quantity', 'avg_price',
                     'currency', 'as_of', 'created_at')
     list_filter = ('broker_account', 'stock__asset_type', 'currency')
     search_fields = ('stock__symbol', 'broker_account__external_account_id')
+    list_select_related = ('stock', 'broker_account__broker_type')
 
     @admin.display(description="Symbol")
     def stock_symbol(self, obj: models.Holding):
@@ -58,11 +298,12 @@ class HoldingAdmin(admin.ModelAdmin):
 
 
 @admin.register(models.Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(LargeTableAdmin):
     list_display = ('broker_account', 'stock_symbol', 'trade_type',
                     'quantity', 'price', 'currency', 'trade_time')
     list_filter = ('broker_account', 'stock__asset_type', 'trade_type', 'currency')
     search_fields = ('stock__symbol', 'broker_account__external_account_id')
+    list_select_related = ('stock', 'broker_account__broker_type')
 
     @admin.display(description="Symbol")
     def stock_symbol(self, obj: models.Transaction):
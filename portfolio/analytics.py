@@ -0,0 +1,160 @@
+# portfolio/analytics.py
+"""
+Versioned cache for per-portfolio analytics.
+
+Valuation, allocation, XIRR etc. are pure functions of a portfolio's
+holdings / transactions and of prices and FX rates, so their results are
+cached under
+
+    analytics:<computation>:<portfolio>:<versions of its inputs>:<params>
+
+with the counters from portfolio.versions. persist_holdings, model saves,
+price writes and FX refreshes bump those counters after commit, which makes
+every older entry unreachable: a result is never served stale and never
+recomputed while its inputs are unchanged. Entries expire after
+ANALYTICS_CACHE_SECONDS only to free memory.
+
+A miss is recomputed by a single caller (cache.add lock); concurrent callers
+wait for its result for up to ANALYTICS_WAIT_SECONDS instead of piling onto
+the database. Hits, misses and waits are counted per computation in Redis
+(analytics_stats / `manage.py analytics_stats`).
+
+Register a computation with
+
+    @register_computation("name", depends=("portfolio", "prices"))
+    def compute(portfolio_id, **params): ...
+
+and read it with get_analytics("name", portfolio_id, **params).
+"""
+import hashlib
+import json
+import logging
+import time
+from decimal import Decimal
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+from portfolio.adjustments import adjusted_positions
+from portfolio.performance import portfolio_xirr
+from portfolio.redis_client import get_redis
+from portfolio.services import portfolio_valuation
+from portfolio.versions import current_versions
+
+logger = logging.getLogger(__name__)
+
+COMPUTATIONS = {}
+STATS_KEY = "analytics:stats"
+OUTCOMES = ("hit", "miss", "wait")
+_MISSING = object()
+
+
+def register_computation(name, depends):
+    """`depends`: version kinds the result is derived from (see versions.current_versions)."""
+    def _inner(func):
+        COMPUTATIONS[name] = (func, tuple(depends))
+        return func
+    return _inner
+
+
+def cache_key(name, portfolio_id, versions, params):
+    params = {k: v for k, v in params.items() if v is not None}     # f(x) == f(x, currency=None)
+    digest = hashlib.sha256(
+        json.dumps(sorted(params.items()), default=str, separators=(",", ":")).encode()
+    ).hexdigest()[:16]
+    return f"analytics:{name}:{portfolio_id}:{':'.join(str(v) for v in versions)}:{digest}"
+
+
+def _count(name, outcome):
+    try:
+        get_redis().hincrby(STATS_KEY, f"{name}:{outcome}", 1)
+    except redis.RedisError:
+        logger.debug("Cannot record analytics %s for %s", outcome, name, exc_info=True)
+
+
+def get_analytics(name, portfolio_id, **params):
+    """Cached result of computation `name` for a portfolio; computed once per data version."""
+    try:
+        func, depends = COMPUTATIONS[name]
+    except KeyError:
+        raise KeyError(f"Unknown computation '{name}'. Known: {', '.join(sorted(COMPUTATIONS))}")
+
+    key = cache_key(name, portfolio_id, current_versions(portfolio_id, depends), params)
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _count(name, "hit")
+        return value
+
+    lock_key, locked = f"{key}:lock", True
+    deadline = time.monotonic() + getattr(settings, "ANALYTICS_WAIT_SECONDS", 10)
+    while not cache.add(lock_key, 1, timeout=getattr(settings, "ANALYTICS_LOCK_SECONDS", 60)):
+        # Someone else is computing it: wait for their result.
+        time.sleep(0.05)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            _count(name, "wait")
+            return value
+        if time.monotonic() > deadline:
+            logger.warning("Timed out waiting for %s; computing it here", key)
+            locked = False
+            break
+
+    _count(name, "miss")
+    try:
+        value = func(portfolio_id, **params)
+        cache.set(key, value, getattr(settings, "ANALYTICS_CACHE_SECONDS", 86400))
+        return value
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def analytics_stats():
+    """{computation: {"hit", "miss", "wait", "hit_rate"}} since the last reset."""
+    out = {}
+    for field, count in get_redis().hgetall(STATS_KEY).items():
+        name, _, outcome = field.rpartition(":")
+        out.setdefault(name, dict.fromkeys(OUTCOMES, 0))[outcome] = int(count)
+    for counts in out.values():
+        total = sum(counts[o] for o in OUTCOMES)
+        counts["hit_rate"] = (counts["hit"] + counts["wait"]) / total if total else None
+    return out
+
+
+def reset_analytics_stats():
+    get_redis().delete(STATS_KEY)
+
+
+# ---------------------------------------------------------
+# Computations
+# ---------------------------------------------------------
+@register_computation("valuation", depends=("portfolio", "prices", "fx"))
+def valuation(portfolio_id, currency=None):
+    return portfolio_valuation([portfolio_id], currency).get(portfolio_id)
+
+
+@register_computation("allocation", depends=("portfolio", "prices", "fx"))
+def allocation(portfolio_id, currency=None):
+    """Share of market value per asset type, from the (cached) valuation."""
+    summary = get_analytics("valuation", portfolio_id, currency=currency)
+    if not summary or not summary["market_value"]:
+        return {}
+    total = summary["market_value"]
+    return {
+        asset_type: (bucket["market_value"] / total).quantize(Decimal("0.0001"))
+        for asset_type, bucket in summary["by_asset_type"].items()
+    }
+
+
+@register_computation("xirr", depends=("portfolio", "prices", "fx"))
+def xirr(portfolio_id, currency=None):
+    summary = get_analytics("valuation", portfolio_id, currency=currency)
+    market_value = summary["market_value"] if summary else Decimal("0")
+    return portfolio_xirr(portfolio_id, market_value, currency)
+
+
+# Corporate actions bump the prices version, so adjusted quantities follow them.
+@register_computation("positions", depends=("portfolio", "prices"))
+def positions(portfolio_id):
+    return adjusted_positions(portfolio_ids=[portfolio_id])
@@ -4,6 +4,9 @@ class PortfolioConfig(AppConfig):
     def ready(self):
         # import signals / tasks to ensure they are registered
         import portfolio.tasks
+        import portfolio.signals
+        import portfolio.db_router
+        import portfolio.warmup
 
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'portfolio'
@@ -0,0 +1,181 @@
+# portfolio/bulk_sync.py
+"""
+"Sync now" for many broker accounts at once (admin actions).
+
+Accounts are grouped by broker and every account gets the usual dedup
+lease, so anything already syncing is coalesced rather than queued twice.
+Within a broker, tasks are staggered with a countdown so the broker sees at
+most BROKER_SYNC_RATE_LIMITS[code] requests per minute; the lease TTL is
+extended by the same countdown so it can't expire while a task waits.
+
+Countdowns are capped at BULK_SYNC_MAX_SPREAD_SECONDS, which must stay
+below the broker's visibility_timeout (CELERY_BROKER_TRANSPORT_OPTIONS):
+an ETA message still unacked after that is redelivered and would run a
+second time under the same lease. Accounts that do not fit in the window
+at the broker's rate are not enqueued; they are reported as "deferred" and
+go out with the next run.
+
+Unlike portfolio_sync_task this is a flat group, not a chord per
+portfolio: portfolio_sync_complete_task does not run, so the cached
+portfolio summary is not refreshed and portfolio:sync:completed is not
+published for these syncs (the API and analytics caches still follow the
+version bumps of persist_holdings).
+
+All tasks go out as one Celery group, published over a single producer
+connection, and the GroupResult is saved so its progress can be followed
+on the admin status page (bulk_sync_progress).
+"""
+import logging
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from celery import current_app, group
+from celery.backends.base import KeyValueStoreBackend
+from celery.result import GroupResult
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from portfolio.locks import acquire_sync_leases, record_coalesced_many
+from portfolio.routing import broker_queue
+from portfolio.tasks.broker import broker_action_task
+
+logger = logging.getLogger(__name__)
+
+_PROGRESS_CHUNK = 1000
+
+
+def _summary_key(group_id):
+    return f"bulk_sync:{group_id}"
+
+
+def broker_rate_per_minute(code):
+    limits = getattr(settings, "BROKER_SYNC_RATE_LIMITS", {})
+    return limits.get(code, getattr(settings, "BROKER_SYNC_DEFAULT_RATE", 60))
+
+
+def enqueue_bulk_sync(accounts, action="holdings"):
+    """
+    Enqueue broker_action_task for every account in `accounts` (a
+    BrokerAccount queryset). Returns a summary dict; `group_id` is None if
+    nothing was enqueued.
+    """
+    by_broker = defaultdict(list)
+    for acc_id, portfolio_id, code in (
+        accounts.order_by("id").values_list("id", "portfolio_id", "broker_type__code").iterator()
+    ):
+        by_broker[code].append((acc_id, portfolio_id))
+
+    max_spread = getattr(settings, "BULK_SYNC_MAX_SPREAD_SECONDS", 3000)
+    sigs = []
+    brokers = {}
+    coalesced_requests = []
+    deferred_total = 0
+    for code, all_rows in sorted(by_broker.items()):
+        spacing = 60.0 / max(broker_rate_per_minute(code), 1)
+        fits = int(max_spread // spacing) + 1
+        rows, deferred = all_rows[:fits], max(len(all_rows) - fits, 0)
+        deferred_total += deferred
+        countdowns = [round(i * spacing, 3) for i in range(len(rows))]
+        leases = acquire_sync_leases(
+            (acc_id, action, countdown) for (acc_id, _), countdown in zip(rows, countdowns)
+        )
+
+        queued = coalesced = 0
+        queue = broker_queue(code)
+        for (acc_id, portfolio_id), lease in zip(rows, leases):
+            if lease is None:
+                coalesced_requests.append((acc_id, action))
+                coalesced += 1
+                continue
+            # Countdown by position among the *queued* tasks, matching the lease TTL
+            # taken above (which can only be longer).
+            sigs.append(
+                broker_action_task.s(portfolio_id, acc_id, action, lease=lease)
+                .set(queue=queue, countdown=countdowns[queued])
+            )
+            queued += 1
+        brokers[code] = {"queued": queued, "coalesced": coalesced, "deferred": deferred,
+                         "spread_seconds": countdowns[queued - 1] if queued else 0}
+    # One round trip for all coalesced accounts, like the lease acquisition.
+    record_coalesced_many(coalesced_requests)
+
+    summary = {
+        "group_id": None,
+        "action": action,
+        "created_at": timezone.now().isoformat(),
+        "total": len(sigs),
+        "deferred": deferred_total,
+        "brokers": brokers,
+    }
+    if deferred_total:
+        logger.warning(
+            "Bulk %s sync: %d account(s) deferred, they do not fit in %ss at the broker rate limits",
+            action, deferred_total, max_spread,
+        )
+    if not sigs:
+        return summary
+
+    result = group(sigs).apply_async()
+    result.save()
+    summary["group_id"] = result.id
+    cache.set(_summary_key(result.id), summary, _result_expiry())
+    logger.info("Bulk %s sync %s: %d task(s) %s", action, result.id, len(sigs), brokers)
+    return summary
+
+
+def _result_expiry():
+    # Keep the summary as long as the task results it describes.
+    expires = current_app.conf.result_expires
+    if isinstance(expires, timedelta):
+        return int(expires.total_seconds())
+    return int(expires or 86400)
+
+
+def bulk_sync_progress(group_id):
+    """
+    Task states and outcomes for a saved bulk sync, or None if unknown.
+    Key-value result backends (Redis) are read with batched MGETs instead
+    of one round trip per task.
+    """
+    result = GroupResult.restore(group_id, app=current_app)
+    if result is None:
+        return None
+
+    states = Counter()
+    outcomes = Counter()
+    backend = result.app.backend
+    children = result.results or []
+    if isinstance(backend, KeyValueStoreBackend):
+        ids = [child.id for child in children]
+        for start in range(0, len(ids), _PROGRESS_CHUNK):
+            chunk = ids[start:start + _PROGRESS_CHUNK]
+            keys = [backend.get_key_for_task(task_id) for task_id in chunk]
+            values = backend.mget(keys)
+            if hasattr(values, "get"):     # some stores return {key: value} for hits only
+                values = [values.get(key) for key in keys]
+            for raw in values:
+                if not raw:
+                    states["PENDING"] += 1
+                    continue
+                meta = backend.decode_result(raw)
+                states[meta["status"]] += 1
+                if meta["status"] == "SUCCESS" and isinstance(meta.get("result"), dict):
+                    outcomes[meta["result"].get("status")] += 1
+    else:
+        for child in children:
+            states[child.state] += 1
+            if child.state == "SUCCESS" and isinstance(child.result, dict):
+                outcomes[child.result.get("status")] += 1
+
+    total = len(children)
+    done = sum(n for state, n in states.items() if state in ("SUCCESS", "FAILURE", "REVOKED"))
+    return {
+        "group_id": group_id,
+        "summary": cache.get(_summary_key(group_id)),
+        "total": total,
+        "done": done,
+        "percent": round(100.0 * done / total, 1) if total else 100.0,
+        "states": sorted(states.items()),
+        "outcomes": sorted(outcomes.items(), key=lambda item: str(item[0])),
+    }
@@ -0,0 +1,131 @@
+# portfolio/db_router.py
+"""
+Read-replica routing.
+
+Everything goes to `default` unless code explicitly opts in with
+`replica_reads()` (admin changelists, the dashboard, exports). Inside such
+a block reads go to a healthy replica from DATABASE_REPLICAS, except:
+
+  - after the current request / task has written anything (read-your-writes:
+    the rest of it stays pinned to `default`),
+  - inside a transaction on `default`,
+  - when every replica lags more than REPLICA_MAX_LAG_SECONDS (or is down).
+
+Replica lag is measured at most every REPLICA_LAG_CHECK_SECONDS per process.
+Pinning is reset at the start of every request and Celery task.
+
+Locally, point DATABASE_REPLICA_URLS at the same SQLite file as
+DATABASE_URL to get a second alias with zero lag.
+"""
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+from celery.signals import task_prerun
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB = "default"
+
+_replica_reads = contextvars.ContextVar("replica_reads", default=False)
+_pinned = contextvars.ContextVar("pinned_to_primary", default=False)
+_lag = {}       # alias -> (checked_at monotonic, lag seconds or None if unreachable)
+
+_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+def replica_aliases():
+    return list(getattr(settings, "DATABASE_REPLICAS", []))
+
+
+@contextmanager
+def replica_reads():
+    """Send reads in this block to a replica (subject to the rules above)."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def pin_to_primary():
+    _pinned.set(True)
+
+
+def reset_pinning(**kwargs):
+    _pinned.set(False)
+
+
+def replica_lag(alias):
+    """Replication lag in seconds, or None if the replica can't be queried."""
+    interval = getattr(settings, "REPLICA_LAG_CHECK_SECONDS", 5)
+    now = time.monotonic()
+    cached = _lag.get(alias)
+    if cached is not None and now - cached[0] < interval:
+        return cached[1]
+
+    connection = connections[alias]
+    lag = 0.0
+    if connection.vendor == "postgresql":
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(_LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+        except Exception:
+            logger.warning("Replica %s unreachable, reading from %s", alias, DEFAULT_DB, exc_info=True)
+            lag = None
+    _lag[alias] = (now, lag)
+    return lag
+
+
+def healthy_replicas():
+    max_lag = getattr(settings, "REPLICA_MAX_LAG_SECONDS", 5)
+    healthy = []
+    for alias in replica_aliases():
+        lag = replica_lag(alias)
+        if lag is not None and lag <= max_lag:
+            healthy.append(alias)
+    return healthy
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or _pinned.get():
+            return DEFAULT_DB
+        if connections[DEFAULT_DB].in_atomic_block:
+            return DEFAULT_DB
+        healthy = healthy_replicas()
+        if not healthy:
+            return DEFAULT_DB
+        return random.choice(healthy)
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return DEFAULT_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication.
+        if db in replica_aliases():
+            return False
+        return None
+
+
+request_started.connect(reset_pinning, dispatch_uid="portfolio.db_router.request")
+task_prerun.connect(reset_pinning, dispatch_uid="portfolio.db_router.task")
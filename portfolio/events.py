@@ -0,0 +1,177 @@
+# portfolio/events.py
+"""
+Holdings change events on a Redis Stream.
+
+persist_holdings diffs each snapshot against the account's previous
+holdings (one extra query) and write_quotes compares old and new prices,
+and both publish compact events after commit:
+
+    type=new       account, portfolio, stock, symbol, quantity
+    type=quantity  ... quantity, prev_quantity
+    type=closed    ... prev_quantity
+    type=price     stock, symbol, price, prev_price (account / portfolio
+                   set when the move came from a holdings sync)
+
+Events go to HOLDING_EVENTS_STREAM with pipelined XADDs, trimmed to about
+HOLDING_EVENTS_MAXLEN entries. Consumers read them through consumer groups
+(read_events / ack_events, or `manage.py consume_holding_events`), so each
+consumer only does work proportional to the number of changes instead of
+polling the Holding table.
+"""
+import logging
+from decimal import Decimal
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from portfolio.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_BATCH_SIZE = 500
+
+
+def events_enabled():
+    return getattr(settings, "HOLDING_EVENTS_ENABLED", True)
+
+
+def stream_name():
+    return getattr(settings, "HOLDING_EVENTS_STREAM", "holdings:events")
+
+
+def _event(event_type, stock_id, symbol, broker_account=None, **fields):
+    event = {"type": event_type, "stock": stock_id, "symbol": symbol, "at": timezone.now().isoformat()}
+    if broker_account is not None:
+        event["account"] = broker_account.pk
+        event["portfolio"] = broker_account.portfolio_id
+    event.update((k, v) for k, v in fields.items() if v is not None)
+    # Stream fields are flat strings.
+    return {k: str(v) for k, v in event.items()}
+
+
+def price_moved(previous, current):
+    """True if the move is at least HOLDING_EVENTS_PRICE_MOVE_PCT percent (0: any change)."""
+    if previous is None or current is None or previous == current:
+        return False
+    if not previous:
+        return True
+    threshold = Decimal(str(getattr(settings, "HOLDING_EVENTS_PRICE_MOVE_PCT", 0)))
+    return abs(current - previous) * 100 / abs(previous) >= threshold
+
+
+def holding_changes(broker_account, previous, current, closed_ids, prices, symbols):
+    """
+    Events for one persisted snapshot.
+
+    previous:  {stock_id: (quantity, last_price)} before the snapshot
+    current:   {stock_id: quantity} written by the snapshot
+    closed_ids: stock ids whose holding the snapshot removed
+    prices:    {stock_id: last_price} prices the snapshot wrote
+    symbols:   {stock_id: symbol}
+    """
+    events = []
+    for stock_id, quantity in current.items():
+        before = previous.get(stock_id)
+        if before is None:
+            events.append(_event("new", stock_id, symbols.get(stock_id), broker_account, quantity=quantity))
+        elif before[0] != quantity:
+            events.append(_event(
+                "quantity", stock_id, symbols.get(stock_id), broker_account,
+                quantity=quantity, prev_quantity=before[0],
+            ))
+    for stock_id in closed_ids:
+        before = previous.get(stock_id)
+        events.append(_event(
+            "closed", stock_id, symbols.get(stock_id), broker_account,
+            prev_quantity=before[0] if before else None,
+        ))
+    for stock_id, price in prices.items():
+        before = previous.get(stock_id)
+        if before is not None and price_moved(before[1], price):
+            events.append(_event(
+                "price", stock_id, symbols.get(stock_id), broker_account, price=price, prev_price=before[1],
+            ))
+    return events
+
+
+def price_event(stock, prev_price):
+    return _event("price", stock.pk, stock.symbol, price=stock.last_price, prev_price=prev_price)
+
+
+def publish_events(events):
+    """XADD events to the stream, pipelined in batches. Returns the number published."""
+    if not events:
+        return 0
+    client = get_redis()
+    stream = stream_name()
+    maxlen = getattr(settings, "HOLDING_EVENTS_MAXLEN", 100000)
+    for start in range(0, len(events), PIPELINE_BATCH_SIZE):
+        pipe = client.pipeline(transaction=False)
+        for event in events[start:start + PIPELINE_BATCH_SIZE]:
+            pipe.xadd(stream, event, maxlen=maxlen, approximate=True)
+        pipe.execute()
+    return len(events)
+
+
+def publish_events_on_commit(events):
+    """Publish once the surrounding transaction commits; a Redis outage is logged, not raised."""
+    if events:
+        transaction.on_commit(lambda: publish_events(events), robust=True)
+
+
+# ---------------------------------------------------------
+# Consumers
+# ---------------------------------------------------------
+def ensure_group(group, from_start=False):
+    """Create consumer group `group` (and the stream) if missing. Returns True if created."""
+    try:
+        get_redis().xgroup_create(stream_name(), group, id="0" if from_start else "$", mkstream=True)
+    except redis.ResponseError as exc:
+        if "BUSYGROUP" not in str(exc):
+            raise
+        return False
+    return True
+
+
+def read_events(group, consumer, count=100, block=None, pending=False):
+    """
+    [(event_id, fields)] for `consumer` in `group`: new events, or with
+    pending=True the ones it read earlier but never acknowledged.
+    """
+    response = get_redis().xreadgroup(
+        group, consumer, {stream_name(): "0" if pending else ">"}, count=count, block=block,
+    )
+    return [entry for _, entries in response or [] for entry in entries if entry[1] is not None]
+
+
+def ack_events(group, event_ids):
+    if not event_ids:
+        return 0
+    return get_redis().xack(stream_name(), group, *event_ids)
+
+
+def stream_info():
+    """Length and per-group lag / pending counts of the stream."""
+    client = get_redis()
+    stream = stream_name()
+    try:
+        length = client.xlen(stream)
+        groups = client.xinfo_groups(stream)
+    except redis.ResponseError:      # stream does not exist yet
+        return {"stream": stream, "length": 0, "groups": []}
+    return {
+        "stream": stream,
+        "length": length,
+        "groups": [
+            {
+                "name": g["name"],
+                "consumers": g["consumers"],
+                "pending": g["pending"],
+                "lag": g.get("lag"),
+                "last_delivered_id": g["last-delivered-id"],
+            }
+            for g in groups
+        ],
+    }
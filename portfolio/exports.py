@@ -0,0 +1,181 @@
+# portfolio/exports.py
+"""
+Constant-memory exports of holdings and transactions.
+
+Rows come from `values_list(...).iterator(chunk_size=...)` (a server-side
+cursor on Postgres), are rendered one chunk at a time as CSV or NDJSON and
+can be gzipped on the fly, so neither the export view nor the management
+command ever holds more than one chunk in memory.
+"""
+import csv
+import json
+import zlib
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from portfolio.models import Holding, Transaction
+
+DEFAULT_CHUNK_SIZE = 2000
+FORMATS = ("csv", "ndjson")
+
+
+class ExportError(ValueError):
+    pass
+
+
+# name -> (model, date field, [(column, lookup), ...])
+EXPORTS = {
+    "holdings": (Holding, "as_of", [
+        ("id", "id"),
+        ("portfolio_id", "broker_account__portfolio_id"),
+        ("broker", "broker_account__broker_type__code"),
+        ("broker_account_id", "broker_account_id"),
+        ("symbol", "stock__symbol"),
+        ("isin", "stock__isin"),
+        ("asset_type", "stock__asset_type"),
+        ("quantity", "quantity"),
+        ("avg_price", "avg_price"),
+        ("last_price", "stock__last_price"),
+        ("currency", "currency"),
+        ("as_of", "as_of"),
+    ]),
+    "transactions": (Transaction, "trade_time", [
+        ("id", "id"),
+        ("portfolio_id", "broker_account__portfolio_id"),
+        ("broker", "broker_account__broker_type__code"),
+        ("broker_account_id", "broker_account_id"),
+        ("symbol", "stock__symbol"),
+        ("isin", "stock__isin"),
+        ("asset_type", "stock__asset_type"),
+        ("trade_type", "trade_type"),
+        ("quantity", "quantity"),
+        ("price", "price"),
+        ("currency", "currency"),
+        ("trade_time", "trade_time"),
+    ]),
+}
+
+
+def _parse_bound(value, end=False):
+    """'2024-01-31' or an ISO datetime -> aware datetime. Dates cover the whole day."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        try:
+            # Well-formed but impossible values (2020-13-01) raise ValueError.
+            dt = parse_datetime(value)
+            day = parse_date(value) if dt is None else None
+        except ValueError:
+            raise ExportError(f"invalid date: {value!r}")
+        if dt is None:
+            if day is None:
+                raise ExportError(f"invalid date: {value!r}")
+            dt = datetime.combine(day, time.max if end else time.min)
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+def export_queryset(kind, portfolio=None, broker=None, asset_type=None, since=None, until=None, users=None):
+    """
+    (columns, values_list queryset) for one export, filters applied.
+    `users` limits it to the portfolios of those portfolio.User rows
+    (None: everything).
+    """
+    try:
+        model, date_field, spec = EXPORTS[kind]
+    except KeyError:
+        raise ExportError(f"unknown export: {kind!r}")
+
+    qs = model.objects.all()
+    if users is not None:
+        qs = qs.filter(broker_account__portfolio__user__in=users)
+    if portfolio:
+        try:
+            portfolio = int(portfolio)
+        except (TypeError, ValueError):
+            raise ExportError(f"invalid portfolio id: {portfolio!r}")
+        qs = qs.filter(broker_account__portfolio_id=portfolio)
+    if broker:
+        qs = qs.filter(broker_account__broker_type__code=broker)
+    if asset_type:
+        qs = qs.filter(stock__asset_type=asset_type)
+    since, until = _parse_bound(since), _parse_bound(until, end=True)
+    if since:
+        qs = qs.filter(**{f"{date_field}__gte": since})
+    if until:
+        qs = qs.filter(**{f"{date_field}__lte": until})
+
+    columns = [name for name, _ in spec]
+    qs = qs.order_by(date_field, "id").values_list(*(lookup for _, lookup in spec))
+    # Resolve the database now: streaming consumes the queryset after the
+    # caller's replica_reads() block has already exited.
+    return columns, qs.using(qs.db)
+
+
+def _chunks(qs, chunk_size):
+    chunk = []
+    for row in qs.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Buffer:
+    """File-like sink for csv.writer that just hands the line back."""
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def render_csv(columns, qs, chunk_size=DEFAULT_CHUNK_SIZE):
+    writer = csv.writer(_Buffer())
+    yield writer.writerow(columns)
+    for chunk in _chunks(qs, chunk_size):
+        yield "".join(writer.writerow([_cell(v) for v in row]) for row in chunk)
+
+
+def render_ndjson(columns, qs, chunk_size=DEFAULT_CHUNK_SIZE):
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+    for chunk in _chunks(qs, chunk_size):
+        yield "".join(
+            dumps({c: _cell(v) for c, v in zip(columns, row)}) + "\n" for row in chunk
+        )
+
+
+def render(fmt, columns, qs, chunk_size=DEFAULT_CHUNK_SIZE):
+    if fmt == "csv":
+        return render_csv(columns, qs, chunk_size)
+    if fmt == "ndjson":
+        return render_ndjson(columns, qs, chunk_size)
+    raise ExportError(f"unknown format: {fmt!r} (expected one of {', '.join(FORMATS)})")
+
+
+def encode(chunks):
+    for chunk in chunks:
+        yield chunk.encode()
+
+
+def gzip_stream(chunks):
+    """Gzip a stream of bytes chunks incrementally (wbits=31 -> gzip container)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,225 @@
+# portfolio/fx.py
+"""
+FX rates for multi-currency valuation.
+
+Rates are stored per (currency, day) in FxRate, relative to the pivot
+currency FX_PIVOT_CURRENCY: 1 unit of currency = rate units of pivot.
+Converting between any two currencies goes through the pivot.
+
+Valuation never queries FxRate per row: each process keeps the whole rate
+table in memory (RateTable, a few thousand rows at most) as sorted
+per-currency arrays, so a lookup by (currency, date) is a bisect. The table
+is reloaded when refresh_fx_rates bumps the fx version, checked at most
+every FX_TABLE_CHECK_SECONDS.
+
+Sources are pluggable like broker triggers: register a class with
+@register_source("name") whose fetch(currencies, pivot) returns
+(rate_date, {currency: Decimal}). "static" reads FX_STATIC_RATES from
+settings and serves as the local / offline stand-in.
+"""
+import bisect
+import logging
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from portfolio.http import get_http_session
+from portfolio.models import FxRate, Holding
+from portfolio.records import to_decimal
+from portfolio.versions import bump_fx_version_on_commit, fx_version
+
+logger = logging.getLogger(__name__)
+
+ONE = Decimal("1")
+
+SOURCES = {}
+
+
+class MissingRate(LookupError):
+    pass
+
+
+def register_source(name):
+    def _inner(cls):
+        SOURCES[name] = cls
+        return cls
+    return _inner
+
+
+def pivot_currency():
+    return getattr(settings, "FX_PIVOT_CURRENCY", "INR")
+
+
+def normalize_currency(code):
+    """Upper-case ISO code, with stablecoins etc. mapped via FX_CURRENCY_ALIASES."""
+    code = (code or pivot_currency()).upper()
+    return getattr(settings, "FX_CURRENCY_ALIASES", {}).get(code, code)
+
+
+# ---------------------------------------------------------
+# Sources
+# ---------------------------------------------------------
+@register_source("static")
+class StaticRateSource:
+    """Fixed rates from settings.FX_STATIC_RATES ({currency: rate in pivot})."""
+
+    def fetch(self, currencies, pivot):
+        rates = getattr(settings, "FX_STATIC_RATES", {})
+        return timezone.localdate(), {
+            c: to_decimal(rates[c]) for c in currencies if c in rates
+        }
+
+
+@register_source("frankfurter")
+class FrankfurterRateSource:
+    """ECB reference rates from the frankfurter.app API (no key needed)."""
+
+    URL = "https://api.frankfurter.app/latest"
+
+    def fetch(self, currencies, pivot):
+        if not currencies:
+            return timezone.localdate(), {}
+        resp = get_http_session().get(
+            self.URL, params={"from": pivot, "to": ",".join(sorted(currencies))}, timeout=10
+        )
+        resp.raise_for_status()
+        body = resp.json()
+        # Response is pivot -> currency; we store currency -> pivot.
+        rates = {
+            c: ONE / to_decimal(r)
+            for c, r in body.get("rates", {}).items()
+            if to_decimal(r)
+        }
+        return date.fromisoformat(body["date"]), rates
+
+
+# ---------------------------------------------------------
+# Refresh
+# ---------------------------------------------------------
+def currencies_in_use():
+    """Currencies held anywhere, plus FX_CURRENCIES, minus the pivot."""
+    codes = set(getattr(settings, "FX_CURRENCIES", []))
+    codes.update(Holding.objects.values_list("currency", flat=True).distinct())
+    pivot = pivot_currency()
+    return {normalize_currency(c) for c in codes if c} - {pivot}
+
+
+def refresh_fx_rates(source=None, currencies=None):
+    """Fetch today's rates from a source and upsert them. Returns the number stored."""
+    name = source or getattr(settings, "FX_RATE_SOURCE", "static")
+    try:
+        source_cls = SOURCES[name]
+    except KeyError:
+        raise ValueError(f"Unknown FX source '{name}'. Known: {', '.join(sorted(SOURCES))}")
+
+    wanted = {normalize_currency(c) for c in currencies} if currencies else currencies_in_use()
+    rate_date, rates = source_cls().fetch(wanted, pivot_currency())
+    missing = wanted - set(rates)
+    if missing:
+        logger.warning("FX source %s has no rate for %s", name, ", ".join(sorted(missing)))
+    if not rates:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        FxRate.objects.bulk_create(
+            [
+                FxRate(currency=c, rate_date=rate_date, rate=r, source=name, fetched_at=now)
+                for c, r in rates.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["currency", "rate_date"],
+            update_fields=["rate", "source", "fetched_at"],
+        )
+        bump_fx_version_on_commit()
+        transaction.on_commit(invalidate_rate_table)
+    return len(rates)
+
+
+# ---------------------------------------------------------
+# In-process rate table
+# ---------------------------------------------------------
+class RateTable:
+    def __init__(self, rows, pivot):
+        """rows: iterable of (currency, rate_date, rate) ordered by currency, rate_date."""
+        self.pivot = pivot
+        self._days = {}
+        self._rates = {}
+        for currency, rate_date, rate in rows:
+            self._days.setdefault(currency, []).append(rate_date.toordinal())
+            self._rates.setdefault(currency, []).append(rate)
+
+    @classmethod
+    def load(cls):
+        rows = FxRate.objects.order_by("currency", "rate_date").values_list("currency", "rate_date", "rate")
+        return cls(rows.iterator(), pivot_currency())
+
+    def to_pivot(self, currency, on=None):
+        """Rate of `currency` in pivot units on day `on` (latest on or before it)."""
+        currency = normalize_currency(currency)
+        if currency == self.pivot:
+            return ONE
+        days = self._days.get(currency)
+        if not days:
+            raise MissingRate(currency)
+        if on is None:
+            return self._rates[currency][-1]
+        i = bisect.bisect_right(days, on.toordinal())
+        if i == 0:
+            raise MissingRate(f"{currency} on {on}")
+        return self._rates[currency][i - 1]
+
+    def rate(self, from_currency, to_currency, on=None):
+        """Multiply an amount in `from_currency` by this to get `to_currency`."""
+        if normalize_currency(from_currency) == normalize_currency(to_currency):
+            return ONE
+        return self.to_pivot(from_currency, on) / self.to_pivot(to_currency, on)
+
+    def rates(self, keys, to_currency):
+        """
+        Vectorized lookup: {(currency, day): rate to `to_currency`} for every
+        distinct key, so callers convert N rows with one lookup per distinct
+        (currency, day) instead of per row. Keys without a rate are omitted.
+        """
+        out = {}
+        for key in set(keys):
+            try:
+                out[key] = self.rate(key[0], to_currency, key[1])
+            except MissingRate:
+                pass
+        return out
+
+
+_table = None
+_table_version = None
+_table_checked = 0.0
+_table_lock = threading.Lock()
+
+
+def invalidate_rate_table():
+    global _table_checked
+    _table_checked = 0.0
+
+
+def get_rate_table():
+    """This process's RateTable, reloaded when the fx version moves."""
+    global _table, _table_version, _table_checked
+    now = time.monotonic()
+    if _table is not None and now - _table_checked < getattr(settings, "FX_TABLE_CHECK_SECONDS", 30):
+        return _table
+    with _table_lock:
+        try:
+            version = fx_version()
+        except Exception:
+            logger.warning("Cannot read fx version; reloading FX rates", exc_info=True)
+            version = None
+        if _table is None or version is None or version != _table_version:
+            _table = RateTable.load()
+            _table_version = version
+        _table_checked = now
+        return _table
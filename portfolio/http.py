@@ -0,0 +1,31 @@
+# portfolio/http.py
+import os
+
+import requests
+from django.conf import settings
+
+_sessions = {}
+
+
+def get_http_session():
+    """
+    Shared requests.Session for the current process, so broker and rate
+    APIs reuse pooled keep-alive connections instead of a new TCP + TLS
+    handshake per call.
+
+    Sessions are cached per pid like portfolio.redis_client.get_redis, so
+    a prefork child never reuses sockets it inherited from the parent.
+    """
+    pid = os.getpid()
+    session = _sessions.get(pid)
+    if session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=getattr(settings, "HTTP_POOL_CONNECTIONS", 10),
+            pool_maxsize=getattr(settings, "HTTP_POOL_MAXSIZE", 32),
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _sessions.clear()
+        _sessions[pid] = session
+    return session
@@ -0,0 +1,252 @@
+# portfolio/instruments.py
+"""
+Read-only index over Kite's instruments dump.
+
+The daily CSV (~100k rows) is compiled once into a flat binary file of
+fixed-width records. Workers mmap that file, so every prefork child
+shares the same page-cache pages instead of holding its own copy, and
+lookups are binary searches (O(log n)) over:
+
+  - records, sorted by instrument_token
+  - a uint32 permutation sorted by (exchange, tradingsymbol)
+  - a uint32 permutation sorted by isin (rows that have one)
+
+File layout (little endian):
+  header  <8sIId   magic, record count, isin count, built_at (epoch)
+  records <Q8s32s12s8s12s * count
+  by_symbol <I * count
+  by_isin   <I * isin_count
+"""
+import csv
+import io
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from django.conf import settings
+
+from portfolio.http import get_http_session
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"KINSTv1\0"
+HEADER = struct.Struct("<8sIId")
+RECORD = struct.Struct("<Q8s32s12s8s12s")
+INDEX_ENTRY = struct.Struct("<I")
+
+# byte ranges inside a record used as sort keys
+_SYMBOL_KEY = slice(8, 48)     # exchange + tradingsymbol
+_ISIN_KEY = slice(48, 60)
+
+Instrument = namedtuple("Instrument", "token exchange tradingsymbol isin instrument_type segment")
+
+
+def asset_type_for(instrument):
+    """Map a Kite instrument to our Stock.asset_type vocabulary."""
+    if instrument.segment == "INDICES":
+        return "index"
+    kind = instrument.instrument_type
+    if kind == "EQ":
+        return "equity"
+    if kind == "FUT":
+        return "future"
+    if kind in ("CE", "PE"):
+        return "option"
+    return kind.lower() or "equity"
+
+
+def _pad(value, size):
+    return (value or "").encode("ascii", "ignore")[:size]
+
+
+def _symbol_key(exchange, tradingsymbol):
+    return _pad(exchange, 8).ljust(8, b"\0") + _pad(tradingsymbol, 32).ljust(32, b"\0")
+
+
+# -------------------------------------------------------------
+# Building
+# -------------------------------------------------------------
+def build_index(rows, path, known_isins=None):
+    """
+    Compile instrument rows (dicts with the Kite CSV columns; an `isin`
+    column is used when present) into the index file at `path`.
+
+    `known_isins` maps tradingsymbol -> ISIN for NSE/BSE equities, since
+    the Kite dump itself carries no ISINs. Written atomically.
+    """
+    known_isins = known_isins or {}
+    entries = []
+    for row in rows:
+        try:
+            token = int(row["instrument_token"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        exchange = row.get("exchange") or ""
+        symbol = row.get("tradingsymbol") or ""
+        kind = row.get("instrument_type") or ""
+        isin = row.get("isin") or ""
+        if not isin and kind == "EQ" and exchange in ("NSE", "BSE"):
+            isin = known_isins.get(symbol, "")
+        entries.append((
+            token, _pad(exchange, 8), _pad(symbol, 32), _pad(isin, 12),
+            _pad(kind, 8), _pad(row.get("segment"), 12),
+        ))
+
+    entries.sort(key=lambda e: e[0])
+    packed = [RECORD.pack(*e) for e in entries]
+    by_symbol = sorted(range(len(packed)), key=lambda i: packed[i][_SYMBOL_KEY])
+    by_isin = sorted(
+        (i for i in range(len(packed)) if entries[i][3]),
+        key=lambda i: packed[i][_ISIN_KEY],
+    )
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + f".{os.getpid()}.tmp")
+    with open(tmp, "wb") as fh:
+        fh.write(HEADER.pack(MAGIC, len(packed), len(by_isin), time.time()))
+        fh.writelines(packed)
+        fh.write(struct.pack(f"<{len(by_symbol)}I", *by_symbol))
+        fh.write(struct.pack(f"<{len(by_isin)}I", *by_isin))
+    os.replace(tmp, path)   # readers keep their old mapping until they reopen
+    return len(packed)
+
+
+def refresh_instrument_index(source=None, path=None):
+    """Download (or read) the instruments dump and rebuild the index file."""
+    from portfolio.models import Stock
+
+    source = source or getattr(settings, "KITE_INSTRUMENTS_SOURCE", "https://api.kite.trade/instruments")
+    path = path or settings.KITE_INSTRUMENTS_INDEX
+
+    if source.startswith(("http://", "https://")):
+        resp = get_http_session().get(source, timeout=60)
+        resp.raise_for_status()
+        text = resp.text
+    else:
+        text = Path(source).read_text()
+
+    known_isins = dict(
+        Stock.objects.filter(asset_type="equity", isin__isnull=False)
+        .values_list("symbol", "isin")
+    )
+    count = build_index(csv.DictReader(io.StringIO(text)), path, known_isins=known_isins)
+    logger.info("Built instrument index %s with %d instruments", path, count)
+    return count
+
+
+# -------------------------------------------------------------
+# Reading
+# -------------------------------------------------------------
+class InstrumentIndex:
+    def __init__(self, path):
+        self.path = str(path)
+        self.mtime = os.path.getmtime(self.path)
+        with open(self.path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.isin_count, self.built_at = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not an instrument index")
+        self._records_at = HEADER.size
+        self._by_symbol_at = self._records_at + self.count * RECORD.size
+        self._by_isin_at = self._by_symbol_at + self.count * INDEX_ENTRY.size
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._mm.close()
+
+    # --- raw access ---
+    def _record_bytes(self, i):
+        start = self._records_at + i * RECORD.size
+        return self._mm[start:start + RECORD.size]
+
+    def _perm(self, base, j):
+        return INDEX_ENTRY.unpack_from(self._mm, base + j * INDEX_ENTRY.size)[0]
+
+    def _token_at(self, i):
+        return struct.unpack_from("<Q", self._mm, self._records_at + i * RECORD.size)[0]
+
+    def _instrument(self, i):
+        token, *fields = RECORD.unpack_from(self._mm, self._records_at + i * RECORD.size)
+        return Instrument(token, *(f.rstrip(b"\0").decode("ascii") for f in fields))
+
+    def _lower_bound(self, n, key_at, key):
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # --- lookups ---
+    def by_token(self, token):
+        token = int(token)
+        i = self._lower_bound(self.count, self._token_at, token)
+        if i < self.count and self._token_at(i) == token:
+            return self._instrument(i)
+        return None
+
+    def by_symbol(self, exchange, tradingsymbol):
+        key = _symbol_key(exchange, tradingsymbol)
+        key_at = lambda j: self._record_bytes(self._perm(self._by_symbol_at, j))[_SYMBOL_KEY]
+        j = self._lower_bound(self.count, key_at, key)
+        if j < self.count and key_at(j) == key:
+            return self._instrument(self._perm(self._by_symbol_at, j))
+        return None
+
+    def by_isin(self, isin):
+        """All instruments (e.g. the NSE and BSE listing) for an ISIN."""
+        key = _pad(isin, 12).ljust(12, b"\0")
+        key_at = lambda j: self._record_bytes(self._perm(self._by_isin_at, j))[_ISIN_KEY]
+        j = self._lower_bound(self.isin_count, key_at, key)
+        out = []
+        while j < self.isin_count and key_at(j) == key:
+            out.append(self._instrument(self._perm(self._by_isin_at, j)))
+            j += 1
+        return out
+
+    def equity(self, tradingsymbol, exchanges=("NSE", "BSE")):
+        """First listing of a cash-market symbol, preferring NSE."""
+        for exchange in exchanges:
+            inst = self.by_symbol(exchange, tradingsymbol)
+            if inst is not None:
+                return inst
+        return None
+
+
+_index = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_instrument_index():
+    """
+    Process-wide index, reopened when the file on disk was rebuilt.
+    Returns None if no index has been built yet (callers fall back).
+    """
+    global _index, _index_checked_at
+    now = time.monotonic()
+    if _index is not None and now - _index_checked_at < 60:
+        return _index
+
+    with _index_lock:
+        _index_checked_at = now
+        path = getattr(settings, "KITE_INSTRUMENTS_INDEX", None)
+        if not path or not os.path.exists(path):
+            return _index
+        mtime = os.path.getmtime(path)
+        if _index is None or _index.mtime != mtime:
+            try:
+                _index = InstrumentIndex(path)
+            except (OSError, ValueError):
+                logger.exception("Could not open instrument index %s", path)
+    return _index
@@ -0,0 +1,94 @@
+# portfolio/locks.py
+"""
+Redis lease locks that keep a single sync in flight per
+(broker_account, action).
+
+A lease is taken when the sync is enqueued and released by the
+broker task when it finishes. If the worker dies the lease simply
+expires after SYNC_LOCK_TTL_SECONDS.
+"""
+import logging
+import uuid
+from collections import Counter
+
+from django.conf import settings
+
+from portfolio.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Only delete / extend the key if we still own it.
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_EXTEND_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+COALESCED_STATS_KEY = "sync:stats:coalesced"
+
+
+def _lock_key(broker_account_id, action):
+    return f"sync:lock:{broker_account_id}:{action}"
+
+
+def _ttl():
+    return getattr(settings, "SYNC_LOCK_TTL_SECONDS", 600)
+
+
+def acquire_sync_lease(broker_account_id, action):
+    """Return a lease token, or None if a sync is already in flight."""
+    token = uuid.uuid4().hex
+    acquired = get_redis().set(_lock_key(broker_account_id, action), token, nx=True, ex=_ttl())
+    return token if acquired else None
+
+
+def acquire_sync_leases(requests):
+    """
+    Pipelined acquire_sync_lease for many accounts at once.
+
+    `requests` is an iterable of (broker_account_id, action, extra_seconds);
+    extra_seconds is added to the TTL (e.g. the countdown of a task that is
+    enqueued now but runs later). Returns a list of tokens / None in order.
+    """
+    requests = list(requests)
+    tokens = [uuid.uuid4().hex for _ in requests]
+    pipe = get_redis().pipeline(transaction=False)
+    for (broker_account_id, action, extra), token in zip(requests, tokens):
+        pipe.set(_lock_key(broker_account_id, action), token, nx=True, ex=_ttl() + int(extra or 0))
+    acquired = pipe.execute()
+    return [token if ok else None for token, ok in zip(tokens, acquired)]
+
+
+def extend_sync_lease(broker_account_id, action, token):
+    """Push the lease expiry out again (e.g. before a retry). Returns True if still owned."""
+    r = get_redis()
+    return bool(r.eval(_EXTEND_SCRIPT, 1, _lock_key(broker_account_id, action), token, _ttl()))
+
+
+def release_sync_lease(broker_account_id, action, token):
+    r = get_redis()
+    return bool(r.eval(_RELEASE_SCRIPT, 1, _lock_key(broker_account_id, action), token))
+
+
+def record_coalesced(broker_account_id, action, count=1):
+    """Count sync requests that were folded into an in-flight run."""
+    get_redis().hincrby(COALESCED_STATS_KEY, f"{broker_account_id}:{action}", count)
+
+
+def record_coalesced_many(requests):
+    """Pipelined record_coalesced for an iterable of (broker_account_id, action)."""
+    counts = Counter(requests)
+    if not counts:
+        return
+    pipe = get_redis().pipeline(transaction=False)
+    for (broker_account_id, action), count in counts.items():
+        pipe.hincrby(COALESCED_STATS_KEY, f"{broker_account_id}:{action}", count)
+    pipe.execute()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from portfolio.analytics import analytics_stats, reset_analytics_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit / miss / wait counts of the analytics cache per computation."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Clear the counters after printing.")
+
+    def handle(self, *args, **options):
+        stats = analytics_stats()
+        if not stats:
+            self.stdout.write("No analytics cache activity recorded.")
+        for name, counts in sorted(stats.items()):
+            rate = "-" if counts["hit_rate"] is None else f"{counts['hit_rate']:.1%}"
+            self.stdout.write(
+                f"{name:<12} hit={counts['hit']} wait={counts['wait']} miss={counts['miss']} hit_rate={rate}"
+            )
+        if options["reset"]:
+            reset_analytics_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
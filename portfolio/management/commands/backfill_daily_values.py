@@ -0,0 +1,37 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from portfolio.performance import backfill_daily_values, record_daily_closes
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily portfolio value series over a date range, in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", required=True, help="First day (YYYY-MM-DD).")
+        parser.add_argument("--until", help="Last day (default: today).")
+        parser.add_argument("--portfolio", type=int, action="append", dest="portfolios",
+                            help="Only this portfolio id (repeatable).")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (default: CPU count).")
+        parser.add_argument("--chunk-size", type=int, default=20, help="Portfolios per job.")
+        parser.add_argument("--currency", help="Valuation currency (default: VALUATION_CURRENCY).")
+
+    def handle(self, *args, **options):
+        since = parse_date(options["since"])
+        until = parse_date(options["until"]) if options["until"] else timezone.localdate()
+        if since is None or until is None or since > until:
+            raise CommandError("--since / --until must be dates with since <= until")
+
+        record_daily_closes()
+        written = backfill_daily_values(
+            since, until,
+            portfolio_ids=options["portfolios"],
+            workers=options["workers"],
+            chunk_size=max(1, options["chunk_size"]),
+            currency=options["currency"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Stored {written} daily value(s) for {since}..{until}"))
@@ -0,0 +1,109 @@
+import random
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from portfolio.records import HoldingBatch, HoldingRecord
+
+
+def _raw_items(n):
+    """Synthetic Kite-like holdings items (JSON numbers arrive as float/int)."""
+    rnd = random.Random(42)
+    return [
+        {
+            "tradingsymbol": f"SYM{i}",
+            "isin": f"INE{i:09d}",
+            "product": "CNC",
+            "instrument_token": 100000 + i,
+            "quantity": rnd.randint(1, 500),
+            "average_price": round(rnd.uniform(10, 5000), 2),
+            "last_price": round(rnd.uniform(10, 5000), 2),
+            "close_price": round(rnd.uniform(10, 5000), 2),
+        }
+        for i in range(n)
+    ]
+
+
+def _dict_path(items, now):
+    """Previous pipeline: float() in the trigger, Decimal(str()) in services."""
+    out = []
+    for item in items:
+        row = {
+            "symbol": item.get("tradingsymbol"),
+            "isin": item.get("isin"),
+            "asset_type": item.get("product") or "equity",
+            "last_price": float(item.get("last_price", 0) or 0),
+            "close_price": item.get("close_price"),
+            "price_as_of": now,
+            "quantity": float(item.get("quantity", 0) or 0),
+            "avg_price": float(item.get("average_price", 0) or 0),
+            "currency": "INR",
+            "as_of": now,
+            "source_snapshot_id": item.get("instrument_token"),
+            "meta": item,
+        }
+        row["last_price"] = Decimal(str(row["last_price"]))
+        row["close_price"] = Decimal(str(row["close_price"])) if row["close_price"] is not None else None
+        row["quantity"] = Decimal(str(row["quantity"] or 0))
+        row["avg_price"] = Decimal(str(row["avg_price"] or 0))
+        out.append(row)
+    return out
+
+
+def _record_path(items, now):
+    return [
+        HoldingRecord(
+            item.get("tradingsymbol"), item.get("quantity"), item.get("average_price"),
+            isin=item.get("isin"), asset_type=item.get("product"),
+            last_price=item.get("last_price"), close_price=item.get("close_price"),
+            price_as_of=now, as_of=now, source_snapshot_id=item.get("instrument_token"), meta=item,
+        )
+        for item in items
+    ]
+
+
+def _batch_path(items, now):
+    batch = HoldingBatch()
+    for item in items:
+        batch.append(
+            item.get("tradingsymbol"), item.get("quantity"), item.get("average_price"),
+            isin=item.get("isin"), asset_type=item.get("product"),
+            last_price=item.get("last_price"), close_price=item.get("close_price"),
+            price_as_of=now, as_of=now, source_snapshot_id=item.get("instrument_token"), meta=item,
+        )
+    return batch
+
+
+class Command(BaseCommand):
+    help = "Benchmark HoldingRecord / HoldingBatch against the legacy per-holding dict path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--holdings", type=int, default=5000, help="Holdings per run.")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per path (best is reported).")
+
+    def handle(self, *args, **options):
+        items = _raw_items(options["holdings"])
+        now = datetime.now(timezone.utc)
+        paths = [("dict", _dict_path), ("record", _record_path), ("batch", _batch_path)]
+
+        self.stdout.write(f"{options['holdings']} holdings, best of {options['repeat']}")
+        self.stdout.write(f"{'path':<8} {'time ms':>10} {'peak KiB':>10}")
+        for name, fn in paths:
+            best = min(self._timed(fn, items, now) for _ in range(options["repeat"]))
+
+            tracemalloc.start()
+            result = fn(items, now)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del result
+
+            self.stdout.write(f"{name:<8} {best * 1000:>10.2f} {peak / 1024:>10.1f}")
+
+    @staticmethod
+    def _timed(fn, items, now):
+        start = time.perf_counter()
+        fn(items, now)
+        return time.perf_counter() - start
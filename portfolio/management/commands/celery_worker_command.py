@@ -0,0 +1,39 @@
+from fnmatch import fnmatch
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from portfolio.routing import worker_command
+
+
+class Command(BaseCommand):
+    help = "Print the celery worker command line for a profile in CELERY_WORKER_PROFILES."
+
+    def add_arguments(self, parser):
+        parser.add_argument("profile", help="Profile name or glob, e.g. 'sync' or 'broker-*'.")
+        parser.add_argument(
+            "--queues",
+            action="store_true",
+            help="Only print the comma separated queues of all matching profiles.",
+        )
+
+    def handle(self, *args, **options):
+        pattern = options["profile"]
+
+        if options["queues"]:
+            profiles = getattr(settings, "CELERY_WORKER_PROFILES", {})
+            queues = []
+            for name, profile in profiles.items():
+                if fnmatch(name, pattern):
+                    queues.extend(q for q in profile["queues"] if q not in queues)
+            if not queues:
+                raise CommandError(f"No worker profile matches '{pattern}'.")
+            self.stdout.write(",".join(queues))
+            return
+
+        try:
+            argv = worker_command(pattern)
+        except KeyError as e:
+            raise CommandError(e.args[0])
+        # Plain join so start scripts can use it unquoted: $(python manage.py celery_worker_command sync)
+        self.stdout.write(" ".join(argv))
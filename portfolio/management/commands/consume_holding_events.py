@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from portfolio import events
+
+
+class Command(BaseCommand):
+    help = "Read holdings change events through a consumer group and print them as NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--group", help="Consumer group (created if missing).")
+        parser.add_argument("--consumer", default="cli", help="Consumer name within the group.")
+        parser.add_argument("--from-start", action="store_true",
+                            help="New group starts at the oldest retained event instead of now.")
+        parser.add_argument("--count", type=int, default=100, help="Events per read.")
+        parser.add_argument("--follow", action="store_true", help="Keep reading, blocking for new events.")
+        parser.add_argument("--block", type=int, default=5000, help="Block timeout in ms with --follow.")
+        parser.add_argument("--pending", action="store_true",
+                            help="Re-read this consumer's unacknowledged events first.")
+        parser.add_argument("--no-ack", action="store_true", help="Leave events pending.")
+        parser.add_argument("--info", action="store_true", help="Show stream length and group lag, then exit.")
+
+    def handle(self, *args, **options):
+        if options["info"] or not options["group"]:
+            self.stdout.write(json.dumps(events.stream_info(), indent=2))
+            return
+
+        group, consumer = options["group"], options["consumer"]
+        if events.ensure_group(group, from_start=options["from_start"]):
+            self.stderr.write(f"Created consumer group {group}")
+
+        pending = options["pending"]
+        while True:
+            batch = events.read_events(
+                group, consumer,
+                count=options["count"],
+                block=options["block"] if options["follow"] and not pending else None,
+                pending=pending,
+            )
+            for event_id, fields in batch:
+                self.stdout.write(json.dumps({"id": event_id, **fields}))
+            if batch and not options["no_ack"]:
+                events.ack_events(group, [event_id for event_id, _ in batch])
+            if pending and (len(batch) < options["count"] or options["no_ack"]):
+                pending = False      # backlog drained, continue with new events
+                continue
+            if not options["follow"] and len(batch) < options["count"]:
+                break
@@ -0,0 +1,50 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from portfolio import exports
+from portfolio.db_router import replica_reads
+
+
+class Command(BaseCommand):
+    help = "Stream holdings or transactions out as CSV / NDJSON with constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(exports.EXPORTS))
+        parser.add_argument("--format", choices=exports.FORMATS, default="csv")
+        parser.add_argument("--portfolio", type=int, help="Only this portfolio id.")
+        parser.add_argument("--broker", help="Only this broker code, e.g. zerodha.")
+        parser.add_argument("--asset-type", help="Only this asset type, e.g. equity.")
+        parser.add_argument("--since", help="From this date / ISO datetime (inclusive).")
+        parser.add_argument("--until", help="Up to this date / ISO datetime (inclusive).")
+        parser.add_argument("--gzip", action="store_true", help="Gzip the output on the fly.")
+        parser.add_argument("--chunk-size", type=int, default=exports.DEFAULT_CHUNK_SIZE)
+        parser.add_argument("-o", "--output", help="File to write (default: stdout).")
+
+    def handle(self, *args, **options):
+        try:
+            with replica_reads():
+                columns, qs = exports.export_queryset(
+                    options["kind"],
+                    portfolio=options["portfolio"],
+                    broker=options["broker"],
+                    asset_type=options["asset_type"],
+                    since=options["since"],
+                    until=options["until"],
+                )
+        except exports.ExportError as exc:
+            raise CommandError(str(exc))
+
+        stream = exports.encode(exports.render(options["format"], columns, qs, options["chunk_size"]))
+        if options["gzip"]:
+            stream = exports.gzip_stream(stream)
+
+        out = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for chunk in stream:
+                out.write(chunk)
+        finally:
+            if options["output"]:
+                out.close()
+            else:
+                out.flush()
@@ -11,6 +11,7 @@ from kiteconnect import KiteConnect
 import redis
 
 from portfolio.models import BrokerAccount
+from portfolio.token_cache import publish_token_invalidation
 
 
 class Command(BaseCommand):
@@ -109,6 +110,9 @@ class Command(BaseCommand):
         # Save with TTL = 24 hours
         r.set(redis_key, json.dumps(store_data), ex=24 * 3600)
 
+        # Workers cache tokens in-process; tell them to re-read this one.
+        publish_token_invalidation(broker_id)
+
         # ----------------------------------------------------------------------
         # 6. Print success
         # ----------------------------------------------------------------------
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from portfolio.partitions import PARTITIONED_TABLES, list_partitions, maintain_partitions, supports_partitioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-create upcoming monthly partitions of history tables and detach / archive / "
+        "drop old ones (Postgres only)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, default=settings.PARTITION_MONTHS_AHEAD)
+        parser.add_argument("--retain-months", type=int, default=settings.PARTITION_RETENTION_MONTHS,
+                            help="Detach partitions older than this many months (0 = keep all). "
+                                 "Their trades stop counting towards XIRR and positions.")
+        parser.add_argument("--archive-schema", default=settings.PARTITION_ARCHIVE_SCHEMA or None,
+                            help="Move detached partitions into this schema.")
+        parser.add_argument("--drop", action="store_true", help="Drop detached partitions instead.")
+        parser.add_argument("--list", action="store_true", help="Only list existing partitions.")
+
+    def handle(self, *args, **options):
+        if not supports_partitioning(connection):
+            self.stdout.write(f"{connection.vendor}: tables are not partitioned, nothing to do.")
+            return
+
+        if options["list"]:
+            for table in PARTITIONED_TABLES:
+                months = sorted(list_partitions(connection, table))
+                span = f"{months[0]:%Y-%m} .. {months[-1]:%Y-%m}" if months else "none"
+                self.stdout.write(f"{table}: {len(months)} monthly partition(s), {span}")
+            return
+
+        report = maintain_partitions(
+            months_ahead=options["months_ahead"],
+            retain_months=options["retain_months"],
+            archive_schema=options["archive_schema"],
+            drop=options["drop"],
+        )
+        for table, changes in report.items():
+            self.stdout.write(self.style.SUCCESS(
+                f"{table}: created {len(changes['created'])}, retired {len(changes['retired'])}"
+            ))
+            for name in changes["created"] + changes["retired"]:
+                self.stdout.write(f"  {name}")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from portfolio.adjustments import rebuild_adjustment_index, rebuild_all
+
+
+class Command(BaseCommand):
+    help = "Rebuild the split/bonus adjustment-factor index from corporate actions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stock", type=int, action="append", dest="stocks",
+            help="Only this stock id (repeatable). Default: every stock with actions.",
+        )
+
+    def handle(self, *args, **options):
+        if options["stocks"]:
+            count = rebuild_adjustment_index(options["stocks"])
+        else:
+            count = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} adjustment interval(s)"))
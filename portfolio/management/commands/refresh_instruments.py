@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from portfolio.instruments import InstrumentIndex, refresh_instrument_index
+
+
+class Command(BaseCommand):
+    help = "Download the Kite instruments dump and rebuild the shared instrument index."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            help="URL or local CSV path (defaults to KITE_INSTRUMENTS_SOURCE).",
+        )
+        parser.add_argument(
+            "--path",
+            help="Index file to write (defaults to KITE_INSTRUMENTS_INDEX).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"] or settings.KITE_INSTRUMENTS_INDEX
+        count = refresh_instrument_index(source=options["source"], path=path)
+
+        index = InstrumentIndex(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} instruments ({index.isin_count} with ISIN) into {path}"
+        ))
+        index.close()
@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kiteconnect import KiteTicker
+
+from portfolio.models import BrokerAccount
+from portfolio.redis_client import get_redis
+from portfolio.streaming import PriceStreamer
+from portfolio.triggers.zerodha import ZerodhaTrigger
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream live prices for all held Zerodha instruments via KiteTicker and "
+        "flush them to stock_prices in bulk every N seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--broker-id",
+            type=int,
+            required=True,
+            help="Zerodha BrokerAccount whose access token is used for the ticker connection.",
+        )
+        parser.add_argument("--flush-interval", type=float, default=5.0,
+                            help="Seconds between bulk writes of the latest ticks.")
+        parser.add_argument("--resubscribe-interval", type=float, default=60.0,
+                            help="Seconds between re-reading held instruments.")
+        parser.add_argument("--ws-root", default=None,
+                            help="WebSocket URL override, e.g. ws://127.0.0.1:8765 for a local stand-in.")
+
+    def handle(self, *args, **options):
+        try:
+            account = BrokerAccount.objects.select_related("broker_type", "credential").get(id=options["broker_id"])
+        except BrokerAccount.DoesNotExist:
+            raise CommandError(f"BrokerAccount {options['broker_id']} not found.")
+
+        token_info = ZerodhaTrigger(account).get_access_token()
+        if not token_info.get("api_key"):
+            raise CommandError("api_key missing in Redis or DB.")
+
+        streamer = PriceStreamer(get_redis())
+        streamer.refresh_subscriptions()
+
+        ticker = KiteTicker(token_info["api_key"], token_info["access_token"], root=options["ws_root"])
+        streamer.attach(ticker)
+        ticker.on_close = lambda ws, code, reason: self.stdout.write(f"Ticker closed: {code} {reason}")
+        ticker.on_error = lambda ws, code, reason: self.stderr.write(f"Ticker error: {code} {reason}")
+        ticker.connect(threaded=True)
+
+        self.stdout.write(self.style.SUCCESS("Streaming prices. Ctrl+C to stop."))
+        next_flush = time.monotonic() + options["flush_interval"]
+        next_resubscribe = time.monotonic() + options["resubscribe_interval"]
+        try:
+            while True:
+                time.sleep(0.5)
+                now = time.monotonic()
+                if now >= next_flush:
+                    updated = streamer.flush()
+                    if updated:
+                        self.stdout.write(f"Flushed {updated} price(s)")
+                    next_flush = now + options["flush_interval"]
+                if now >= next_resubscribe:
+                    streamer.refresh_subscriptions()
+                    next_resubscribe = now + options["resubscribe_interval"]
+        except KeyboardInterrupt:
+            pass
+        finally:
+            ticker.close()
+            streamer.flush()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from portfolio.warmup import first_task_stats, reset_first_task_stats
+
+
+class Command(BaseCommand):
+    help = "Compare first-task latency of warmed-up and cold worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Clear the counters after printing.")
+
+    def handle(self, *args, **options):
+        for kind, stats in first_task_stats().items():
+            avg = "-" if stats["avg_ms"] is None else f"{stats['avg_ms']:.0f} ms"
+            self.stdout.write(f"{kind:<5} processes={stats['count']} avg_first_task={avg}")
+        if options["reset"]:
+            reset_first_task_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.10 on 2026-10-19 09:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0002_remove_stock_uniq_stock_price_snapshot_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RawSnapshot',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('codec', models.CharField(max_length=10)),
+                ('payload', models.BinaryField()),
+                ('raw_size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='portfolio_r_created_0da5db_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='holding',
+            name='raw_snapshot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='holdings', to='portfolio.rawsnapshot'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.10 on 2026-10-19 09:15
+
+from django.db import migrations
+
+# Kite `product` codes that ZerodhaTrigger used to store as Stock.asset_type.
+PRODUCT_CODES = ('CNC', 'MIS', 'NRML', 'MTF', 'CO', 'BO')
+
+
+def product_to_equity(apps, schema_editor):
+    Stock = apps.get_model('portfolio', 'Stock')
+    Holding = apps.get_model('portfolio', 'Holding')
+    Transaction = apps.get_model('portfolio', 'Transaction')
+
+    for stock in Stock.objects.filter(asset_type__in=PRODUCT_CODES):
+        twin = Stock.objects.filter(symbol=stock.symbol, isin=stock.isin, asset_type='equity').first()
+        if twin is None:
+            stock.asset_type = 'equity'
+            stock.save(update_fields=['asset_type'])
+            continue
+        # An 'equity' row already exists: move references over and drop the duplicate.
+        Holding.objects.filter(stock=stock).exclude(
+            broker_account__in=Holding.objects.filter(stock=twin).values('broker_account')
+        ).update(stock=twin)
+        for duplicate in Holding.objects.filter(stock=stock):
+            # The account holds both rows for the same broker position: keep
+            # the most recent one on the twin, like 0007 merge_duplicate_holdings.
+            target = (
+                Holding.objects.filter(stock=twin, broker_account_id=duplicate.broker_account_id)
+                .order_by('-as_of', '-id')
+                .first()
+            )
+            if (duplicate.as_of, duplicate.pk) > (target.as_of, target.pk):
+                target.delete()
+                duplicate.stock = twin
+                duplicate.save(update_fields=['stock'])
+            else:
+                duplicate.delete()
+        Transaction.objects.filter(stock=stock).update(stock=twin)
+        stock.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0003_rawsnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(product_to_equity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.10 on 2026-10-19 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0004_stock_asset_type_from_product'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='holding',
+            index=models.Index(fields=['broker_account', '-as_of', '-id'], name='holding_acct_asof_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['broker_account', '-trade_time', '-id'], name='txn_acct_time_id_idx'),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 4.2.10 on 2026-10-19 09:40
+
+from datetime import date
+
+from django.db import migrations
+
+# The conversion is written out here rather than imported from
+# portfolio.partitions: later changes to that module must not change what
+# this migration does.
+TABLE = "portfolio_transaction"
+COLUMN = "trade_time"
+MONTHS_AHEAD = 3
+
+
+def _month_start(d):
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d, months):
+    index = d.year * 12 + (d.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_history_tables(apps, schema_editor):
+    # Postgres only; elsewhere the table stays plain (see portfolio.partitions).
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+
+    q = connection.ops.quote_name
+    old, seq = f"{TABLE}_unpartitioned", f"{TABLE}_id_seq"
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [TABLE])
+        if cursor.fetchone() is not None:
+            return
+
+        # Captured before the rename, so they already name the new parent.
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+            [TABLE, f"{TABLE}_pkey"],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = to_regclass(%s) AND contype = 'f'
+            """,
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f"SELECT min({q(COLUMN)}), max({q(COLUMN)}), max(id) FROM {q(TABLE)}")
+        first, last, max_id = cursor.fetchone()
+
+        cursor.execute(f"ALTER TABLE {q(TABLE)} RENAME TO {q(old)}")
+        cursor.execute(f"ALTER INDEX {q(TABLE + '_pkey')} RENAME TO {q(old + '_pkey')}")
+        cursor.execute(
+            f"CREATE TABLE {q(TABLE)} (LIKE {q(old)} INCLUDING DEFAULTS) PARTITION BY RANGE ({q(COLUMN)})"
+        )
+        # The old identity sequence goes away with the old table.
+        cursor.execute(f"CREATE SEQUENCE {q(seq + '_p')} AS bigint OWNED BY {q(TABLE)}.id")
+        cursor.execute("SELECT setval(%s, %s)", [seq + "_p", max_id or 1])
+        cursor.execute(f"ALTER TABLE {q(TABLE)} ALTER COLUMN id SET DEFAULT nextval('{seq}_p'::regclass)")
+        cursor.execute(f"ALTER TABLE {q(TABLE)} ADD PRIMARY KEY (id, {q(COLUMN)})")
+        cursor.execute(f"CREATE TABLE {q(TABLE + '_default')} PARTITION OF {q(TABLE)} DEFAULT")
+
+        # One partition per month from the oldest row to MONTHS_AHEAD ahead.
+        # The default partition is still empty here, so nothing has to move.
+        today = date.today()
+        month = _month_start(first or today)
+        last_month = _add_months(_month_start(max(last.date() if last else today, today)), MONTHS_AHEAD)
+        while month <= last_month:
+            name, end = f"{TABLE}_p{month:%Y%m}", _add_months(month, 1)
+            cursor.execute(f"CREATE TABLE {q(name)} (LIKE {q(TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            cursor.execute(
+                f"ALTER TABLE {q(TABLE)} ATTACH PARTITION {q(name)} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+            )
+            month = end
+
+        cursor.execute(f"INSERT INTO {q(TABLE)} SELECT * FROM {q(old)}")
+        cursor.execute(f"DROP TABLE {q(old)}")
+        cursor.execute(f"ALTER SEQUENCE {q(seq + '_p')} RENAME TO {q(seq)}")
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {q(TABLE)} ADD CONSTRAINT {q(name)} {definition}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0005_read_api_keyset_indexes'),
+    ]
+
+    operations = [
+        # Not reversible in place; a partitioned table works with the ORM as-is.
+        migrations.RunPython(partition_history_tables, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 4.2.10 on 2026-10-19 09:27
+
+from django.db import migrations, models
+from django.db.models import Count, Value
+from django.db.models.functions import Coalesce
+import django.db.models.functions.comparison
+
+
+def merge_duplicate_stocks(apps, schema_editor):
+    """
+    Fold Stock rows that only differ by NULL vs '' isin (or were created
+    twice by racing workers) into one: the row with the newest price wins
+    and references move over to it.
+    """
+    Stock = apps.get_model('portfolio', 'Stock')
+    Holding = apps.get_model('portfolio', 'Holding')
+    Transaction = apps.get_model('portfolio', 'Transaction')
+
+    duplicates = (
+        Stock.objects.annotate(isin_key=Coalesce('isin', Value('')))
+        .values('symbol', 'isin_key', 'asset_type')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+    )
+    for dup in duplicates:
+        rows = list(
+            Stock.objects.annotate(isin_key=Coalesce('isin', Value('')))
+            .filter(symbol=dup['symbol'], isin_key=dup['isin_key'], asset_type=dup['asset_type'])
+            .order_by('-as_of', '-id')
+        )
+        keep, others = rows[0], rows[1:]
+        other_ids = [s.id for s in others]
+        Transaction.objects.filter(stock_id__in=other_ids).update(stock=keep)
+        # Holdings may now collide per account; merge_duplicate_holdings resolves that.
+        Holding.objects.filter(stock_id__in=other_ids).update(stock=keep)
+        Stock.objects.filter(id__in=other_ids).delete()
+
+
+def merge_duplicate_holdings(apps, schema_editor):
+    """Keep the most recent holding per (broker_account, stock)."""
+    Holding = apps.get_model('portfolio', 'Holding')
+
+    duplicates = (
+        Holding.objects.values('broker_account_id', 'stock_id')
+        .annotate(n=Count('id'))
+        .filter(n__gt=1)
+    )
+    for dup in duplicates:
+        ids = list(
+            Holding.objects.filter(broker_account_id=dup['broker_account_id'], stock_id=dup['stock_id'])
+            .order_by('-as_of', '-id')
+            .values_list('id', flat=True)
+        )
+        Holding.objects.filter(id__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0006_partition_transactions'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='stock',
+            name='uniq_stock_instrument',
+        ),
+        migrations.RemoveIndex(
+            model_name='holding',
+            name='portfolio_h_broker__2118af_idx',
+        ),
+        migrations.RunPython(merge_duplicate_stocks, migrations.RunPython.noop),
+        migrations.RunPython(merge_duplicate_holdings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='holding',
+            constraint=models.UniqueConstraint(fields=('broker_account', 'stock'), name='uniq_holding_account_stock'),
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.UniqueConstraint(models.F('symbol'), django.db.models.functions.comparison.Coalesce('isin', models.Value('')), models.F('asset_type'), name='uniq_stock_instrument'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.10 on 2026-10-19 09:28
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0007_unique_holding_and_stock_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=10)),
+                ('rate_date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=10, max_digits=24)),
+                ('source', models.CharField(max_length=30)),
+                ('fetched_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='fxrate',
+            constraint=models.UniqueConstraint(fields=('currency', 'rate_date'), name='uniq_fx_rate_per_day'),
+        ),
+    ]
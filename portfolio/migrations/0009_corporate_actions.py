@@ -0,0 +1,50 @@
+# Generated by Django 4.2.10 on 2026-10-19 09:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0008_fxrate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorporateAction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action_type', models.CharField(choices=[('split', 'Split'), ('bonus', 'Bonus'), ('consolidation', 'Consolidation')], max_length=20)),
+                ('ex_date', models.DateField()),
+                ('ratio_from', models.DecimalField(decimal_places=4, max_digits=12)),
+                ('ratio_to', models.DecimalField(decimal_places=4, max_digits=12)),
+                ('note', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='corporate_actions', to='portfolio.stock')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AdjustmentFactor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('valid_from', models.DateField()),
+                ('valid_to', models.DateField()),
+                ('factor', models.DecimalField(decimal_places=10, max_digits=24)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='adjustment_factors', to='portfolio.stock')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='corporateaction',
+            constraint=models.UniqueConstraint(fields=('stock', 'action_type', 'ex_date'), name='uniq_corporate_action'),
+        ),
+        migrations.AddIndex(
+            model_name='adjustmentfactor',
+            index=models.Index(fields=['stock', 'valid_from', 'valid_to'], name='adj_factor_lookup_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='adjustmentfactor',
+            constraint=models.UniqueConstraint(fields=('stock', 'valid_from'), name='uniq_adjustment_interval'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.10 on 2026-10-19 09:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0009_corporate_actions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockDailyPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_date', models.DateField()),
+                ('close', models.DecimalField(decimal_places=4, max_digits=12)),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_prices', to='portfolio.stock')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PortfolioDailyValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value_date', models.DateField()),
+                ('currency', models.CharField(max_length=10)),
+                ('market_value', models.DecimalField(decimal_places=4, max_digits=24)),
+                ('net_flow', models.DecimalField(decimal_places=4, default=0, max_digits=24)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_values', to='portfolio.portfolio')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stockdailyprice',
+            constraint=models.UniqueConstraint(fields=('stock', 'price_date'), name='uniq_stock_daily_price'),
+        ),
+        migrations.AddConstraint(
+            model_name='portfoliodailyvalue',
+            constraint=models.UniqueConstraint(fields=('portfolio', 'value_date'), name='uniq_portfolio_daily_value'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.10 on 2026-10-19 09:54
+
+from decimal import Decimal
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0010_daily_values'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='corporateaction',
+            name='ratio_from',
+            field=models.DecimalField(decimal_places=4, max_digits=12, validators=[django.core.validators.MinValueValidator(Decimal('0.0001'))]),
+        ),
+        migrations.AlterField(
+            model_name='corporateaction',
+            name='ratio_to',
+            field=models.DecimalField(decimal_places=4, max_digits=12, validators=[django.core.validators.MinValueValidator(Decimal('0.0001'))]),
+        ),
+        migrations.AddConstraint(
+            model_name='corporateaction',
+            constraint=models.CheckConstraint(check=models.Q(('ratio_from__gt', 0), ('ratio_to__gt', 0)), name='corporate_action_positive_ratios'),
+        ),
+    ]
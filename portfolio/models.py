@@ -1,4 +1,9 @@
+from decimal import Decimal
+
+from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 
@@ -91,10 +96,12 @@ class Stock(models.Model):
             models.Index(fields=['asset_type']),
             models.Index(fields=['as_of']),
         ]
-        # You can tune this uniqueness rule as you like
+        # One row per instrument. isin is nullable (crypto etc.), so it is
+        # compared through COALESCE: NULLs would otherwise never collide.
+        # persist_holdings upserts against exactly this index.
         constraints = [
             models.UniqueConstraint(
-                fields=['symbol', 'isin', 'asset_type'],
+                'symbol', Coalesce('isin', Value('')), 'asset_type',
                 name='uniq_stock_instrument',
             )
         ]
@@ -103,6 +110,128 @@ class Stock(models.Model):
         return f"{self.symbol} ({self.asset_type}) @ {self.as_of}"
 
 
+class CorporateAction(models.Model):
+    """
+    Split / bonus / consolidation of an instrument, effective on ex_date.
+    Ratios read as "ratio_from old shares -> ratio_to": a 1:5 split has
+    (1, 5), a 1:1 bonus (1 bonus per 1 held) has (1, 1), a 10:1
+    consolidation (10, 1). See portfolio.adjustments.quantity_factor.
+    """
+    SPLIT = 'split'
+    BONUS = 'bonus'
+    CONSOLIDATION = 'consolidation'
+    ACTION_TYPES = [(SPLIT, 'Split'), (BONUS, 'Bonus'), (CONSOLIDATION, 'Consolidation')]
+
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='corporate_actions')
+    action_type = models.CharField(max_length=20, choices=ACTION_TYPES)
+    ex_date = models.DateField()
+    # Strictly positive: a zero ratio would divide by zero in quantity_factor.
+    ratio_from = models.DecimalField(
+        max_digits=12, decimal_places=4, validators=[MinValueValidator(Decimal('0.0001'))],
+    )
+    ratio_to = models.DecimalField(
+        max_digits=12, decimal_places=4, validators=[MinValueValidator(Decimal('0.0001'))],
+    )
+    note = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stock', 'action_type', 'ex_date'], name='uniq_corporate_action'),
+            models.CheckConstraint(
+                check=Q(ratio_from__gt=0, ratio_to__gt=0), name='corporate_action_positive_ratios',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.stock.symbol} {self.action_type} {self.ratio_from}:{self.ratio_to} ex {self.ex_date}"
+
+
+class AdjustmentFactor(models.Model):
+    """
+    Precomputed cumulative adjustment index, rebuilt per stock from its
+    CorporateActions: a quantity dated in [valid_from, valid_to) multiplied
+    by `factor` (and a price divided by it) is expressed in today's share
+    terms. Dates after the latest action have no row (factor 1).
+    """
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='adjustment_factors')
+    valid_from = models.DateField()
+    valid_to = models.DateField()
+    factor = models.DecimalField(max_digits=24, decimal_places=10)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stock', 'valid_from', 'valid_to'], name='adj_factor_lookup_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['stock', 'valid_from'], name='uniq_adjustment_interval'),
+        ]
+
+    def __str__(self):
+        return f"{self.stock_id} [{self.valid_from}, {self.valid_to}) x{self.factor}"
+
+
+class StockDailyPrice(models.Model):
+    """
+    One closing price per stock and day, recorded nightly from the latest
+    Stock price (portfolio.performance.record_daily_closes). Prices are as
+    traded that day, i.e. not split-adjusted; see AdjustmentFactor.
+    """
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='daily_prices')
+    price_date = models.DateField()
+    close = models.DecimalField(max_digits=12, decimal_places=4)
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stock', 'price_date'], name='uniq_stock_daily_price'),
+        ]
+
+    def __str__(self):
+        return f"{self.stock_id} {self.close} @ {self.price_date}"
+
+
+class FxRate(models.Model):
+    """
+    Daily FX rate: 1 unit of `currency` = `rate` units of the pivot currency
+    (settings.FX_PIVOT_CURRENCY, INR). Cross rates go through the pivot.
+    """
+    currency = models.CharField(max_length=10)        # ISO code, e.g. USD
+    rate_date = models.DateField()
+    rate = models.DecimalField(max_digits=24, decimal_places=10)
+    source = models.CharField(max_length=30)
+    fetched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'rate_date'], name='uniq_fx_rate_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} {self.rate} @ {self.rate_date}"
+
+
+class RawSnapshot(models.Model):
+    """
+    Raw broker response, compressed and stored once per distinct content.
+    The primary key is the sha256 of the canonical JSON payload, so
+    identical responses across syncs share one row.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    codec = models.CharField(max_length=10)           # zlib, zstd
+    payload = models.BinaryField()
+    raw_size = models.PositiveIntegerField()          # uncompressed bytes
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.codec}, {self.raw_size} bytes)"
+
+
 class Holding(models.Model):
     broker_account = models.ForeignKey(
         BrokerAccount,
@@ -121,14 +250,27 @@ class Holding(models.Model):
 
     as_of = models.DateTimeField()
     source_snapshot_id = models.TextField(null=True, blank=True)
-    meta = models.JSONField(null=True, blank=True)
+    raw_snapshot = models.ForeignKey(
+        RawSnapshot,
+        on_delete=models.SET_NULL,
+        related_name='holdings',
+        null=True,
+        blank=True,
+    )
+    meta = models.JSONField(null=True, blank=True)    # small projection of the raw item
     created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         indexes = [
-            models.Index(fields=['broker_account']),
             models.Index(fields=['stock']),
             models.Index(fields=['as_of']),
+            # keyset pagination in the read API
+            models.Index(fields=['broker_account', '-as_of', '-id'], name='holding_acct_asof_id_idx'),
+        ]
+        constraints = [
+            # Identity of a holding; also the conflict target of persist_holdings' upsert.
+            # Its index covers lookups by broker_account alone.
+            models.UniqueConstraint(fields=['broker_account', 'stock'], name='uniq_holding_account_stock'),
         ]
 
     def __str__(self):
@@ -175,7 +317,32 @@ class Transaction(models.Model):
             models.Index(fields=['broker_account']),
             models.Index(fields=['stock']),
             models.Index(fields=['trade_time']),
+            # keyset pagination in the read API
+            models.Index(fields=['broker_account', '-trade_time', '-id'], name='txn_acct_time_id_idx'),
         ]
 
     def __str__(self):
         return f"{self.trade_type} {self.stock.symbol} {self.quantity}"
+
+
+class PortfolioDailyValue(models.Model):
+    """
+    End-of-day market value of a portfolio in `currency`, plus the net
+    external flow of the day (buys minus sells) for return calculations.
+    Filled incrementally by portfolio.performance; read as a range scan on
+    (portfolio, value_date).
+    """
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='daily_values')
+    value_date = models.DateField()
+    currency = models.CharField(max_length=10)
+    market_value = models.DecimalField(max_digits=24, decimal_places=4)
+    net_flow = models.DecimalField(max_digits=24, decimal_places=4, default=0)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['portfolio', 'value_date'], name='uniq_portfolio_daily_value'),
+        ]
+
+    def __str__(self):
+        return f"{self.portfolio_id} {self.market_value} {self.currency} @ {self.value_date}"
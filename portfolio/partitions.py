@@ -0,0 +1,179 @@
+# portfolio/partitions.py
+"""
+Monthly range partitioning for append-mostly history tables (Postgres only).
+
+A partitioned table keeps its Django model unchanged; the database splits
+it into one child table per calendar month of the partition column:
+
+    portfolio_transaction                 (partitioned by trade_time)
+      portfolio_transaction_p202601       [2026-01-01, 2026-02-01)
+      portfolio_transaction_p202602       ...
+      portfolio_transaction_default       anything outside created months
+
+Queries that filter on the partition column with literal bounds (exports,
+keyset pages, admin date drill-down) only touch the matching months.
+
+`manage_partitions` / manage_partitions_task pre-creates upcoming months and
+detaches (then archives or drops) months older than the retention window.
+On other databases every function here is a no-op and the tables stay
+plain, so SQLite development is unaffected.
+"""
+import logging
+from datetime import date
+
+from django.db import connection as default_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# table -> partition column. Tables are converted by migrations
+# (0006_partition_transactions), which carry their own DDL.
+PARTITIONED_TABLES = {
+    "portfolio_transaction": "trade_time",
+}
+
+
+def supports_partitioning(connection=None):
+    return (connection or default_connection).vendor == "postgresql"
+
+
+def month_start(d):
+    return date(d.year, d.month, 1)
+
+
+def add_months(d, months):
+    index = d.year * 12 + (d.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def _quote(connection, name):
+    return connection.ops.quote_name(name)
+
+
+def is_partitioned(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(connection, table):
+    """{month: partition table name} for the monthly children of `table`."""
+    prefix = f"{table}_p"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            """,
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    out = {}
+    for name in names:
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            out[date(int(suffix[:4]), int(suffix[4:]), 1)] = name
+    return out
+
+
+def create_month_partition(connection, table, column, month):
+    """
+    Create and attach the partition for `month`. Rows for that month that
+    already landed in the default partition are moved into it first, since
+    ATTACH refuses to run while the default partition overlaps the range.
+    """
+    name = partition_name(table, month)
+    start, end = month_start(month), add_months(month, 1)
+    q = lambda n: _quote(connection, n)
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {q(name)} (LIKE {q(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {q(table + '_default')}
+                WHERE {q(column)} >= %s AND {q(column)} < %s
+                RETURNING *
+            )
+            INSERT INTO {q(name)} SELECT * FROM moved
+            """,
+            [start, end],
+        )
+        cursor.execute(
+            f"ALTER TABLE {q(table)} ATTACH PARTITION {q(name)} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    logger.info("Created partition %s [%s, %s)", name, start, end)
+    return name
+
+
+def ensure_partitions(connection, table, column, first_month, last_month):
+    """Create every missing monthly partition in [first_month, last_month]."""
+    existing = list_partitions(connection, table)
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        if month not in existing:
+            created.append(create_month_partition(connection, table, column, month))
+        month = add_months(month, 1)
+    return created
+
+
+def retire_partitions(connection, table, before_month, archive_schema=None, drop=False):
+    """
+    Detach monthly partitions that end before `before_month`. Detached
+    tables are moved to `archive_schema`, dropped if `drop`, or otherwise
+    left in place as standalone tables.
+    """
+    q = lambda n: _quote(connection, n)
+    retired = []
+    for month, name in sorted(list_partitions(connection, table).items()):
+        if month >= before_month:
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {q(table)} DETACH PARTITION {q(name)}")
+            if drop:
+                cursor.execute(f"DROP TABLE {q(name)}")
+            elif archive_schema:
+                cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {q(archive_schema)}")
+                cursor.execute(f"ALTER TABLE {q(name)} SET SCHEMA {q(archive_schema)}")
+        retired.append(name)
+        logger.info("Retired partition %s (%s)", name, "dropped" if drop else archive_schema or "detached")
+    return retired
+
+
+def maintain_partitions(months_ahead=3, retain_months=None, archive_schema=None, drop=False, connection=None):
+    """
+    Pre-create partitions up to `months_ahead` months from now and retire
+    those older than `retain_months` (None / 0 keeps everything), for every
+    table in PARTITIONED_TABLES that is actually partitioned.
+
+    Retired months are no longer part of portfolio_transaction, so their
+    trades disappear from everything computed from it: XIRR, adjusted
+    positions, daily-value backfills and exports.
+    """
+    connection = connection or default_connection
+    if not supports_partitioning(connection):
+        return {}
+
+    this_month = month_start(date.today())
+    report = {}
+    for table, column in PARTITIONED_TABLES.items():
+        if not is_partitioned(connection, table):
+            continue
+        created = ensure_partitions(
+            connection, table, column, this_month, add_months(this_month, months_ahead)
+        )
+        retired = []
+        if retain_months:
+            retired = retire_partitions(
+                connection, table, add_months(this_month, -retain_months),
+                archive_schema=archive_schema, drop=drop,
+            )
+        report[table] = {"created": created, "retired": retired}
+    return report
@@ -0,0 +1,403 @@
+# portfolio/performance.py
+"""
+Daily portfolio value (NAV) series.
+
+PortfolioDailyValue holds one row per portfolio and day: the end-of-day
+market value in VALUATION_CURRENCY and the day's net flow (buys minus
+sells). A nightly task (record_daily_values_task) records the day's closes
+into StockDailyPrice and computes only the days after each portfolio's
+last stored date; `manage.py backfill_daily_values` fills history in a
+process pool, a chunk of portfolios per worker.
+
+Computing [start, end] for a batch of portfolios is three aggregate
+queries, whatever the number of days:
+
+  1. current positions per (portfolio, stock, currency) from Holding,
+  2. split-adjusted net quantity and cash flow per (portfolio, stock,
+     currency, day) from transactions since `start`,
+  3. closes for the stocks involved in [start, end], plus the last close
+     before `start`, divided by the AdjustmentFactor of their day so they
+     are in today's share terms like the positions.
+
+Positions for a past day are today's holdings rolled back by the later
+transactions, so history is as complete as the transaction history.
+Closes carry forward over days without a price (weekends, holidays).
+"""
+import logging
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from portfolio.adjustments import factor_subquery, with_adjustment
+from portfolio.fx import get_rate_table, normalize_currency
+from portfolio.models import Holding, Portfolio, PortfolioDailyValue, Stock, StockDailyPrice, Transaction
+from portfolio.versions import bump_values_version_on_commit
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal("0")
+ONE = Decimal("1")
+PLACES = Decimal("0.0001")
+MONEY = DecimalField(max_digits=40, decimal_places=10)
+PORTFOLIO_BATCH_SIZE = 200
+ONE_DAY = timedelta(days=1)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _valuation_currency(currency=None):
+    return normalize_currency(currency or getattr(settings, "VALUATION_CURRENCY", "INR"))
+
+
+# ---------------------------------------------------------
+# Daily closes
+# ---------------------------------------------------------
+def record_daily_closes(day=None):
+    """
+    Upsert a StockDailyPrice for every held stock from its latest Stock
+    price, dated by the day that price is for (never later than `day`).
+    Returns the number of rows written.
+    """
+    day = day or timezone.localdate()
+    now = timezone.now()
+    rows = []
+    stocks = Stock.objects.filter(holdings__isnull=False).distinct().values_list("id", "last_price", "as_of")
+    for stock_id, last_price, as_of in stocks:
+        price_date = timezone.localdate(as_of)
+        if last_price is None or price_date > day:
+            continue
+        rows.append(StockDailyPrice(stock_id=stock_id, price_date=price_date, close=last_price, recorded_at=now))
+
+    StockDailyPrice.objects.bulk_create(
+        rows,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["stock", "price_date"],
+        update_fields=["close", "recorded_at"],
+    )
+    return len(rows)
+
+
+# ---------------------------------------------------------
+# Computation
+# ---------------------------------------------------------
+def _signed(expression):
+    """+expression for buys, -expression for sells, 0 for anything else."""
+    return Case(
+        When(trade_type__iexact="BUY", then=expression),
+        When(trade_type__iexact="SELL", then=-expression),
+        default=Value(ZERO),
+        output_field=MONEY,
+    )
+
+
+def _adjusted_closes(stock_ids, start, end):
+    """[(price_date, stock_id, close in today's share terms)] ordered by day, incl. the last one before start."""
+    if not stock_ids:
+        return []
+    last_before = (
+        StockDailyPrice.objects.filter(stock_id=OuterRef("pk"), price_date__lt=start)
+        .order_by("-price_date")
+        .values("pk")[:1]
+    )
+    opening = Stock.objects.filter(pk__in=stock_ids).annotate(price_id=Subquery(last_before)).values("price_id")
+    rows = (
+        StockDailyPrice.objects.filter(stock_id__in=stock_ids)
+        .filter(Q(price_date__gte=start, price_date__lte=end) | Q(pk__in=opening))
+        .annotate(adj_factor=factor_subquery("stock_id", "price_date"))
+        .order_by("price_date")
+        .values_list("price_date", "stock_id", "close", "adj_factor")
+    )
+    return [(day, stock_id, close / factor) for day, stock_id, close, factor in rows]
+
+
+def compute_daily_values(portfolio_ids, start, end, currency=None):
+    """
+    Unsaved PortfolioDailyValue rows for every portfolio in `portfolio_ids`
+    and every day in [start, end]. Days with no priced position are skipped.
+    """
+    portfolio_ids = list(portfolio_ids)
+    target = _valuation_currency(currency)
+
+    # 1. today's positions, already in today's share terms
+    positions = defaultdict(lambda: defaultdict(lambda: ZERO))     # pid -> (stock, currency) -> qty
+    holdings = (
+        Holding.objects.filter(broker_account__portfolio_id__in=portfolio_ids)
+        .values("broker_account__portfolio_id", "stock_id", "currency")
+        .annotate(total=Sum("quantity"))
+        .order_by()
+        .values_list("broker_account__portfolio_id", "stock_id", "currency", "total")
+    )
+    for pid, stock_id, cur, quantity in holdings:
+        positions[pid][(stock_id, normalize_currency(cur))] += quantity
+
+    # 2. adjusted net quantity and flow per day since start
+    trades = with_adjustment(
+        Transaction.objects.filter(
+            broker_account__portfolio_id__in=portfolio_ids, trade_time__gte=_day_start(start),
+        ),
+        "trade_time", price_field=None,
+    )
+    trades = (
+        trades.values("broker_account__portfolio_id", "stock_id", "currency", "_adj_day")
+        .annotate(
+            net_quantity=Sum(_signed(F("adjusted_quantity"))),
+            net_flow=Sum(_signed(ExpressionWrapper(F("quantity") * F("price"), output_field=MONEY))),
+        )
+        .order_by()
+    )
+    deltas = defaultdict(lambda: defaultdict(list))    # pid -> day -> [((stock, currency), qty)]
+    flows = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: ZERO)))   # pid -> day -> currency -> amount
+    for row in trades:
+        pid, day, cur = row["broker_account__portfolio_id"], row["_adj_day"], normalize_currency(row["currency"])
+        deltas[pid][day].append(((row["stock_id"], cur), row["net_quantity"] or ZERO))
+        flows[pid][day][cur] += row["net_flow"] or ZERO
+
+    # 3. closes in today's share terms
+    stock_ids = {stock_id for pos in positions.values() for stock_id, _ in pos}
+    stock_ids.update(key[0] for days in deltas.values() for items in days.values() for key, _ in items)
+    closes = _adjusted_closes(stock_ids, start, end)
+
+    # Walk every portfolio forward from start, with prices carried forward.
+    totals = {}         # (pid, day) -> ({currency: market value}, {currency: flow})
+    for pid in portfolio_ids:
+        pos = defaultdict(lambda: ZERO, positions.get(pid, {}))
+        for day, items in deltas.get(pid, {}).items():
+            if day > start:
+                for key, quantity in items:
+                    pos[key] -= quantity
+
+        last_close, i, day = {}, 0, start
+        while day <= end:
+            if day > start:
+                for key, quantity in deltas.get(pid, {}).get(day, ()):
+                    pos[key] += quantity
+            while i < len(closes) and closes[i][0] <= day:
+                last_close[closes[i][1]] = closes[i][2]
+                i += 1
+            values = defaultdict(lambda: ZERO)
+            for (stock_id, cur), quantity in pos.items():
+                if quantity and stock_id in last_close:
+                    values[cur] += quantity * last_close[stock_id]
+            day_flows = flows.get(pid, {}).get(day, {})
+            if values or day_flows:
+                totals[(pid, day)] = (values, day_flows)
+            day += ONE_DAY
+
+    rates = get_rate_table().rates(
+        ((cur, day) for (_, day), (values, day_flows) in totals.items() for cur in (*values, *day_flows)),
+        target,
+    )
+    now = timezone.now()
+    out, missing = [], set()
+    for (pid, day), (values, day_flows) in totals.items():
+        market_value = net_flow = ZERO
+        for amounts, field in ((values, "value"), (day_flows, "flow")):
+            for cur, amount in amounts.items():
+                rate = rates.get((cur, day))
+                if rate is None:
+                    missing.add(cur)
+                elif field == "value":
+                    market_value += amount * rate
+                else:
+                    net_flow += amount * rate
+        out.append(PortfolioDailyValue(
+            portfolio_id=pid,
+            value_date=day,
+            currency=target,
+            market_value=market_value.quantize(PLACES),
+            net_flow=net_flow.quantize(PLACES),
+            computed_at=now,
+        ))
+    if missing:
+        logger.warning("Daily values %s..%s: no FX rate for %s", start, end, ", ".join(sorted(missing)))
+    return out
+
+
+def store_daily_values(rows):
+    """Upsert computed rows and bump the values version of every portfolio touched."""
+    with transaction.atomic():
+        PortfolioDailyValue.objects.bulk_create(
+            rows,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["portfolio", "value_date"],
+            update_fields=["currency", "market_value", "net_flow", "computed_at"],
+        )
+        for pid in {row.portfolio_id for row in rows}:
+            bump_values_version_on_commit(pid)
+    return len(rows)
+
+
+def update_daily_values(portfolio_ids=None, until=None, currency=None):
+    """
+    Incremental run: for each active portfolio compute the days after its
+    last stored value up to `until` (default today). Portfolios without any
+    value start at `until`; use backfill_daily_values for history.
+    Portfolios sharing a start day are computed together.
+    """
+    until = until or timezone.localdate()
+    qs = Portfolio.objects.filter(active=True)
+    if portfolio_ids is not None:
+        qs = qs.filter(pk__in=list(portfolio_ids))
+    ids = list(qs.values_list("pk", flat=True))
+
+    last = dict(
+        PortfolioDailyValue.objects.filter(portfolio_id__in=ids)
+        .values("portfolio_id")
+        .annotate(last=Max("value_date"))
+        .order_by()
+        .values_list("portfolio_id", "last")
+    )
+    by_start = defaultdict(list)
+    for pid in ids:
+        start = last[pid] + ONE_DAY if pid in last else until
+        if start <= until:
+            by_start[start].append(pid)
+
+    written = 0
+    for start, pids in sorted(by_start.items()):
+        for i in range(0, len(pids), PORTFOLIO_BATCH_SIZE):
+            written += store_daily_values(
+                compute_daily_values(pids[i:i + PORTFOLIO_BATCH_SIZE], start, until, currency)
+            )
+    return written
+
+
+# ---------------------------------------------------------
+# Backfill
+# ---------------------------------------------------------
+def _backfill_chunk(args):
+    portfolio_ids, start, end, currency = args
+    try:
+        return store_daily_values(compute_daily_values(portfolio_ids, start, end, currency))
+    finally:
+        connections.close_all()
+
+
+def backfill_daily_values(start, end=None, portfolio_ids=None, workers=None, chunk_size=20, currency=None):
+    """
+    Recompute [start, end] for the given (default: all active) portfolios,
+    `chunk_size` portfolios per job across a pool of `workers` processes.
+    Returns the number of rows written.
+    """
+    end = end or timezone.localdate()
+    qs = Portfolio.objects.filter(active=True)
+    if portfolio_ids is not None:
+        qs = qs.filter(pk__in=list(portfolio_ids))
+    ids = list(qs.order_by("pk").values_list("pk", flat=True))
+    jobs = [(ids[i:i + chunk_size], start, end, currency) for i in range(0, len(ids), chunk_size)]
+    if not jobs:
+        return 0
+    if workers == 1 or len(jobs) == 1:
+        return sum(store_daily_values(compute_daily_values(*job)) for job in jobs)
+
+    # Forked workers inherit the configured Django but must open their own
+    # database connections, never reuse the parent's sockets.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+        return sum(pool.map(_backfill_chunk, jobs))
+
+
+# ---------------------------------------------------------
+# Reads
+# ---------------------------------------------------------
+def value_series(portfolio_id, since, until):
+    """
+    Stored daily values in [since, until] (one range scan on the
+    (portfolio, value_date) index) with the time-weighted daily and
+    cumulative return: r = (value - flow) / previous value - 1.
+    """
+    rows = list(
+        PortfolioDailyValue.objects.filter(
+            portfolio_id=portfolio_id, value_date__gte=since, value_date__lte=until,
+        )
+        .order_by("value_date")
+        .values("value_date", "currency", "market_value", "net_flow")
+    )
+    previous, growth = None, ONE
+    for row in rows:
+        daily = None
+        if previous:
+            daily = (row["market_value"] - row["net_flow"]) / previous - ONE
+            growth *= ONE + daily
+        row["daily_return"] = daily.quantize(Decimal("0.000001")) if daily is not None else None
+        row["cumulative_return"] = (growth - ONE).quantize(Decimal("0.000001"))
+        previous = row["market_value"]
+    return rows
+
+
+# ---------------------------------------------------------
+# Money-weighted return
+# ---------------------------------------------------------
+def xirr(flows, tolerance=1e-9, max_iterations=200):
+    """
+    Annualised rate r with sum(amount / (1 + r) ** (days / 365)) == 0 for
+    [(date, amount)] flows, by bisection. None without both signs.
+    """
+    flows = [(day, float(amount)) for day, amount in flows if amount]
+    if not any(a > 0 for _, a in flows) or not any(a < 0 for _, a in flows):
+        return None
+    first = min(day for day, _ in flows)
+    years = [((day - first).days / 365.0, amount) for day, amount in flows]
+
+    def npv(rate):
+        return sum(amount / (1.0 + rate) ** t for t, amount in years)
+
+    low, high = -0.999999, 1.0
+    while npv(low) * npv(high) > 0:
+        high *= 2
+        if high > 1e6:
+            return None
+    for _ in range(max_iterations):
+        mid = (low + high) / 2
+        if npv(low) * npv(mid) <= 0:
+            high = mid
+        else:
+            low = mid
+        if high - low < tolerance:
+            break
+    return (low + high) / 2
+
+
+def portfolio_xirr(portfolio_id, market_value, currency=None, on=None):
+    """
+    XIRR of a portfolio's trades (buys out, sells in, per day and currency
+    in one aggregate query) against `market_value` in `currency` on `on`
+    (default today). Returns {"currency", "xirr", "flows", "missing_fx"}.
+    """
+    target = _valuation_currency(currency)
+    on = on or timezone.localdate()
+    rows = list(
+        Transaction.objects.filter(broker_account__portfolio_id=portfolio_id)
+        .annotate(day=TruncDate("trade_time"))
+        .values("day", "currency")
+        .annotate(flow=Sum(_signed(ExpressionWrapper(F("quantity") * F("price"), output_field=MONEY))))
+        .order_by()
+        .values_list("day", "currency", "flow")
+    )
+    rates = get_rate_table().rates(((cur, day) for day, cur, _ in rows), target)
+    flows, missing = [], set()
+    for day, cur, amount in rows:
+        rate = rates.get((cur, day))
+        if rate is None:
+            missing.add(normalize_currency(cur))
+            continue
+        flows.append((day, -(amount or ZERO) * rate))
+    flows.append((on, market_value or ZERO))
+    return {
+        "currency": target,
+        "xirr": xirr(flows),
+        "flows": len(flows) - 1,
+        "missing_fx": sorted(missing),
+    }
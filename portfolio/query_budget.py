@@ -0,0 +1,172 @@
+# portfolio/query_budget.py
+"""
+SQL query budgets for Celery tasks and requests.
+
+track_queries() installs a connection.execute_wrapper on every database
+alias for the current thread and counts queries, total DB time and
+repeated query shapes (the same SQL with different parameters, the
+signature of an N+1 loop). It is wired in twice:
+
+  - task_prerun / task_postrun: every Celery task is measured,
+  - QueryBudgetMiddleware: every request is measured (streamed bodies are
+    rendered after the middleware returns and are not counted).
+
+A unit that exceeds its budget is logged with its worst repeated shapes.
+Budgets default to QUERY_BUDGET_MAX_QUERIES / QUERY_BUDGET_MAX_DUPLICATES
+and can be pinned per task name or URL name in QUERY_BUDGETS.
+
+Tests pin a budget with
+
+    with assert_query_budget(6):
+        persist_holdings(account, data)
+
+which raises AssertionError listing the queries when it is exceeded.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"\((?:%s,\s*)+%s\)")
+_SPACE = re.compile(r"\s+")
+
+
+def query_shape(sql):
+    """SQL with placeholder lists collapsed, so `IN (%s, %s)` == `IN (%s)`."""
+    return _SPACE.sub(" ", _IN_LIST.sub("(%s...)", sql)).strip()
+
+
+class QueryStats:
+    """execute_wrapper that records every query run through it."""
+
+    def __init__(self, keep_sql=False):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.keep_sql = keep_sql
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+            self.shapes[query_shape(sql)] += 1
+            if self.keep_sql:
+                self.queries.append(sql)
+
+    @property
+    def duration_ms(self):
+        return self.duration * 1000
+
+    def duplicates(self, minimum=2):
+        """[(shape, times)] for shapes run at least `minimum` times, worst first."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= minimum]
+
+
+@contextmanager
+def track_queries(keep_sql=False):
+    """Measure every query on every database alias in this thread."""
+    stats = QueryStats(keep_sql=keep_sql)
+    with ExitStack() as stack:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(stats))
+        yield stats
+
+
+def budget_for(label):
+    """(max_queries, max_duplicates) for a task / URL name."""
+    max_queries = getattr(settings, "QUERY_BUDGET_MAX_QUERIES", 100)
+    max_duplicates = getattr(settings, "QUERY_BUDGET_MAX_DUPLICATES", 10)
+    pinned = getattr(settings, "QUERY_BUDGETS", {}).get(label)
+    if isinstance(pinned, dict):
+        max_queries = pinned.get("queries", max_queries)
+        max_duplicates = pinned.get("duplicates", max_duplicates)
+    elif pinned is not None:
+        max_queries = pinned
+    return max_queries, max_duplicates
+
+
+def check_budget(label, stats):
+    """Log `label` if it went over its budget. Returns True when within it."""
+    max_queries, max_duplicates = budget_for(label)
+    repeated = stats.duplicates(minimum=max_duplicates + 1)
+    if stats.count <= max_queries and not repeated:
+        return True
+    logger.warning(
+        "Query budget exceeded by %s: %d queries (budget %d), %.1f ms in DB%s",
+        label, stats.count, max_queries, stats.duration_ms,
+        "".join(f"\n  {n}x {shape[:300]}" for shape, n in repeated[:5]),
+    )
+    return False
+
+
+@contextmanager
+def assert_query_budget(max_queries, max_duplicates=None):
+    """Fail with AssertionError if the block runs more than `max_queries` queries."""
+    with track_queries(keep_sql=True) as stats:
+        yield stats
+    problems = []
+    if stats.count > max_queries:
+        problems.append(f"{stats.count} queries, budget {max_queries}")
+    if max_duplicates is not None:
+        repeated = stats.duplicates(minimum=max_duplicates + 1)
+        if repeated:
+            problems.append(f"{repeated[0][1]}x the same query, budget {max_duplicates}")
+    if problems:
+        listing = "\n".join(f"  {i}. {sql}" for i, sql in enumerate(stats.queries, 1))
+        raise AssertionError(f"Query budget exceeded: {'; '.join(problems)}\n{listing}")
+
+
+def _enabled():
+    return getattr(settings, "QUERY_BUDGET_ENABLED", True)
+
+
+# ---------------------------------------------------------
+# Celery tasks
+# ---------------------------------------------------------
+_task_trackers = {}
+
+
+@task_prerun.connect
+def _task_started(task_id=None, **kwargs):
+    if not _enabled():
+        return
+    tracker = track_queries()
+    _task_trackers[task_id] = (tracker, tracker.__enter__())
+
+
+@task_postrun.connect
+def _task_finished(task_id=None, task=None, **kwargs):
+    entry = _task_trackers.pop(task_id, None)
+    if entry is None:
+        return
+    tracker, stats = entry
+    tracker.__exit__(None, None, None)
+    check_budget(task.name, stats)
+
+
+# ---------------------------------------------------------
+# Requests
+# ---------------------------------------------------------
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _enabled():
+            return self.get_response(request)
+        with track_queries() as stats:
+            response = self.get_response(request)
+        match = request.resolver_match
+        check_budget(match.view_name if match else request.path, stats)
+        return response
@@ -0,0 +1,76 @@
+# portfolio/raw_snapshots.py
+"""
+Content-addressed storage of raw broker responses (RawSnapshot).
+
+Payloads are serialized as canonical JSON, hashed with sha256 and
+compressed with zstd when the optional `zstandard` package is installed,
+zlib otherwise. Identical payloads are stored once.
+"""
+import hashlib
+import json
+import zlib
+from datetime import timedelta
+
+from django.utils import timezone
+
+from portfolio.models import RawSnapshot
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+
+def _canonical_json(payload):
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def _compress(data):
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+
+def _decompress(codec, blob):
+    blob = bytes(blob)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("RawSnapshot is zstd compressed but `zstandard` is not installed.")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if codec == "zlib":
+        return zlib.decompress(blob)
+    raise ValueError(f"Unknown RawSnapshot codec: {codec}")
+
+
+def store_raw_snapshot(payload):
+    """Store `payload` (JSON-serializable) if new; return its digest."""
+    data = _canonical_json(payload)
+    digest = hashlib.sha256(data).hexdigest()
+
+    # Unchanged responses are the common case: skip compression entirely.
+    if RawSnapshot.objects.filter(digest=digest).exists():
+        return digest
+
+    codec, blob = _compress(data)
+    RawSnapshot.objects.bulk_create(
+        [RawSnapshot(digest=digest, codec=codec, payload=blob, raw_size=len(data))],
+        ignore_conflicts=True,   # another worker stored the same payload meanwhile
+    )
+    return digest
+
+
+def load_raw_snapshot(digest):
+    """Decoded payload for a digest (raises RawSnapshot.DoesNotExist)."""
+    snap = RawSnapshot.objects.only("codec", "payload").get(digest=digest)
+    return json.loads(_decompress(snap.codec, snap.payload))
+
+
+def prune_raw_snapshots(older_than_days):
+    """Delete snapshots no holding references any more, older than N days."""
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    deleted, _ = (
+        RawSnapshot.objects
+        .filter(created_at__lt=cutoff, holdings__isnull=True)
+        .delete()
+    )
+    return deleted
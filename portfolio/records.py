@@ -0,0 +1,121 @@
+# portfolio/records.py
+"""
+Typed holding records: the contract between BaseTrigger.fetch_holdings
+and services.persist_holdings.
+
+Numeric fields are parsed into Decimal exactly once, straight from the
+broker's raw value (strings stay exact; JSON floats go through their
+shortest repr), instead of raw -> float -> str -> Decimal.
+"""
+from decimal import Decimal
+
+DECIMAL_ZERO = Decimal("0")
+
+
+def to_decimal(value, default=None):
+    """Parse a raw broker value into a Decimal (None/"" -> default)."""
+    kind = type(value)
+    if kind is float:
+        # shortest repr, so 0.1 stays Decimal("0.1") rather than its binary expansion
+        return Decimal(repr(value))
+    if value is None or value == "":
+        return default
+    if kind is Decimal:
+        return value
+    return Decimal(value)
+
+
+class HoldingRecord:
+    """One normalized holding as produced by a trigger."""
+
+    __slots__ = (
+        "symbol", "isin", "asset_type",
+        "quantity", "avg_price", "last_price", "close_price", "price_as_of",
+        "currency", "as_of", "source_snapshot_id", "meta",
+    )
+
+    def __init__(self, symbol, quantity=None, avg_price=None, *, isin=None, asset_type=None,
+                 last_price=None, close_price=None, price_as_of=None, currency="INR",
+                 as_of=None, source_snapshot_id=None, meta=None):
+        self.symbol = symbol
+        self.isin = isin
+        self.asset_type = asset_type or "equity"
+        self.quantity = to_decimal(quantity, DECIMAL_ZERO)
+        self.avg_price = to_decimal(avg_price, DECIMAL_ZERO)
+        self.last_price = to_decimal(last_price)
+        self.close_price = to_decimal(close_price)
+        self.price_as_of = price_as_of
+        self.currency = currency or "INR"
+        self.as_of = as_of
+        self.source_snapshot_id = source_snapshot_id
+        self.meta = meta
+
+    @classmethod
+    def from_dict(cls, item):
+        """Build a record from the legacy per-holding dict shape."""
+        return cls(
+            item.get("symbol"),
+            item.get("quantity"),
+            item.get("avg_price"),
+            isin=item.get("isin"),
+            asset_type=item.get("asset_type"),
+            last_price=item.get("last_price"),
+            close_price=item.get("close_price"),
+            price_as_of=item.get("price_as_of"),
+            currency=item.get("currency", "INR"),
+            as_of=item.get("as_of"),
+            source_snapshot_id=item.get("source_snapshot_id"),
+            meta=item.get("meta"),
+        )
+
+    def __repr__(self):
+        return f"HoldingRecord({self.symbol!r}, quantity={self.quantity}, avg_price={self.avg_price})"
+
+
+class HoldingBatch:
+    """
+    Columnar variant for large accounts: one list per field instead of one
+    object per holding. Iterating yields HoldingRecord objects lazily.
+    """
+
+    __slots__ = HoldingRecord.__slots__
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, [])
+
+    def append(self, symbol, quantity=None, avg_price=None, *, isin=None, asset_type=None,
+               last_price=None, close_price=None, price_as_of=None, currency="INR",
+               as_of=None, source_snapshot_id=None, meta=None):
+        self.symbol.append(symbol)
+        self.isin.append(isin)
+        self.asset_type.append(asset_type or "equity")
+        self.quantity.append(to_decimal(quantity, DECIMAL_ZERO))
+        self.avg_price.append(to_decimal(avg_price, DECIMAL_ZERO))
+        self.last_price.append(to_decimal(last_price))
+        self.close_price.append(to_decimal(close_price))
+        self.price_as_of.append(price_as_of)
+        self.currency.append(currency or "INR")
+        self.as_of.append(as_of)
+        self.source_snapshot_id.append(source_snapshot_id)
+        self.meta.append(meta)
+
+    def __len__(self):
+        return len(self.symbol)
+
+    def __iter__(self):
+        columns = [getattr(self, name) for name in self.__slots__]
+        for values in zip(*columns):
+            record = HoldingRecord.__new__(HoldingRecord)
+            for name, value in zip(self.__slots__, values):
+                setattr(record, name, value)
+            yield record
+
+
+def as_record(item):
+    """Accept a HoldingRecord or a legacy dict; anything else -> None."""
+    if isinstance(item, HoldingRecord):
+        return item
+    if isinstance(item, dict):
+        return HoldingRecord.from_dict(item)
+    return None
@@ -0,0 +1,24 @@
+# portfolio/redis_client.py
+import os
+
+import redis
+from django.conf import settings
+
+_clients = {}
+
+
+def get_redis():
+    """
+    Shared Redis client for the current process.
+
+    Clients are cached per pid so a prefork child never reuses the
+    connection pool it inherited from the parent.
+    """
+    pid = os.getpid()
+    client = _clients.get(pid)
+    if client is None:
+        redis_url = getattr(settings, "REDIS_URL", "redis://127.0.0.1:6379/0")
+        client = redis.from_url(redis_url, decode_responses=True)
+        _clients.clear()
+        _clients[pid] = client
+    return client
@@ -0,0 +1,38 @@
+# portfolio/routing.py
+from django.conf import settings
+
+SYNC_QUEUE = "sync"
+
+
+def broker_queue(broker_code):
+    """
+    Queue that broker_action_task runs on for a broker type code.
+
+    Brokers listed in BROKER_QUEUE_CODES get their own queue (so one slow
+    broker can't starve the others); anything else shares the default
+    broker queue.
+    """
+    prefix = getattr(settings, "BROKER_QUEUE_PREFIX", "broker.")
+    code = (broker_code or "").lower()
+    if code in getattr(settings, "BROKER_QUEUE_CODES", []):
+        return f"{prefix}{code}"
+    return f"{prefix}default"
+
+
+def worker_command(profile_name):
+    """Build the `celery worker` argv for a profile in CELERY_WORKER_PROFILES."""
+    profiles = getattr(settings, "CELERY_WORKER_PROFILES", {})
+    try:
+        profile = profiles[profile_name]
+    except KeyError:
+        raise KeyError(
+            f"Unknown worker profile '{profile_name}'. Known: {', '.join(sorted(profiles))}"
+        )
+
+    return [
+        "celery", "-A", "portfolio_project", "worker",
+        "-n", f"{profile_name}@%h",
+        "-Q", ",".join(profile["queues"]),
+        "-P", profile.get("pool", "prefork"),
+        f"--concurrency={profile.get('concurrency', 1)}",
+    ]
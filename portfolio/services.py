@@ -7,102 +7,444 @@ from django.db import transaction
 
 # portfolio/services.py
 
+import logging
+from datetime import timedelta
 from decimal import Decimal
+from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
+from django.db import connections, router, transaction
+from django.db.models import Count, DecimalField, DurationField, ExpressionWrapper, F, Sum
+
+from portfolio.events import (
+    events_enabled, holding_changes, price_event, price_moved, publish_events_on_commit,
+)
+from portfolio.fx import get_rate_table, normalize_currency
+from portfolio.models import BrokerAccount, Holding, Stock
+from portfolio.raw_snapshots import store_raw_snapshot
+from portfolio.triggers import registry
+from portfolio.versions import bump_portfolio_version_on_commit, bump_prices_version_on_commit
+from portfolio.records import DECIMAL_ZERO, as_record
 
-from portfolio.models import Holding, Stock
+logger = logging.getLogger(__name__)
 
 
 def persist_holdings(broker_account, holdings_data):
     """
     Persist holdings snapshot for a broker_account.
 
-    - Upserts Stock rows (symbol/isin/asset_type + latest price data)
+    - Upserts Stock rows (symbol/isin/asset_type) in one statement per
+      batch; the price is only written if the stored one is older than
+      HOLDINGS_PRICE_STALE_SECONDS
     - Upserts Holding rows (per broker_account + stock)
+    - Removes holdings absent from the snapshot (positions sold at the
+      broker), see reconcile_holdings.
+    - Publishes new / quantity / closed / price change events after
+      commit (portfolio.events).
 
     Input can be:
       - dict with 'data' key (trigger output), or
-      - plain list of holding dicts.
+      - plain list / HoldingBatch of HoldingRecord (or legacy dict) items.
+
+    Only a trigger output with status "ok" is treated as a complete
+    snapshot and reconciled; plain lists, error responses and snapshots
+    with items that could not be read never remove anything.
     """
     # Normalize input
     if isinstance(holdings_data, dict):
         holdings_list = holdings_data.get("data", [])
+        complete_snapshot = (
+            holdings_data.get("status") == "ok"
+            and holdings_data.get("complete", True)
+        )
     else:
         holdings_list = holdings_data or []
+        complete_snapshot = False
 
     saved = 0
     now = timezone.now()
+    seen_stock_ids = set()
+    price_stale_after = timedelta(seconds=getattr(settings, "HOLDINGS_PRICE_STALE_SECONDS", 60))
+
+    raw = holdings_data.get("raw") if isinstance(holdings_data, dict) else None
 
     with transaction.atomic():
-        for item in holdings_list:
-            if not isinstance(item, dict):
-                continue
+        # Full broker response is stored once (compressed, deduplicated);
+        # holdings only reference it and keep a small `meta` projection.
+        raw_snapshot_id = store_raw_snapshot(raw) if raw else None
 
-            symbol = item.get("symbol")
-            if not symbol:
+        # Previous state, to diff the snapshot into change events.
+        previous = symbols = None
+        if events_enabled():
+            previous, symbols = {}, {}
+            for stock_id, quantity, last_price, symbol in Holding.objects.filter(
+                broker_account=broker_account
+            ).values_list("stock_id", "quantity", "stock__last_price", "stock__symbol"):
+                previous[stock_id] = (quantity, last_price)
+                symbols[stock_id] = symbol
+        prices = {}
+
+        records = []
+        skipped = 0
+        for item in holdings_list:
+            record = as_record(item)
+            if record is None or not record.symbol:
                 # If there's no symbol, we can't do much
+                skipped += 1
                 continue
+            records.append(record)
+        if skipped and complete_snapshot:
+            # The holdings behind unreadable rows are unknown, not sold.
+            logger.warning(
+                "broker_account=%s: skipped %d unreadable holding(s), not reconciling this snapshot",
+                broker_account.pk, skipped,
+            )
+            complete_snapshot = False
 
-            isin = item.get("isin")
-            asset_type = item.get("asset_type") or "equity"
-
-            # --- 1) Upsert Stock -----------------------------------------
-            stock_as_of = item.get("price_as_of") or item.get("as_of") or now
+        # --- 1) Upsert Stock rows (one batched statement + one lookup) ------
+        stock_rows = []
+        for record in records:
+            stock_rows.append((
+                record.symbol, record.isin, record.asset_type,
+                record.price_as_of or record.as_of or now,
+                record.last_price if record.last_price is not None else DECIMAL_ZERO,
+                record.close_price,
+            ))
+        # Prices are owned by refresh_prices: the upsert only overwrites a
+        # stored price older than price_stale_after, in the same statement.
+        stocks = upsert_stocks(stock_rows, now, price_stale_after)
 
-            last_price_raw = item.get("last_price")
-            close_price_raw = item.get("close_price")
+        # --- 2) Upsert Holding rows (per broker_account + stock) -----------
+        holdings = {}
+        for record, row in zip(records, stock_rows):
+            stock_id, written = stocks[stock_key(row[0], row[1], row[2])]
+            if written:
+                prices[stock_id] = row[4]
 
-            # Safely convert to Decimal or None
-            last_price = (
-                Decimal(str(last_price_raw))
-                if last_price_raw is not None
-                else Decimal("0")
+            # Last item wins if the broker reports the same instrument twice.
+            holdings[stock_id] = Holding(
+                broker_account=broker_account,
+                stock_id=stock_id,
+                quantity=record.quantity,
+                avg_price=record.avg_price,
+                currency=record.currency,
+                as_of=record.as_of or now,
+                source_snapshot_id=record.source_snapshot_id,
+                raw_snapshot_id=raw_snapshot_id,
+                meta=record.meta,
+                created_at=now,
             )
-            close_price = (
-                Decimal(str(close_price_raw))
-                if close_price_raw is not None
-                else None
+            seen_stock_ids.add(stock_id)
+            if symbols is not None:
+                symbols[stock_id] = record.symbol
+            saved += 1
+
+        if holdings:
+            Holding.objects.bulk_create(
+                holdings.values(),
+                batch_size=UPSERT_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=["broker_account", "stock"],
+                update_fields=HOLDING_UPSERT_FIELDS,
             )
 
-            stock, _ = Stock.objects.update_or_create(
-                symbol=symbol,
-                isin=isin,
-                asset_type=asset_type,
-                defaults={
-                    "as_of": stock_as_of,
-                    "last_price": last_price,
-                    "close_price": close_price,
-                    "received_at": now,
-                },
+        if complete_snapshot:
+            reconcile_holdings(broker_account, seen_stock_ids)
+
+        if previous is not None:
+            closed = set(previous) - seen_stock_ids if complete_snapshot else ()
+            current = {stock_id: h.quantity for stock_id, h in holdings.items()}
+            publish_events_on_commit(
+                holding_changes(broker_account, previous, current, closed, prices, symbols)
             )
 
-            # --- 2) Upsert Holding ---------------------------------------
-            holding_as_of = item.get("as_of") or now
+        # API pages / ETags / analytics keyed on these versions go stale after commit.
+        bump_portfolio_version_on_commit(broker_account.portfolio_id)
+        if prices:
+            bump_prices_version_on_commit()
+
+    return saved
 
-            quantity_raw = item.get("quantity", 0)
-            avg_price_raw = item.get("avg_price", 0)
 
-            quantity = Decimal(str(quantity_raw or 0))
-            avg_price = Decimal(str(avg_price_raw or 0))
+UPSERT_BATCH_SIZE = 500
 
-            holding_defaults = {
-                "quantity": quantity,
-                "avg_price": avg_price,
-                "currency": item.get("currency", "INR"),
-                "as_of": holding_as_of,
-                "source_snapshot_id": item.get("source_snapshot_id"),
-                "meta": item.get("meta"),
-            }
+# Everything but identity and created_at is replaced on conflict.
+HOLDING_UPSERT_FIELDS = [
+    "quantity", "avg_price", "currency", "as_of", "source_snapshot_id", "raw_snapshot", "meta",
+]
 
-            # One holding row per (broker_account, stock)
-            Holding.objects.update_or_create(
-                broker_account=broker_account,
-                stock=stock,
-                defaults=holding_defaults,
+
+def stock_key(symbol, isin, asset_type):
+    """Identity of a Stock row, as enforced by uniq_stock_instrument."""
+    return symbol, isin or "", asset_type
+
+
+def upsert_stocks(rows, received_at, price_stale_after=None):
+    """
+    Make sure a Stock row exists for every (symbol, isin, asset_type, as_of,
+    last_price, close_price) in `rows` without read-then-write races.
+
+    Rows are written with INSERT ... ON CONFLICT against
+    uniq_stock_instrument. An existing price is only replaced when it is
+    older than the row's as_of minus `price_stale_after` (never when that
+    is None); the WHERE on DO UPDATE makes that check atomic, so a
+    concurrent newer write wins. RETURNING yields the ids of the rows the
+    statement wrote and the rest are read in one query, so the number of
+    statements does not grow with the number of rows.
+
+    Returns {stock_key: (id, written)}, `written` meaning the row was
+    inserted or its price replaced.
+    """
+    pending = {}
+    for row in rows:
+        pending[stock_key(row[0], row[1], row[2])] = row   # last one wins
+    if not pending:
+        return {}
+
+    out = {}
+    connection = connections[router.db_for_write(Stock)]
+    ops = connection.ops
+    table = ops.quote_name(Stock._meta.db_table)
+    columns = "symbol, isin, asset_type, as_of, last_price, close_price, received_at"
+    if price_stale_after is None:
+        conflict, conflict_params = "DO NOTHING", []
+    else:
+        threshold = ops.combine_duration_expression("-", ["excluded.as_of", "%s"])
+        conflict = (
+            "DO UPDATE SET as_of = excluded.as_of, last_price = excluded.last_price, "
+            "close_price = excluded.close_price, received_at = excluded.received_at "
+            f"WHERE {table}.as_of < {threshold}"
+        )
+        conflict_params = [DurationField().get_db_prep_value(price_stale_after, connection)]
+    items = list(pending.values())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_BATCH_SIZE):
+            batch = items[start:start + UPSERT_BATCH_SIZE]
+            placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(batch))
+            params = []
+            for symbol, isin, asset_type, as_of, last_price, close_price in batch:
+                params += [
+                    symbol, isin, asset_type,
+                    ops.adapt_datetimefield_value(as_of),
+                    ops.adapt_decimalfield_value(last_price, 12, 4),
+                    ops.adapt_decimalfield_value(close_price, 12, 4),
+                    ops.adapt_datetimefield_value(received_at),
+                ]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {placeholders} "
+                f"ON CONFLICT (symbol, (COALESCE(isin, '')), asset_type) {conflict} "
+                f"RETURNING id, symbol, isin, asset_type",
+                params + conflict_params,
             )
+            for stock_id, symbol, isin, asset_type in cursor.fetchall():
+                out[stock_key(symbol, isin, asset_type)] = (stock_id, True)
 
-            saved += 1
+    missing = [key for key in pending if key not in out]
+    if missing:
+        existing = Stock.objects.filter(
+            symbol__in={key[0] for key in missing},
+            asset_type__in={key[2] for key in missing},
+        ).values_list("id", "symbol", "isin", "asset_type")
+        for stock_id, symbol, isin, asset_type in existing:
+            key = stock_key(symbol, isin, asset_type)
+            if key in pending and key not in out:
+                out[key] = (stock_id, False)
+    return out
 
-    return saved
 
+def reconcile_holdings(broker_account, snapshot_stock_ids):
+    """
+    Delete the account's holdings whose stock is not in the latest
+    successful snapshot, as one DELETE ... WHERE stock_id NOT IN (...).
+
+    Callers must only pass the stock ids of a complete, successful
+    snapshot: an empty set removes every holding of the account.
+    """
+    deleted, _ = (
+        Holding.objects
+        .filter(broker_account=broker_account)
+        .exclude(stock_id__in=list(snapshot_stock_ids))
+        .delete()
+    )
+    if deleted:
+        logger.info("Reconciled broker_account=%s: removed %d sold holding(s)", broker_account.pk, deleted)
+    return deleted
+
+
+
+def portfolio_valuation(portfolio_ids=None, currency=None):
+    """
+    Cost / market value per (portfolio, asset_type) in one aggregate query,
+    converted to `currency` (default VALUATION_CURRENCY).
+
+    Rows are summed per holding currency in SQL and only the aggregates are
+    converted, with rates from the in-process FX table (portfolio.fx), so
+    the cost of conversion does not grow with the number of holdings.
+    Currencies without a known rate are left out and listed under
+    "missing_fx".
+
+    Returns {portfolio_id: {"currency", "cost_value", "market_value",
+    "holdings", "missing_fx", "by_asset_type": {asset_type: {"cost_value",
+    "market_value", "holdings"}}}}.
+    """
+    target = normalize_currency(currency or getattr(settings, "VALUATION_CURRENCY", "INR"))
+    money = DecimalField(max_digits=40, decimal_places=10)
+
+    qs = Holding.objects.all()
+    if portfolio_ids is not None:
+        qs = qs.filter(broker_account__portfolio_id__in=list(portfolio_ids))
+
+    rows = list(
+        qs.values("broker_account__portfolio_id", "stock__asset_type", "currency")
+        .annotate(
+            cost_value=Sum(ExpressionWrapper(F("quantity") * F("avg_price"), output_field=money)),
+            market_value=Sum(ExpressionWrapper(F("quantity") * F("stock__last_price"), output_field=money)),
+            holdings=Count("id"),
+        )
+        .order_by()
+    )
+    rates = get_rate_table().rates(((row["currency"], None) for row in rows), target) if rows else {}
+
+    out = {}
+    for row in rows:
+        summary = out.setdefault(row["broker_account__portfolio_id"], {
+            "currency": target,
+            "cost_value": Decimal("0"),
+            "market_value": Decimal("0"),
+            "holdings": 0,
+            "missing_fx": [],
+            "by_asset_type": {},
+        })
+        rate = rates.get((row["currency"], None))
+        if rate is None:
+            if row["currency"] not in summary["missing_fx"]:
+                summary["missing_fx"].append(row["currency"])
+            continue
+        cost = (row["cost_value"] or Decimal("0")) * rate
+        market = (row["market_value"] or Decimal("0")) * rate
+        summary["cost_value"] += cost
+        summary["market_value"] += market
+        summary["holdings"] += row["holdings"]
+        bucket = summary["by_asset_type"].setdefault(row["stock__asset_type"], {
+            "cost_value": Decimal("0"),
+            "market_value": Decimal("0"),
+            "holdings": 0,
+        })
+        bucket["cost_value"] += cost
+        bucket["market_value"] += market
+        bucket["holdings"] += row["holdings"]
+    return out
+
+
+def refresh_prices(broker_codes=None):
+    """
+    Refresh Stock prices from broker quote APIs, decoupled from holdings sync.
+
+    For every broker code, collects the distinct stocks held through that
+    broker and asks the trigger for quotes in batches of
+    trigger_cls.QUOTE_BATCH_SIZE; changed prices are written with one
+    conditional UPDATE per batch (see write_quotes). Brokers whose trigger
+    has no quote support are skipped (their prices keep coming from
+    holdings sync).
+
+    Returns {broker_code: number_of_stocks_updated}.
+    """
+    codes = broker_codes or list(
+        BrokerAccount.objects.filter(status="active", holdings__isnull=False)
+        .values_list("broker_type__code", flat=True)
+        .distinct()
+    )
+
+    updated = {}
+    for code in codes:
+        trigger_cls = registry.get_trigger_for_code(code)
+        if not trigger_cls or not trigger_cls.QUOTE_BATCH_SIZE:
+            continue
+
+        stocks = list(
+            Stock.objects.filter(holdings__broker_account__broker_type__code=code)
+            .distinct()
+            .only("id", "symbol", "isin", "asset_type", "as_of", "last_price")
+        )
+        if not stocks:
+            continue
+
+        quotes = _fetch_quotes(code, trigger_cls, stocks)
+        updated[code] = write_quotes(stocks, quotes)
+    return updated
+
+
+def _fetch_quotes(code, trigger_cls, stocks):
+    """Quotes {stock_id: (last_price, as_of)} using the first account whose credentials work."""
+    accounts = (
+        BrokerAccount.objects.filter(broker_type__code=code, status="active")
+        .select_related("broker_type", "credential")
+    )
+    batch_size = trigger_cls.QUOTE_BATCH_SIZE
+    for acc in accounts:
+        trigger = trigger_cls(acc)
+        quotes = {}
+        try:
+            for i in range(0, len(stocks), batch_size):
+                quotes.update(trigger.fetch_quotes(stocks[i:i + batch_size]))
+        except Exception:
+            logger.exception("Quote fetch for %s via broker_account=%s failed", code, acc.pk)
+            continue
+        return quotes
+    return {}
+
+
+def write_quotes(stocks, quotes):
+    """
+    Apply {stock_id: (last_price, as_of)} to the given Stock rows, skipping
+    quotes that are not newer.
+
+    The as_of read with `stocks` only pre-filters; each batch is one
+    UPDATE ... WHERE as_of < <quote's as_of>, so a newer price written
+    concurrently (another flush, holdings sync, upsert_stocks) is never
+    overwritten. RETURNING yields the rows that were actually written.
+    """
+    candidates = []
+    for stock in stocks:
+        quote = quotes.get(stock.id)
+        if quote and quote[1] > stock.as_of:
+            candidates.append((stock, *quote))
+    if not candidates:
+        return 0
+
+    connection = connections[router.db_for_write(Stock)]
+    ops = connection.ops
+    table = ops.quote_name(Stock._meta.db_table)
+    received_at = ops.adapt_datetimefield_value(timezone.now())
+    written = set()
+    with connection.cursor() as cursor:
+        for start in range(0, len(candidates), UPSERT_BATCH_SIZE):
+            batch = candidates[start:start + UPSERT_BATCH_SIZE]
+            whens = " ".join(["WHEN %s THEN %s"] * len(batch))
+            price_params, as_of_params = [], []
+            for stock, last_price, as_of in batch:
+                price_params += [stock.id, ops.adapt_decimalfield_value(last_price, 12, 4)]
+                as_of_params += [stock.id, ops.adapt_datetimefield_value(as_of)]
+            ids = [stock.id for stock, _, _ in batch]
+            cursor.execute(
+                f"UPDATE {table} SET last_price = CASE id {whens} END, "
+                f"as_of = CASE id {whens} END, received_at = %s "
+                f"WHERE id IN ({', '.join(['%s'] * len(ids))}) AND as_of < CASE id {whens} END "
+                f"RETURNING id",
+                price_params + as_of_params + [received_at] + ids + as_of_params,
+            )
+            written.update(row[0] for row in cursor.fetchall())
+    if not written:
+        return 0
+
+    emit = events_enabled()
+    events = []
+    for stock, last_price, as_of in candidates:
+        if stock.id not in written:
+            continue
+        if emit and price_moved(stock.last_price, last_price):
+            events.append((stock, stock.last_price))
+        stock.last_price = last_price
+        stock.as_of = as_of
+    bump_prices_version_on_commit()
+    publish_events_on_commit([price_event(stock, prev_price) for stock, prev_price in events])
+    return len(written)
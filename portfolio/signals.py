@@ -0,0 +1,44 @@
+# portfolio/signals.py
+"""
+Version bumps for writes that don't go through services (admin edits,
+shell, fixtures). Bulk paths in services bump explicitly instead, since
+they bypass model signals.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from portfolio.adjustments import rebuild_adjustment_index
+from portfolio.models import BrokerAccount, CorporateAction, Portfolio, Transaction
+from portfolio.versions import (
+    bump_portfolio_version_on_commit, bump_prices_version_on_commit, bump_user_version_on_commit,
+)
+
+
+@receiver([post_save, post_delete], sender=Portfolio)
+def portfolio_changed(sender, instance, **kwargs):
+    bump_user_version_on_commit(instance.user_id)
+    bump_portfolio_version_on_commit(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=BrokerAccount)
+def broker_account_changed(sender, instance, **kwargs):
+    bump_portfolio_version_on_commit(instance.portfolio_id)
+
+
+@receiver([post_save, post_delete], sender=Transaction)
+def transaction_changed(sender, instance, **kwargs):
+    portfolio_id = (
+        BrokerAccount.objects.filter(pk=instance.broker_account_id)
+        .values_list("portfolio_id", flat=True)
+        .first()
+    )
+    if portfolio_id is not None:
+        bump_portfolio_version_on_commit(portfolio_id)
+
+
+@receiver([post_save, post_delete], sender=CorporateAction)
+def corporate_action_changed(sender, instance, **kwargs):
+    stock_id = instance.stock_id
+    transaction.on_commit(lambda: rebuild_adjustment_index([stock_id]), robust=True)
+    bump_prices_version_on_commit()
@@ -0,0 +1,145 @@
+# portfolio/streaming.py
+"""
+Live prices from the Kite WebSocket ticker.
+
+Ticks are never written to the database one by one: each tick only
+overwrites the latest value for its instrument in Redis and marks the
+instrument dirty. flush() periodically turns all dirty instruments into
+one bulk Stock update.
+
+PriceStreamer only needs an object with KiteTicker's subscribe /
+unsubscribe / set_mode / MODE_LTP interface, so it can be driven by a
+fake ticker, or by a real KiteTicker pointed at a local WebSocket
+stand-in via its `root` argument.
+"""
+import logging
+import threading
+from datetime import datetime, timezone
+
+from portfolio.models import Holding, Stock
+from portfolio.records import to_decimal
+from portfolio.services import write_quotes
+
+logger = logging.getLogger(__name__)
+
+TICKS_KEY = "prices:ticks"                 # hash: token -> "last_price|epoch"
+DIRTY_KEY = "prices:dirty"                 # set of tokens ticked since the last flush
+FLUSHING_KEY = "prices:dirty:flushing"
+
+
+def held_instrument_tokens(broker_code="zerodha"):
+    """{instrument_token: {stock_id, ...}} for everything currently held via the broker."""
+    rows = (
+        Holding.objects.filter(broker_account__broker_type__code=broker_code)
+        .exclude(source_snapshot_id__isnull=True)
+        .values_list("source_snapshot_id", "stock_id")
+        .distinct()
+    )
+    out = {}
+    for token, stock_id in rows:
+        try:
+            out.setdefault(int(token), set()).add(stock_id)
+        except ValueError:
+            continue
+    return out
+
+
+class PriceStreamer:
+    def __init__(self, redis, token_source=held_instrument_tokens):
+        self.redis = redis
+        self.token_source = token_source
+        self.ticker = None
+        self._stocks_by_token = {}
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------
+    # Subscriptions
+    # ---------------------------------------------------------
+    def attach(self, ticker):
+        self.ticker = ticker
+        ticker.on_connect = self.on_connect
+        ticker.on_ticks = self.on_ticks
+
+    def on_connect(self, ws, response):
+        # (Re)connect: subscribe the whole current set.
+        with self._lock:
+            tokens = list(self._stocks_by_token)
+        if tokens:
+            ws.subscribe(tokens)
+            ws.set_mode(ws.MODE_LTP, tokens)
+        logger.info("Ticker connected, subscribed %d instruments", len(tokens))
+
+    def refresh_subscriptions(self):
+        """Follow holdings changes: subscribe new tokens, drop sold ones."""
+        latest = self.token_source()
+        with self._lock:
+            current = set(self._stocks_by_token)
+            self._stocks_by_token = latest
+        added = list(set(latest) - current)
+        removed = list(current - set(latest))
+
+        if self.ticker is not None and self.ticker.is_connected():
+            if added:
+                self.ticker.subscribe(added)
+                self.ticker.set_mode(self.ticker.MODE_LTP, added)
+            if removed:
+                self.ticker.unsubscribe(removed)
+        if added or removed:
+            logger.info("Subscriptions: +%d -%d (now %d)", len(added), len(removed), len(latest))
+        return added, removed
+
+    # ---------------------------------------------------------
+    # Ticks -> Redis
+    # ---------------------------------------------------------
+    def on_ticks(self, ws, ticks):
+        if not ticks:
+            return
+        now = datetime.now(timezone.utc).timestamp()
+        pipe = self.redis.pipeline(transaction=False)
+        for tick in ticks:
+            token = tick.get("instrument_token")
+            last_price = tick.get("last_price")
+            if token is None or last_price is None:
+                continue
+            ts = tick.get("exchange_timestamp") or tick.get("last_trade_time")
+            epoch = ts.replace(tzinfo=ts.tzinfo or timezone.utc).timestamp() if ts else now
+            pipe.hset(TICKS_KEY, token, f"{last_price}|{epoch}")
+            pipe.sadd(DIRTY_KEY, token)
+        pipe.execute()
+
+    # ---------------------------------------------------------
+    # Redis -> stock_prices
+    # ---------------------------------------------------------
+    def flush(self):
+        """Write the latest tick of every dirty instrument in one conditional UPDATE."""
+        pipe = self.redis.pipeline(transaction=True)
+        # Fold in anything a crashed flush left behind, then take the batch.
+        pipe.sunionstore(FLUSHING_KEY, [FLUSHING_KEY, DIRTY_KEY])
+        pipe.delete(DIRTY_KEY)
+        pipe.smembers(FLUSHING_KEY)
+        tokens = list(pipe.execute()[-1])
+        if not tokens:
+            return 0
+
+        values = self.redis.hmget(TICKS_KEY, tokens)
+        with self._lock:
+            stocks_by_token = self._stocks_by_token
+
+        quotes = {}
+        for token, value in zip(tokens, values):
+            if not value:
+                continue
+            price, epoch = value.split("|")
+            as_of = datetime.fromtimestamp(float(epoch), tz=timezone.utc)
+            for stock_id in stocks_by_token.get(int(token), ()):
+                quotes[stock_id] = (to_decimal(price), as_of)
+
+        updated = 0
+        if quotes:
+            # symbol is read by the price events write_quotes publishes.
+            stocks = list(
+                Stock.objects.filter(id__in=list(quotes)).only("id", "symbol", "as_of", "last_price")
+            )
+            updated = write_quotes(stocks, quotes)
+        self.redis.delete(FLUSHING_KEY)
+        return updated
@@ -4,3 +4,5 @@ from . import dispatcher
 # import other modules if present/expected
 from . import portfolio
 from . import broker
+from . import maintenance
+from . import prices
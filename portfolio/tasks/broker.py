@@ -1,23 +1,54 @@
 # portfolio/tasks/broker.py
+import logging
+
 from celery import shared_task
+from celery.exceptions import Retry
 from django.apps import apps
 from portfolio.triggers import registry
 from portfolio.services import persist_holdings   # <-- important
 from portfolio.debug_helpers import wait_for_debugger
+from portfolio.locks import acquire_sync_lease, extend_sync_lease, record_coalesced, release_sync_lease
+
+logger = logging.getLogger(__name__)
 
 ACTION_HANDLERS = {
     'holdings': 'fetch_holdings',
 }
 
 @shared_task(bind=True, max_retries=5, default_retry_delay=60)
-def broker_action_task(self, portfolio_id, broker_account_id, action):
+def broker_action_task(self, portfolio_id, broker_account_id, action, lease=None):
+    # Called directly (not via portfolio_sync_task): take the lease here.
+    if lease is None:
+        lease = acquire_sync_lease(broker_account_id, action)
+        if lease is None:
+            record_coalesced(broker_account_id, action)
+            return {'status': 'coalesced'}
+
+    retrying = False
+    try:
+        return _run_action(self, broker_account_id, action)
+    except Retry:
+        # Keep the lease across retries so new requests keep coalescing.
+        retrying = extend_sync_lease(broker_account_id, action, lease)
+        raise
+    except Exception as exc:
+        # Returned rather than raised: in a portfolio sync chord one failed
+        # account would otherwise keep the callback from ever running.
+        logger.exception("Broker action %s for broker_account=%s failed", action, broker_account_id)
+        return {'status': 'error', 'broker_account_id': broker_account_id, 'error': repr(exc)}
+    finally:
+        if not retrying:
+            release_sync_lease(broker_account_id, action, lease)
+
+
+def _run_action(task, broker_account_id, action):
     BrokerAccount = apps.get_model('portfolio', 'BrokerAccount')
 
     try:
         acc = BrokerAccount.objects.select_related('broker_type', 'credential').get(id=broker_account_id)
     except BrokerAccount.DoesNotExist as exc:
-        raise self.retry(exc=exc, countdown=60)
-    
+        raise task.retry(exc=exc, countdown=60)
+
     trigger_cls = registry.get_trigger_for_code(acc.broker_type.code)
     if not trigger_cls:
         return {'status': 'no_trigger'}
@@ -1,19 +1,55 @@
 # portfolio/tasks/dispatcher.py
+import hashlib
+import logging
+from collections import Counter
+
 from celery import shared_task
 from django.apps import apps
+from django.conf import settings
 from portfolio.tasks.portfolio import portfolio_sync_task
 
+logger = logging.getLogger(__name__)
+
+
+def slot_for_portfolio(portfolio_id, slots):
+    """
+    Stable slot (0..slots-1) for a portfolio.
+
+    Uses a hash of the id rather than `id % slots` so consecutive ids
+    (portfolios created together) don't land in neighbouring slots, and
+    the same portfolio always syncs at the same offset of the window.
+    """
+    digest = hashlib.blake2b(str(portfolio_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % slots
+
+
 @shared_task(bind=True)
 def active_users_data_sync_worker(self):
-    User = apps.get_model('portfolio', 'User')
     Portfolio = apps.get_model('portfolio', 'Portfolio')
 
-    active_users = User.objects.filter(active=True).values_list('id', flat=True)
-    total = 0
-    for uid in active_users:
-        pids = Portfolio.objects.filter(user_id=uid, active=True).values_list('id', flat=True)
-        for pid in pids:
-            # enqueue portfolio-level task
-            portfolio_sync_task.delay(pid)
-            total += 1
-    return {'enqueued_portfolios': total}
+    interval = getattr(settings, 'PORTFOLIO_SYNC_INTERVAL_SECONDS', 300)
+    slots = max(1, getattr(settings, 'PORTFOLIO_SYNC_SLOTS', 30))
+    slot_width = interval / slots
+
+    pids = Portfolio.objects.filter(active=True, user__active=True).values_list('id', flat=True)
+
+    per_slot = Counter()
+    for pid in pids.iterator():
+        slot = slot_for_portfolio(pid, slots)
+        # enqueue portfolio-level task at its slot offset within the window
+        portfolio_sync_task.apply_async((pid,), countdown=slot * slot_width)
+        per_slot[slot] += 1
+
+    total = sum(per_slot.values())
+    busiest = max(per_slot.values(), default=0)
+    logger.info(
+        "Dispatched %d portfolios over %d slots (%.1fs each); busiest slot=%d",
+        total, slots, slot_width, busiest,
+    )
+    return {
+        'enqueued_portfolios': total,
+        'slots': slots,
+        'slot_seconds': slot_width,
+        'max_per_slot': busiest,
+        'per_slot': {str(s): n for s, n in sorted(per_slot.items())},
+    }
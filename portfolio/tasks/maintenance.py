@@ -0,0 +1,36 @@
+# portfolio/tasks/maintenance.py
+from celery import shared_task
+from django.conf import settings
+from portfolio.instruments import refresh_instrument_index
+from portfolio.partitions import maintain_partitions
+from portfolio.performance import record_daily_closes, update_daily_values
+from portfolio.raw_snapshots import prune_raw_snapshots
+
+
+@shared_task(bind=True)
+def prune_raw_snapshots_task(self):
+    days = getattr(settings, 'RAW_SNAPSHOT_RETENTION_DAYS', 30)
+    return {'deleted': prune_raw_snapshots(days)}
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=300)
+def refresh_instruments_task(self):
+    try:
+        return {'instruments': refresh_instrument_index()}
+    except Exception as exc:
+        raise self.retry(exc=exc)
+
+
+@shared_task(bind=True)
+def manage_partitions_task(self):
+    return maintain_partitions(
+        months_ahead=getattr(settings, 'PARTITION_MONTHS_AHEAD', 3),
+        retain_months=getattr(settings, 'PARTITION_RETENTION_MONTHS', 0),
+        archive_schema=getattr(settings, 'PARTITION_ARCHIVE_SCHEMA', None) or None,
+    )
+
+
+@shared_task(bind=True)
+def record_daily_values_task(self):
+    closes = record_daily_closes()
+    return {'closes': closes, 'values': update_daily_values()}
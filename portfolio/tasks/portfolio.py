@@ -1,8 +1,26 @@
 # portfolio/tasks/portfolio.py
-from celery import shared_task, group
+import json
+import logging
+
+from celery import shared_task, chord
 from django.apps import apps
+from django.core.cache import cache
+from django.utils import timezone
+from portfolio.locks import acquire_sync_lease, record_coalesced
+from portfolio.redis_client import get_redis
+from portfolio.routing import broker_queue
+from portfolio.analytics import get_analytics
 from .broker import broker_action_task
 
+logger = logging.getLogger(__name__)
+
+SYNC_COMPLETED_CHANNEL = 'portfolio:sync:completed'
+
+
+def summary_cache_key(portfolio_id):
+    return f'portfolio:{portfolio_id}:summary'
+
+
 @shared_task(bind=True)
 def portfolio_sync_task(self, portfolio_id, actions=None):
     Portfolio = apps.get_model('portfolio', 'Portfolio')
@@ -14,13 +32,85 @@ def portfolio_sync_task(self, portfolio_id, actions=None):
     actions = actions or ['holdings']  # default actions
 
     sigs = []
+    coalesced = 0
     for acc in p.broker_accounts.select_related('broker_type').all():
         for action in actions:
-            sigs.append(broker_action_task.s(portfolio_id, acc.id, action))
+            # A sync for this account is still running: fold this request into it.
+            lease = acquire_sync_lease(acc.id, action)
+            if lease is None:
+                record_coalesced(acc.id, action)
+                coalesced += 1
+                continue
+            sigs.append(
+                broker_action_task.s(portfolio_id, acc.id, action, lease=lease)
+                .set(queue=broker_queue(acc.broker_type.code))
+            )
+
+    if coalesced:
+        logger.info("Portfolio %s: %d account sync(s) already in flight, coalesced", portfolio_id, coalesced)
 
     if not sigs:
+        if coalesced:
+            return {'status': 'coalesced', 'coalesced': coalesced}
         return {'status': 'no_brokers'}
 
-    # parallel execution of broker tasks
-    job = group(sigs).apply_async()
-    return {'group_id': job.id, 'tasks': len(sigs)}
+    # parallel execution of broker tasks; the callback runs once all of them finished
+    job = chord(sigs)(portfolio_sync_complete_task.s(portfolio_id))
+    return {'chord_id': job.id, 'tasks': len(sigs), 'coalesced': coalesced}
+
+
+@shared_task(bind=True)
+def portfolio_sync_complete_task(self, results, portfolio_id):
+    """
+    Chord callback: recompute the portfolio summary once per sync (rather
+    than once per broker account) and announce that the sync finished.
+    Accounts whose action failed are listed under "failed".
+    """
+    results = [r for r in results if isinstance(r, dict)]
+    statuses = {}
+    for r in results:
+        statuses[r.get('status')] = statuses.get(r.get('status'), 0) + 1
+    failed = [
+        {'broker_account_id': r.get('broker_account_id'), 'error': r.get('error')}
+        for r in results if r.get('status') == 'error'
+    ]
+
+    # The sync bumped the portfolio version, so this recomputes once and
+    # leaves the result cached for API readers.
+    valuation = get_analytics('valuation', portfolio_id)
+    summary = {
+        'portfolio_id': portfolio_id,
+        'computed_at': timezone.now().isoformat(),
+        'cost_value': '0',
+        'market_value': '0',
+        'holdings': 0,
+        'by_asset_type': {},
+    }
+    if valuation:
+        summary.update({
+            'currency': valuation['currency'],
+            'missing_fx': valuation['missing_fx'],
+            'cost_value': str(valuation['cost_value']),
+            'market_value': str(valuation['market_value']),
+            'holdings': valuation['holdings'],
+            'by_asset_type': {
+                asset_type: {k: str(v) if k != 'holdings' else v for k, v in values.items()}
+                for asset_type, values in valuation['by_asset_type'].items()
+            },
+        })
+
+    # Replaced by the next sync, so no expiry.
+    cache.set(summary_cache_key(portfolio_id), summary, timeout=None)
+
+    event = {
+        'portfolio_id': portfolio_id,
+        'accounts': len(results),
+        'statuses': statuses,
+        'saved': sum(r.get('saved', 0) for r in results),
+        'failed': failed,
+        'market_value': summary['market_value'],
+        'completed_at': summary['computed_at'],
+    }
+    get_redis().publish(SYNC_COMPLETED_CHANNEL, json.dumps(event))
+
+    return event
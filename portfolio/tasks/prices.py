@@ -0,0 +1,18 @@
+# portfolio/tasks/prices.py
+from celery import shared_task
+from portfolio.fx import refresh_fx_rates
+from portfolio.services import refresh_prices
+
+
+@shared_task(bind=True)
+def refresh_prices_task(self, broker_codes=None):
+    updated = refresh_prices(broker_codes)
+    return {'updated': updated, 'total': sum(updated.values())}
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=600)
+def refresh_fx_rates_task(self, source=None):
+    try:
+        return {'rates': refresh_fx_rates(source)}
+    except Exception as exc:
+        raise self.retry(exc=exc)
@@ -0,0 +1,413 @@
+# portfolio/tests.py
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import mock
+
+import redis
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from portfolio import db_router, token_cache
+from portfolio.locks import _lock_key, acquire_sync_lease, release_sync_lease
+from portfolio.models import BrokerAccount, BrokerType, Holding, Portfolio, Stock, User
+from portfolio.query_budget import assert_query_budget
+from portfolio.records import HoldingRecord
+from portfolio.redis_client import get_redis
+from portfolio.services import persist_holdings, write_quotes
+from portfolio.streaming import DIRTY_KEY, FLUSHING_KEY, TICKS_KEY, PriceStreamer
+from portfolio.tasks.broker import broker_action_task
+from portfolio.tasks.portfolio import portfolio_sync_complete_task, portfolio_sync_task
+from portfolio.triggers.base import BaseTrigger
+from portfolio.triggers.registry import register
+
+
+def redis_available():
+    try:
+        return get_redis().ping()
+    except redis.RedisError:
+        return False
+
+
+class FakeTicker:
+    """KiteTicker stand-in: records subscribe / unsubscribe / set_mode calls."""
+    MODE_LTP = "ltp"
+
+    def __init__(self, connected=True):
+        self.connected = connected
+        self.subscribed = set()
+        self.modes = {}
+
+    def is_connected(self):
+        return self.connected
+
+    def subscribe(self, tokens):
+        self.subscribed.update(tokens)
+
+    def unsubscribe(self, tokens):
+        self.subscribed.difference_update(tokens)
+
+    def set_mode(self, mode, tokens):
+        self.modes.update(dict.fromkeys(tokens, mode))
+
+
+class PriceStreamerTests(TestCase):
+    def setUp(self):
+        if not redis_available():
+            self.skipTest("Redis is not reachable")
+        self.redis = get_redis()
+        self.redis.delete(TICKS_KEY, DIRTY_KEY, FLUSHING_KEY)
+        self.addCleanup(self.redis.delete, TICKS_KEY, DIRTY_KEY, FLUSHING_KEY)
+
+        as_of = datetime.now(timezone.utc) - timedelta(minutes=5)
+        self.stocks = Stock.objects.bulk_create(
+            Stock(symbol=f"TICK{i}", asset_type="equity", as_of=as_of, last_price=Decimal("100"))
+            for i in range(30)
+        )
+        self.tokens = {1000 + i: {stock.pk} for i, stock in enumerate(self.stocks)}
+        self.streamer = PriceStreamer(self.redis, token_source=lambda: self.tokens)
+        self.streamer.refresh_subscriptions()
+
+    def test_subscriptions_follow_holdings(self):
+        ticker = FakeTicker()
+        self.streamer.attach(ticker)
+        self.streamer.on_connect(ticker, None)
+        self.assertEqual(ticker.subscribed, set(self.tokens))
+        self.assertEqual(set(ticker.modes.values()), {FakeTicker.MODE_LTP})
+
+        self.tokens = {1000: self.tokens[1000], 5000: {self.stocks[1].pk}}
+        added, removed = self.streamer.refresh_subscriptions()
+        self.assertEqual(added, [5000])
+        self.assertEqual(len(removed), len(self.stocks) - 1)
+        self.assertEqual(ticker.subscribed, {1000, 5000})
+
+    def test_flush_writes_only_the_latest_tick_per_instrument(self):
+        t0 = datetime.now(timezone.utc)
+        # Two instruments share a stock mapping; 1000 ticks three times.
+        self.tokens[1001] = {self.stocks[1].pk, self.stocks[2].pk}
+        self.streamer.refresh_subscriptions()
+        self.streamer.on_ticks(None, [
+            {"instrument_token": 1000, "last_price": 101, "exchange_timestamp": t0},
+            {"instrument_token": 1000, "last_price": 102, "exchange_timestamp": t0 + timedelta(seconds=1)},
+            {"instrument_token": 1001, "last_price": 55, "exchange_timestamp": t0},
+        ])
+        self.streamer.on_ticks(None, [
+            {"instrument_token": 1000, "last_price": 103, "exchange_timestamp": t0 + timedelta(seconds=2)},
+            {"instrument_token": 9999, "last_price": 1},             # not held
+            {"instrument_token": 1002},                              # no price
+        ])
+
+        with assert_query_budget(2):
+            self.assertEqual(self.streamer.flush(), 3)
+        prices = dict(Stock.objects.filter(pk__in=[s.pk for s in self.stocks[:4]]).values_list("symbol", "last_price"))
+        self.assertEqual(prices, {
+            "TICK0": Decimal("103"), "TICK1": Decimal("55"), "TICK2": Decimal("55"), "TICK3": Decimal("100"),
+        })
+
+        # Nothing ticked since: no queries at all.
+        with assert_query_budget(0):
+            self.assertEqual(self.streamer.flush(), 0)
+
+    def test_flush_skips_ticks_older_than_the_stored_price(self):
+        old = datetime.now(timezone.utc) - timedelta(hours=1)
+        self.streamer.on_ticks(None, [{"instrument_token": 1000, "last_price": 1, "exchange_timestamp": old}])
+        self.assertEqual(self.streamer.flush(), 0)
+        self.assertEqual(Stock.objects.get(pk=self.stocks[0].pk).last_price, Decimal("100"))
+
+    def test_flush_query_count_does_not_grow_with_ticks(self):
+        self.streamer.on_ticks(None, [
+            {"instrument_token": 1000 + i, "last_price": 101 + i} for i in range(len(self.stocks))
+        ])
+        # One SELECT of the dirty stocks and one conditional UPDATE; building the
+        # price events must not lazy-load anything per stock.
+        with assert_query_budget(2):
+            updated = self.streamer.flush()
+
+        self.assertEqual(updated, len(self.stocks))
+        self.assertEqual(Stock.objects.get(pk=self.stocks[0].pk).last_price, Decimal("101"))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+@override_settings(DATABASE_REPLICAS=["replica"], REPLICA_MAX_LAG_SECONDS=5)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = db_router.ReplicaRouter()
+        db_router.reset_pinning()
+        self.addCleanup(db_router.reset_pinning)
+        self.addCleanup(db_router._lag.clear)
+        self.lag_patch = mock.patch("portfolio.db_router.replica_lag", return_value=0.0)
+        self.replica_lag = self.lag_patch.start()
+        self.addCleanup(self.lag_patch.stop)
+
+    def test_reads_use_replica_only_when_opted_in(self):
+        self.assertEqual(self.router.db_for_read(Stock), "default")
+        with db_router.replica_reads():
+            self.assertEqual(self.router.db_for_read(Stock), "replica")
+        self.assertEqual(self.router.db_for_read(Stock), "default")
+
+    def test_write_pins_reads_to_primary_until_next_request(self):
+        with db_router.replica_reads():
+            self.assertEqual(self.router.db_for_write(Stock), "default")
+            self.assertEqual(self.router.db_for_read(Stock), "default")
+            request_started.send(sender=self.__class__)
+            self.assertEqual(self.router.db_for_read(Stock), "replica")
+
+    def test_reads_inside_a_transaction_stay_on_primary(self):
+        with mock.patch.object(db_router.connections["default"], "in_atomic_block", True):
+            with db_router.replica_reads():
+                self.assertEqual(self.router.db_for_read(Stock), "default")
+
+    def test_lagging_or_unreachable_replica_falls_back_to_primary(self):
+        with db_router.replica_reads():
+            for lag in (5.0, 5.1, None):
+                self.replica_lag.return_value = lag
+                expected = "replica" if lag == 5.0 else "default"
+                self.assertEqual(self.router.db_for_read(Stock), expected, lag)
+
+    def test_lag_is_measured_once_per_interval(self):
+        self.lag_patch.stop()       # exercise the real one; SQLite has no lag
+        with override_settings(REPLICA_LAG_CHECK_SECONDS=60):
+            self.assertEqual(db_router.replica_lag("default"), 0.0)
+            db_router._lag["default"] = (db_router._lag["default"][0], 7.0)
+            self.assertEqual(db_router.replica_lag("default"), 7.0)
+        with override_settings(REPLICA_LAG_CHECK_SECONDS=0):
+            self.assertEqual(db_router.replica_lag("default"), 0.0)
+
+
+@mock.patch("portfolio.token_cache._ensure_subscriber")
+class TokenCacheTests(SimpleTestCase):
+    def setUp(self):
+        token_cache.invalidate()
+        self.addCleanup(token_cache.invalidate)
+
+    def test_payload_is_cached_until_invalidated(self, _subscriber):
+        loader = mock.Mock(side_effect=[("old", None), ("new", None)])
+        self.assertEqual(token_cache.get_token_payload(7, loader), ("old", None))
+        self.assertEqual(token_cache.get_token_payload(7, loader), ("old", None))
+        token_cache.invalidate("7")
+        self.assertEqual(token_cache.get_token_payload(7, loader), ("new", None))
+        self.assertEqual(loader.call_count, 2)
+
+    def test_invalidation_during_load_is_not_overwritten(self, _subscriber):
+        def stale_loader():
+            token_cache.invalidate(7)       # refresher publishes mid-load
+            return "stale", None
+
+        self.assertEqual(token_cache.get_token_payload(7, stale_loader), ("stale", None))
+        self.assertEqual(token_cache.get_token_payload(7, lambda: ("fresh", None)), ("fresh", None))
+
+        def clearing_loader():
+            token_cache.invalidate()
+            return "stale", None
+
+        token_cache.invalidate(7)
+        token_cache.get_token_payload(7, clearing_loader)
+        self.assertEqual(token_cache.get_token_payload(7, lambda: ("fresh", None)), ("fresh", None))
+
+
+class WriteQuotesTests(TestCase):
+    def test_newer_price_written_after_the_read_is_kept(self):
+        t0 = datetime(2026, 10, 19, 9, 15, tzinfo=timezone.utc)
+        a, b = Stock.objects.bulk_create([
+            Stock(symbol="WQA", asset_type="equity", as_of=t0, last_price=Decimal("10")),
+            Stock(symbol="WQB", asset_type="equity", as_of=t0, last_price=Decimal("20")),
+        ])
+        stocks = list(Stock.objects.filter(pk__in=[a.pk, b.pk]).only("id", "symbol", "as_of", "last_price"))
+        # Another writer lands a fresher price for A between our read and write.
+        Stock.objects.filter(pk=a.pk).update(last_price=Decimal("12"), as_of=t0 + timedelta(minutes=2))
+
+        quotes = {
+            a.pk: (Decimal("11"), t0 + timedelta(minutes=1)),
+            b.pk: (Decimal("21"), t0 + timedelta(minutes=1)),
+        }
+        self.assertEqual(write_quotes(stocks, quotes), 1)
+        prices = dict(Stock.objects.filter(pk__in=[a.pk, b.pk]).values_list("symbol", "last_price"))
+        self.assertEqual(prices, {"WQA": Decimal("12"), "WQB": Decimal("21")})
+        self.assertEqual(write_quotes(stocks, quotes), 0)
+
+
+class ReadApiAccessTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create(email="owner@example.com")
+        other = User.objects.create(email="other@example.com")
+        self.portfolio = Portfolio.objects.create(user=owner, name="Main")
+        self.other_portfolio = Portfolio.objects.create(user=other, name="Other")
+        self.owner = owner
+        self.other = other
+        self.client.force_login(
+            get_user_model().objects.create_user("owner", email="Owner@example.com", password="x")
+        )
+
+    def test_owner_reads_own_portfolio(self):
+        for name in ("holdings", "transactions", "values"):
+            response = self.client.get(reverse(f"api-portfolio-{name}", args=[self.portfolio.pk]))
+            self.assertEqual(response.status_code, 200, name)
+        response = self.client.get(reverse("api-user-portfolios", args=[self.owner.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_impossible_dates_are_bad_requests(self):
+        url = reverse("api-portfolio-values", args=[self.portfolio.pk])
+        for params in ({"until": "2020-13-01"}, {"since": "2020-02-30"}, {"since": "yesterday"}):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+    def test_other_users_data_is_not_found(self):
+        for name in ("holdings", "transactions", "analytics", "values"):
+            response = self.client.get(reverse(f"api-portfolio-{name}", args=[self.other_portfolio.pk]))
+            self.assertEqual(response.status_code, 404, name)
+        response = self.client.get(reverse("api-user-portfolios", args=[self.other.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_etag_does_not_skip_the_check(self):
+        url = reverse("api-portfolio-holdings", args=[self.other_portfolio.pk])
+        staff = get_user_model().objects.create_user("staff", password="x", is_staff=True)
+        self.client.force_login(staff)
+        etag = self.client.get(url)["ETag"]
+
+        self.client.force_login(get_user_model().objects.get(username="owner"))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_staff_reads_everything(self):
+        self.client.force_login(get_user_model().objects.create_user("staff", password="x", is_staff=True))
+        response = self.client.get(reverse("api-portfolio-holdings", args=[self.other_portfolio.pk]))
+        self.assertEqual(response.status_code, 200)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create(email="owner@example.com")
+        other = User.objects.create(email="other@example.com")
+        broker = BrokerType.objects.create(code="zerodha", display_name="Zerodha")
+        stock = Stock.objects.create(
+            symbol="INFY", asset_type="equity", as_of=datetime.now(timezone.utc), last_price=Decimal("1500"),
+        )
+        for user in (owner, other):
+            portfolio = Portfolio.objects.create(user=user, name=user.email)
+            account = BrokerAccount.objects.create(portfolio=portfolio, broker_type=broker, external_account_id=user.email)
+            Holding.objects.create(
+                broker_account=account, stock=stock, quantity=Decimal("1"), avg_price=Decimal("1000"),
+                as_of=datetime.now(timezone.utc),
+            )
+        self.client.force_login(
+            get_user_model().objects.create_user("owner", email="owner@example.com", password="x")
+        )
+
+    def test_export_only_contains_own_portfolios(self):
+        response = self.client.get(reverse("api-export", args=["holdings"]), {"format": "ndjson"})
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        own = Portfolio.objects.get(name="owner@example.com")
+        self.assertEqual({row["portfolio_id"] for row in rows}, {own.pk})
+
+    def test_bad_filters_are_rejected(self):
+        for params in ({"portfolio": "abc"}, {"since": "2020-13-01"}, {"until": "2020-02-30T10:00:00"}):
+            response = self.client.get(reverse("api-export", args=["transactions"]), params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@register("BUDGETTEST")
+class BudgetTestTrigger(BaseTrigger):
+    """Two holdings, no network."""
+
+    def fetch_holdings(self):
+        now = datetime.now(timezone.utc)
+        return {"status": "ok", "data": [
+            HoldingRecord("BT1", "10", "100", last_price="110", price_as_of=now, as_of=now),
+            HoldingRecord("BT2", "5", "200", last_price="190", price_as_of=now, as_of=now),
+        ]}
+
+
+class BudgetTestAccountMixin:
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="owner@example.com")
+        self.portfolio = Portfolio.objects.create(user=self.user, name="Main")
+        broker = BrokerType.objects.create(code="BUDGETTEST", display_name="Budget test")
+        self.account = BrokerAccount.objects.create(
+            portfolio=self.portfolio, broker_type=broker, external_account_id="1",
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PersistHoldingsTests(BudgetTestAccountMixin, TestCase):
+    def test_unreadable_items_do_not_close_holdings(self):
+        persist_holdings(self.account, BudgetTestTrigger(self.account).fetch_holdings())
+        now = datetime.now(timezone.utc)
+        snapshot = {"status": "ok", "data": [
+            HoldingRecord("BT1", "10", "100", last_price="110", price_as_of=now, as_of=now),
+            {"symbol": "", "quantity": "5"},
+            "garbage",
+        ]}
+        persist_holdings(self.account, snapshot)
+        self.assertEqual(
+            set(Holding.objects.filter(broker_account=self.account).values_list("stock__symbol", flat=True)),
+            {"BT1", "BT2"},
+        )
+
+        # A clean complete snapshot still removes what was sold.
+        persist_holdings(self.account, {"status": "ok", "data": snapshot["data"][:1]})
+        self.assertEqual(
+            list(Holding.objects.filter(broker_account=self.account).values_list("stock__symbol", flat=True)),
+            ["BT1"],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QueryBudgetTests(BudgetTestAccountMixin, TestCase):
+    """Hot paths pinned to their measured query counts; a new N+1 fails here."""
+
+    # Budgets include the SAVEPOINT / RELEASE that TestCase turns
+    # persist_holdings' transaction into.
+
+    def test_persist_holdings(self):
+        data = BudgetTestTrigger(self.account).fetch_holdings()
+        with assert_query_budget(7, max_duplicates=1):
+            self.assertEqual(persist_holdings(self.account, data), 2)
+        # Unchanged snapshot: prices are fresh, so nothing is repriced.
+        with assert_query_budget(7, max_duplicates=1):
+            persist_holdings(self.account, data)
+
+    def test_broker_action_task(self):
+        if not redis_available():
+            self.skipTest("Redis is not reachable")
+        lease = acquire_sync_lease(self.account.pk, "holdings")
+        self.addCleanup(release_sync_lease, self.account.pk, "holdings", lease)
+        with assert_query_budget(7, max_duplicates=1):
+            result = broker_action_task.apply(
+                args=[self.portfolio.pk, self.account.pk, "holdings"], kwargs={"lease": lease},
+            ).get()
+        self.assertEqual(result, {"status": "ok", "saved": 2})
+
+    def test_portfolio_sync_tasks(self):
+        if not redis_available():
+            self.skipTest("Redis is not reachable")
+        self.addCleanup(get_redis().delete, _lock_key(self.account.pk, "holdings"))
+        with mock.patch("portfolio.tasks.portfolio.chord") as chord, \
+                assert_query_budget(2, max_duplicates=1):
+            portfolio_sync_task.apply(args=[self.portfolio.pk]).get()
+        self.assertEqual(len(chord.call_args[0][0]), 1)
+
+        persist_holdings(self.account, BudgetTestTrigger(self.account).fetch_holdings())
+        with assert_query_budget(2, max_duplicates=1):
+            event = portfolio_sync_complete_task.apply(
+                args=[[{"status": "ok", "saved": 2}], self.portfolio.pk],
+            ).get()
+        self.assertEqual(event["saved"], 2)
+
+    def test_read_api_pages(self):
+        # Session, auth user, ownership check, page.
+        self.client.force_login(
+            get_user_model().objects.create_user("owner", email="owner@example.com", password="x")
+        )
+        persist_holdings(self.account, BudgetTestTrigger(self.account).fetch_holdings())
+        for name in ("holdings", "transactions", "values"):
+            with assert_query_budget(4, max_duplicates=1):
+                response = self.client.get(reverse(f"api-portfolio-{name}", args=[self.portfolio.pk]))
+            self.assertEqual(response.status_code, 200, name)
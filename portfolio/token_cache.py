@@ -0,0 +1,128 @@
+# portfolio/token_cache.py
+"""
+Per-process cache of parsed broker access-token payloads.
+
+Tokens change about once a day, so workers keep the parsed payload (with
+its expiry already turned into a datetime) in memory and only go back to
+Redis when:
+  - a token refresher published an invalidation for the account on
+    INVALIDATION_CHANNEL (see kite_generate_token),
+  - the token is within KITE_TOKEN_REFRESH_MARGIN_SECONDS of expiring, or
+  - the entry is older than KITE_TOKEN_CACHE_SECONDS (safety net in case
+    an invalidation message was missed).
+
+Every invalidation bumps a generation counter; a payload loaded while an
+invalidation arrived is returned to its caller but not cached.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+
+from portfolio.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "kite:token:invalidate"
+
+_entries = {}          # broker_account_id -> (payload, expires_at, cached_at)
+_generations = {}      # broker_account_id -> invalidations seen; None -> full clears
+_lock = threading.Lock()
+_subscriber_pid = None
+
+
+def publish_token_invalidation(broker_account_id):
+    """Tell every worker to drop its cached token for this account."""
+    return get_redis().publish(INVALIDATION_CHANNEL, str(broker_account_id))
+
+
+def invalidate(broker_account_id=None):
+    with _lock:
+        if broker_account_id is not None:
+            broker_account_id = int(broker_account_id)
+        if broker_account_id is None:
+            _entries.clear()
+        else:
+            _entries.pop(broker_account_id, None)
+        _generations[broker_account_id] = _generations.get(broker_account_id, 0) + 1
+
+
+def _generation(broker_account_id):
+    return _generations.get(None, 0), _generations.get(int(broker_account_id), 0)
+
+
+def _on_message(message):
+    data = message.get("data")
+    try:
+        invalidate(int(data))
+    except (TypeError, ValueError):
+        invalidate()    # unknown payload: drop everything
+    logger.info("Access token cache invalidated for %s", data)
+
+
+def _ensure_subscriber():
+    """Start the pub/sub listener once per process (prefork children included)."""
+    global _subscriber_pid
+    pid = os.getpid()
+    if _subscriber_pid == pid:
+        return
+    with _lock:
+        if _subscriber_pid == pid:
+            return
+        # Entries inherited from a parent process were never covered by a listener.
+        _entries.clear()
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATION_CHANNEL: _on_message})
+            pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+        except Exception:
+            logger.exception("Could not subscribe to %s; relying on cache TTL", INVALIDATION_CHANNEL)
+        _subscriber_pid = pid
+
+
+def parse_expires_at(value):
+    """ISO string -> aware datetime (None if absent or unparsable)."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        logger.warning("Cannot parse expires_at=%s; treating token as valid", value)
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def get_token_payload(broker_account_id, loader):
+    """
+    Cached (payload, expires_at) for an account. `loader()` reads the source
+    of truth and returns (payload, expires_at) or None; None is not cached.
+    """
+    _ensure_subscriber()
+
+    max_age = getattr(settings, "KITE_TOKEN_CACHE_SECONDS", 3600)
+    margin = timedelta(seconds=getattr(settings, "KITE_TOKEN_REFRESH_MARGIN_SECONDS", 300))
+
+    entry = _entries.get(broker_account_id)
+    if entry is not None:
+        payload, expires_at, cached_at = entry
+        fresh = time.monotonic() - cached_at < max_age
+        near_expiry = expires_at is not None and expires_at - margin <= datetime.now(timezone.utc)
+        if fresh and not near_expiry:
+            return payload, expires_at
+
+    generation = _generation(broker_account_id)
+    loaded = loader()
+    if loaded is None:
+        invalidate(broker_account_id)
+        return None
+    payload, expires_at = loaded
+    with _lock:
+        # An invalidation during loader() may mean this payload is already stale.
+        if _generation(broker_account_id) == generation:
+            _entries[broker_account_id] = (payload, expires_at, time.monotonic())
+    return payload, expires_at
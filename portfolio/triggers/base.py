@@ -1,9 +1,26 @@
 from abc import ABC, abstractmethod
 
 class BaseTrigger(ABC):
+    # Max instruments per quote call; 0 means the broker has no quote support
+    # and prices only come from holdings sync.
+    QUOTE_BATCH_SIZE = 0
+
     def __init__(self, broker_account):
         self.broker_account = broker_account
 
     @abstractmethod
     def fetch_holdings(self):
+        """
+        Return {"status": "ok", "data": [...]} where data is a list of
+        portfolio.records.HoldingRecord (or a HoldingBatch for large
+        accounts), or {"status": "error", "error": "..."}.
+        """
         raise NotImplementedError
+
+    def fetch_quotes(self, stocks):
+        """
+        Latest prices for up to QUOTE_BATCH_SIZE Stock rows in one API call.
+        Return {stock.id: (last_price: Decimal, as_of: datetime)}; raise on
+        auth/API errors.
+        """
+        return {}
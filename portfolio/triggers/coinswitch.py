@@ -3,10 +3,11 @@
 import logging
 from typing import Dict, Any, Optional
 
-import requests
 from cryptography.hazmat.primitives.asymmetric import ed25519
 from django.utils import timezone
 
+from portfolio.http import get_http_session
+from portfolio.records import DECIMAL_ZERO, HoldingRecord, to_decimal
 from .registry import register
 from .base import BaseTrigger
 
@@ -14,6 +15,9 @@ logger = logging.getLogger(__name__)
 
 BASE_URL = "https://coinswitch.co"
 
+# Fields of the raw portfolio item kept on Holding.meta; the full item lives in RawSnapshot.
+META_FIELDS = ("current_value", "buy_rate", "sell_rate")
+
 
 @register("coinswitch")
 class CoinSwitchTrigger(BaseTrigger):
@@ -55,7 +59,7 @@ class CoinSwitchTrigger(BaseTrigger):
         Returns serverTime (epoch ms).
         """
         url = f"{BASE_URL}/trade/api/v2/time"
-        resp = requests.get(url, headers={"Content-Type": "application/json"}, json={})
+        resp = get_http_session().get(url, headers={"Content-Type": "application/json"}, json={})
         resp.raise_for_status()
         data = resp.json()
         return int(data["serverTime"])
@@ -98,7 +102,7 @@ class CoinSwitchTrigger(BaseTrigger):
             "X-AUTH-EPOCH": epoch_ms,
         }
 
-        resp = requests.get(url, headers=headers, json={})
+        resp = get_http_session().get(url, headers=headers, json={})
         resp.raise_for_status()
         return resp.json()
 
@@ -136,6 +140,7 @@ class CoinSwitchTrigger(BaseTrigger):
 
         now = timezone.now()
         output = []
+        failed_items = 0
 
         for item in holdings_raw:
             try:
@@ -146,52 +151,47 @@ class CoinSwitchTrigger(BaseTrigger):
 
                 # ---- Quantity ----
                 # Use main_balance as the quantity (can be "0" string).
-                quantity = float(item.get("main_balance") or 0.0)
+                quantity = to_decimal(item.get("main_balance"), DECIMAL_ZERO)
 
                 # ---- Average price ----
                 # buy_average_price is given as string in INR.
-                avg_price = float(item.get("buy_average_price") or 0.0)
+                avg_price = to_decimal(item.get("buy_average_price"), DECIMAL_ZERO)
 
                 # ---- Last price ----
                 # Prefer sell_rate, then buy_rate, else infer from current_value / quantity.
-                last_price_raw = item.get("sell_rate") or item.get("buy_rate")
-                if last_price_raw is None and quantity:
-                    current_value = item.get("current_value")
+                last_price = to_decimal(item.get("sell_rate") or item.get("buy_rate"))
+                if last_price is None and quantity:
+                    current_value = to_decimal(item.get("current_value"))
                     if current_value is not None:
-                        try:
-                            last_price_raw = float(current_value) / float(quantity or 1)
-                        except Exception:
-                            last_price_raw = 0.0
-                last_price = float(last_price_raw or 0.0)
-
-                # Crypto has no real "close_price" from this API, keep None.
-                close_price = None
+                        last_price = current_value / quantity
 
-                output.append({
+                output.append(HoldingRecord(
                     # --- Stock fields (for Stock model) ---
-                    "symbol": currency,        # e.g. "BTC", "ETH", "SHIB"
-                    "isin": None,             # crypto has no ISIN
-                    "asset_type": "crypto",   # distinguish from equity, mf, etc.
-                    "last_price": last_price,
-                    "close_price": close_price,
-
-                    # Price snapshot timestamp
-                    "price_as_of": now,
-
+                    currency,                 # e.g. "BTC", "ETH", "SHIB"
                     # --- Holding fields (for Holding model) ---
-                    "quantity": quantity,
-                    "avg_price": avg_price,
-                    "currency": "INR",        # all values are INR
-                    "as_of": now,
-                    "source_snapshot_id": currency,  # stable identifier
-                    "meta": item,             # keep full raw for debugging
-                })
+                    quantity,
+                    avg_price,
+                    isin=None,                # crypto has no ISIN
+                    asset_type="crypto",      # distinguish from equity, mf, etc.
+                    last_price=last_price or DECIMAL_ZERO,
+                    # Crypto has no real "close_price" from this API, keep None.
+                    close_price=None,
+                    # Price snapshot timestamp
+                    price_as_of=now,
+                    currency="INR",           # all values are INR
+                    as_of=now,
+                    source_snapshot_id=currency,  # stable identifier
+                    meta={k: item[k] for k in META_FIELDS if item.get(k) is not None},
+                ))
             except Exception:
                 logger.exception("Error normalizing CoinSwitch holding item: %r", item)
+                failed_items += 1
                 continue
 
         return {
             "status": "ok",
+            # a skipped item must not be reconciled away as "sold"
+            "complete": failed_items == 0,
             "data": output,
             "raw": {
                 "holdings": holdings_raw,
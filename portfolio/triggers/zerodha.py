@@ -7,13 +7,23 @@ from datetime import datetime, timezone
 from typing import Optional, Dict
 
 from kiteconnect import KiteConnect
-import redis
 
 from portfolio.debug_helpers import wait_for_debugger
-from django.conf import settings
+from portfolio.http import get_http_session
+from portfolio.instruments import asset_type_for, get_instrument_index
+from portfolio.records import HoldingRecord, to_decimal
+from portfolio.redis_client import get_redis
+from portfolio.token_cache import get_token_payload, parse_expires_at
 
 logger = logging.getLogger(__name__)
 
+# Fields of the raw Kite holding kept on Holding.meta; the full item lives in RawSnapshot.
+META_FIELDS = ("exchange", "instrument_token", "product", "t1_quantity", "collateral_quantity")
+
+# Exchange used to address instruments in quote calls ("NSE:INFY") when the
+# instrument index has no listing for the symbol.
+DEFAULT_EXCHANGE = "NSE"
+
 
 @register("zerodha")
 class ZerodhaTrigger(BaseTrigger):
@@ -34,6 +44,9 @@ class ZerodhaTrigger(BaseTrigger):
     DB is only backup for api_key / api_secret.
     """
 
+    # Kite's /quote/ltp accepts up to 1000 instruments per call.
+    QUOTE_BATCH_SIZE = 1000
+
     def __init__(self, broker_account):
         super().__init__(broker_account)
 
@@ -45,8 +58,7 @@ class ZerodhaTrigger(BaseTrigger):
 
         self.broker_account = broker_account
 
-        redis_url = getattr(settings, "REDIS_URL", "redis://127.0.0.1:6379/0")
-        self._redis = redis.from_url(redis_url, decode_responses=True)
+        self._redis = get_redis()
 
         # UPDATED KEY
         self._redis_key = f"broker:{self.broker_account.id}:kite"
@@ -82,38 +94,32 @@ class ZerodhaTrigger(BaseTrigger):
             logger.exception("Invalid JSON in Redis key %s: %s", self._redis_key, e)
             return None
 
-    def _redis_token_is_valid(self, payload: Dict) -> bool:
-        """Check expires_at if present."""
-        expires_at = payload.get("expires_at")
-        if not expires_at:
-            return True
-
-        try:
-            dt = datetime.fromisoformat(expires_at)
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            return dt > datetime.now(timezone.utc)
-        except Exception:
-            logger.warning("Cannot parse expires_at=%s; treating token as valid", expires_at)
-            return True
+    def _load_token(self):
+        """Loader for the token cache: (payload, parsed expires_at) or None."""
+        payload = self._get_access_info_from_redis()
+        if not payload:
+            return None
+        return payload, parse_expires_at(payload.get("expires_at"))
 
     # -------------------------------------------------------------
     # Token resolver
     # -------------------------------------------------------------
     def get_access_token(self) -> Dict:
         """
-        Always read access token from Redis.
+        Read the access token, served from the per-process token cache
+        (Redis is only hit when the token changed or is about to expire).
         If invalid/missing, instruct admin to regenerate.
         """
 
-        payload = self._get_access_info_from_redis()
-        if not payload:
+        cached = get_token_payload(self.broker_account.id, self._load_token)
+        if not cached:
             raise RuntimeError(
                 f"Redis entry '{self._redis_key}' missing or invalid.\n"
                 f"Expected JSON like:\n{json.dumps({'api_key':'...', 'api_secret':'...', 'access_token':'...', 'expires_at':'...'}, indent=2)}"
             )
+        payload, expires_at = cached
 
-        if not self._redis_token_is_valid(payload):
+        if expires_at is not None and expires_at <= datetime.now(timezone.utc):
             raise RuntimeError(
                 f"Access token under Redis key '{self._redis_key}' is expired.\n"
                 f"Please run: python manage.py kite_generate_token --broker-id {self.broker_account.id}"
@@ -145,6 +151,7 @@ class ZerodhaTrigger(BaseTrigger):
             return {"status": "error", "error": "api_key missing in Redis or DB."}
 
         kite = KiteConnect(api_key=api_key)
+        kite.reqsession = get_http_session()   # pooled, instead of a new session per sync
         kite.set_access_token(access_token)
 
         try:
@@ -158,32 +165,32 @@ class ZerodhaTrigger(BaseTrigger):
             output = []
             now = datetime.now(timezone.utc)
 
+            instruments = get_instrument_index()
+
             for item in holdings_raw:
-                quantity = float(item.get("quantity", 0) or 0)
-                avg_price = float(item.get("average_price", 0) or 0)
-                last_price = float(item.get("last_price", 0) or 0)
-                close_price = item.get("close_price")
+                # `product` (CNC/MIS/...) is an order type, not an asset type:
+                # resolve the instrument from the shared index instead.
+                inst = None
+                if instruments is not None and item.get("instrument_token"):
+                    inst = instruments.by_token(item["instrument_token"])
 
-                output.append({
+                output.append(HoldingRecord(
                     # --- Stock fields ---
-                    "symbol": item.get("tradingsymbol"),
-                    "isin": item.get("isin"),
-                    # you can refine this mapping later if needed
-                    "asset_type": item.get("product") or "equity",
-                    "last_price": last_price,
-                    "close_price": close_price,
-
-                    # price timestamp (you could use Zerodha timestamp if available)
-                    "price_as_of": now,
-
+                    item.get("tradingsymbol"),
                     # --- Holding fields ---
-                    "quantity": quantity,
-                    "avg_price": avg_price,
-                    "currency": "INR",
-                    "as_of": now,
-                    "source_snapshot_id": item.get("instrument_token"),
-                    "meta": item,
-                })
+                    item.get("quantity"),
+                    item.get("average_price"),
+                    isin=item.get("isin") or (inst.isin if inst else None) or None,
+                    asset_type=asset_type_for(inst) if inst else "equity",
+                    last_price=item.get("last_price"),
+                    close_price=item.get("close_price"),
+                    # price timestamp (you could use Zerodha timestamp if available)
+                    price_as_of=now,
+                    currency="INR",
+                    as_of=now,
+                    source_snapshot_id=item.get("instrument_token"),
+                    meta={k: item.get(k) for k in META_FIELDS if item.get(k) is not None},
+                ))
 
             return {
                 "status": "ok",
@@ -197,3 +204,33 @@ class ZerodhaTrigger(BaseTrigger):
         except Exception as e:
             logger.exception("Error calling Kite holdings: %s", e)
             return {"status": "error", "error": str(e)}
+
+    # -------------------------------------------------------------
+    # Quotes (used by services.refresh_prices)
+    # -------------------------------------------------------------
+    def fetch_quotes(self, stocks):
+        token_info = self.get_access_token()
+        api_key = token_info["api_key"]
+        if not api_key:
+            raise RuntimeError("api_key missing in Redis or DB.")
+
+        kite = KiteConnect(api_key=api_key)
+        kite.reqsession = get_http_session()   # pooled, instead of a new session per sync
+        kite.set_access_token(token_info["access_token"])
+
+        instruments = get_instrument_index()
+        keys = {}
+        for stock in stocks:
+            inst = instruments.equity(stock.symbol) if instruments is not None else None
+            key = f"{inst.exchange}:{inst.tradingsymbol}" if inst else f"{DEFAULT_EXCHANGE}:{stock.symbol}"
+            keys[key] = stock.id
+        now = datetime.now(timezone.utc)
+
+        quotes = {}
+        for key, quote in kite.ltp(list(keys)).items():
+            stock_id = keys.get(key)
+            last_price = quote.get("last_price")
+            if stock_id is None or last_price is None:
+                continue
+            quotes[stock_id] = (to_decimal(last_price), now)
+        return quotes
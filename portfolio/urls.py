@@ -0,0 +1,13 @@
+from django.urls import path
+
+from portfolio import views
+
+urlpatterns = [
+    path('users/<int:user_id>/portfolios/', views.user_portfolios, name='api-user-portfolios'),
+    path('portfolios/<int:portfolio_id>/holdings/', views.portfolio_holdings, name='api-portfolio-holdings'),
+    path('portfolios/<int:portfolio_id>/transactions/', views.portfolio_transactions,
+         name='api-portfolio-transactions'),
+    path('portfolios/<int:portfolio_id>/values/', views.portfolio_values, name='api-portfolio-values'),
+    path('portfolios/<int:portfolio_id>/analytics/', views.portfolio_analytics, name='api-portfolio-analytics'),
+    path('exports/<str:kind>/', views.export, name='api-export'),
+]
@@ -0,0 +1,120 @@
+# portfolio/versions.py
+"""
+Data version counters kept in the default (django_redis) cache.
+
+Anything derived from a portfolio's data (API pages, ETags, analytics) is
+keyed by these versions, so bumping a counter invalidates all of it at
+once without having to find and delete individual cache keys:
+
+  - portfolio version: holdings / transactions / broker accounts changed
+  - prices version:    any Stock price changed (global)
+  - user version:      the user's list of portfolios changed
+  - fx version:        FX rates were refreshed (global)
+  - values version:    the portfolio's daily value series was (re)computed
+
+Writers bump after commit (bump_*_on_commit) so readers never cache data
+from a transaction that later rolls back. Those bumps are robust: a cache
+outage is logged instead of failing the write that already committed.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _key(*parts):
+    return "version:" + ":".join(str(p) for p in parts)
+
+
+def _get(key):
+    value = cache.get(key)
+    if value is None:
+        # Seed from the clock rather than 0 so a cache flush can never make
+        # an old ETag / cache key valid again.
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def _bump(key):
+    try:
+        return cache.incr(key)
+    except ValueError:      # key missing (never read, or evicted)
+        _get(key)
+        return cache.incr(key)
+
+
+def portfolio_version(portfolio_id):
+    return _get(_key("portfolio", portfolio_id))
+
+
+def prices_version():
+    return _get(_key("prices"))
+
+
+def user_version(user_id):
+    return _get(_key("user", user_id))
+
+
+def fx_version():
+    return _get(_key("fx"))
+
+
+def values_version(portfolio_id):
+    return _get(_key("values", portfolio_id))
+
+
+# kind -> key parts; per-portfolio kinds take the portfolio id.
+_KINDS = {
+    "portfolio": lambda pid: ("portfolio", pid),
+    "values": lambda pid: ("values", pid),
+    "prices": lambda pid: ("prices",),
+    "fx": lambda pid: ("fx",),
+}
+
+
+def current_versions(portfolio_id, kinds):
+    """[version of each kind] for one portfolio, read in a single round trip."""
+    keys = [_key(*_KINDS[kind](portfolio_id)) for kind in kinds]
+    found = cache.get_many(keys)
+    return [found[key] if key in found else _get(key) for key in keys]
+
+
+def bump_portfolio_version(portfolio_id):
+    return _bump(_key("portfolio", portfolio_id))
+
+
+def bump_prices_version():
+    return _bump(_key("prices"))
+
+
+def bump_user_version(user_id):
+    return _bump(_key("user", user_id))
+
+
+def bump_fx_version():
+    return _bump(_key("fx"))
+
+
+def bump_values_version(portfolio_id):
+    return _bump(_key("values", portfolio_id))
+
+
+def bump_portfolio_version_on_commit(portfolio_id):
+    transaction.on_commit(lambda: bump_portfolio_version(portfolio_id), robust=True)
+
+
+def bump_prices_version_on_commit():
+    transaction.on_commit(bump_prices_version, robust=True)
+
+
+def bump_user_version_on_commit(user_id):
+    transaction.on_commit(lambda: bump_user_version(user_id), robust=True)
+
+
+def bump_fx_version_on_commit():
+    transaction.on_commit(bump_fx_version, robust=True)
+
+
+def bump_values_version_on_commit(portfolio_id):
+    transaction.on_commit(lambda: bump_values_version(portfolio_id), robust=True)
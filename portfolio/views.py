@@ -0,0 +1,329 @@
+# portfolio/views.py
+"""
+Read-only JSON API for portfolios, holdings and transactions.
+
+Staff can read every portfolio; other Django users only those of the
+portfolio.User with their email address, and get a 404 for the rest.
+
+Every response carries a strong ETag built from the data versions in
+portfolio.versions plus the request parameters, so:
+  - a matching If-None-Match returns 304 after only the ownership check, and
+  - the rendered body is cached under the ETag itself, which means a
+    version bump (persist_holdings, price refresh, admin edit) invalidates
+    it without deleting anything.
+
+Lists use keyset pagination: the `cursor` parameter is an opaque token for
+the (timestamp, id) of the last row of the previous page, and the next page
+is everything strictly after it in (-timestamp, -id) order.
+"""
+import base64
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.http import require_GET
+
+from portfolio import exports
+from portfolio.analytics import get_analytics
+from portfolio.db_router import replica_reads
+from portfolio.models import Holding, Portfolio, Transaction, User
+from portfolio.performance import value_series
+from portfolio.versions import (
+    current_versions, portfolio_version, prices_version, user_version, values_version,
+)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+DEFAULT_SERIES_DAYS = 365
+
+
+class BadRequest(ValueError):
+    pass
+
+
+# ---------------------------------------------------------
+# Cursor / paging helpers
+# ---------------------------------------------------------
+def encode_cursor(ts, pk):
+    raw = json.dumps([ts.isoformat(), pk], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, pk = json.loads(base64.urlsafe_b64decode(padded))
+        parsed = parse_datetime(ts)
+    except (ValueError, TypeError):
+        raise BadRequest("invalid cursor")
+    if parsed is None or not isinstance(pk, int):
+        raise BadRequest("invalid cursor")
+    return parsed, pk
+
+
+def _page_size(request):
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise BadRequest("limit must be an integer")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_page(qs, ts_field, cursor, limit):
+    """(rows, next_cursor) for `qs` ordered by (-ts_field, -id)."""
+    qs = qs.order_by(F(ts_field).desc(), F("id").desc())
+    if cursor:
+        ts, pk = decode_cursor(cursor)
+        qs = qs.filter(Q(**{f"{ts_field}__lt": ts}) | Q(**{ts_field: ts, "id__lt": pk}))
+    rows = list(qs[: limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[ts_field], last["id"])
+    return rows, next_cursor
+
+
+# ---------------------------------------------------------
+# ETag / cache plumbing
+# ---------------------------------------------------------
+def _etag(kind, versions, request):
+    params = sorted((k, v) for k, v in request.GET.items())
+    digest = hashlib.sha256(
+        json.dumps([kind, versions, params], separators=(",", ":")).encode()
+    ).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def _if_none_match(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH", "")
+    return etag in (tag.strip() for tag in header.split(","))
+
+
+# ---------------------------------------------------------
+# Access
+# ---------------------------------------------------------
+def owned_users(request):
+    """portfolio.User rows the Django user may read, or None for all (staff)."""
+    if request.user.is_staff:
+        return None
+    email = request.user.email
+    if not email:
+        return User.objects.none()
+    return User.objects.filter(email__iexact=email)
+
+
+def can_read_user(request, user_id):
+    users = owned_users(request)
+    return users is None or users.filter(pk=user_id).exists()
+
+
+def can_read_portfolio(request, portfolio_id):
+    users = owned_users(request)
+    return users is None or Portfolio.objects.filter(pk=portfolio_id, user__in=users).exists()
+
+
+def cached_json(kind, versions, build, allowed):
+    """
+    Shared endpoint flow: authenticate, allowed(request) or 404, then 304
+    or cached body by ETag, otherwise build(request) -> payload, render it
+    and cache it.
+    """
+    def respond(request):
+        if not request.user.is_authenticated:
+            return JsonResponse({"error": "authentication required"}, status=401)
+        # Before the ETag: cached bodies are shared between callers.
+        if not allowed(request):
+            return JsonResponse({"error": "not found"}, status=404)
+
+        etag = _etag(kind, versions(), request)
+        if _if_none_match(request, etag):
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            return response
+
+        cache_key = f"api:{etag.strip(chr(34))}"
+        body = cache.get(cache_key)
+        if body is None:
+            try:
+                payload = build(request)
+            except BadRequest as exc:
+                return JsonResponse({"error": str(exc)}, status=400)
+            body = json.dumps(payload, cls=DjangoJSONEncoder)
+            cache.set(cache_key, body, getattr(settings, "API_CACHE_SECONDS", 300))
+
+        response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+    return respond
+
+
+# ---------------------------------------------------------
+# Endpoints
+# ---------------------------------------------------------
+@require_GET
+def user_portfolios(request, user_id):
+    def build(request):
+        rows = list(
+            Portfolio.objects.filter(user_id=user_id)
+            .order_by("id")
+            .values("id", "name", "description", "is_default", "active", "created_at")
+        )
+        return {"results": rows}
+
+    allowed = lambda request: can_read_user(request, user_id)
+    return cached_json("portfolios", lambda: [user_version(user_id)], build, allowed)(request)
+
+
+HOLDING_FIELDS = (
+    "id", "broker_account_id", "quantity", "avg_price", "currency", "as_of",
+    "stock_id", "stock__symbol", "stock__isin", "stock__asset_type",
+    "stock__last_price", "stock__close_price", "stock__as_of",
+)
+
+
+@require_GET
+def portfolio_holdings(request, portfolio_id):
+    def build(request):
+        qs = Holding.objects.filter(broker_account__portfolio_id=portfolio_id).values(*HOLDING_FIELDS)
+        rows, next_cursor = keyset_page(qs, "as_of", request.GET.get("cursor"), _page_size(request))
+        results = []
+        for row in rows:
+            results.append({
+                "id": row["id"],
+                "broker_account_id": row["broker_account_id"],
+                "quantity": row["quantity"],
+                "avg_price": row["avg_price"],
+                "currency": row["currency"],
+                "as_of": row["as_of"],
+                "stock": {
+                    "id": row["stock_id"],
+                    "symbol": row["stock__symbol"],
+                    "isin": row["stock__isin"],
+                    "asset_type": row["stock__asset_type"],
+                    "last_price": row["stock__last_price"],
+                    "close_price": row["stock__close_price"],
+                    "as_of": row["stock__as_of"],
+                },
+            })
+        return {"results": results, "next_cursor": next_cursor}
+
+    # Holdings embed stock prices, so they change with either version.
+    versions = lambda: [portfolio_version(portfolio_id), prices_version()]
+    allowed = lambda request: can_read_portfolio(request, portfolio_id)
+    return cached_json("holdings", versions, build, allowed)(request)
+
+
+TRANSACTION_FIELDS = (
+    "id", "broker_account_id", "stock_id", "stock__symbol", "quantity", "price",
+    "currency", "trade_type", "trade_time",
+)
+
+
+@require_GET
+def portfolio_transactions(request, portfolio_id):
+    def build(request):
+        qs = Transaction.objects.filter(broker_account__portfolio_id=portfolio_id).values(*TRANSACTION_FIELDS)
+        rows, next_cursor = keyset_page(qs, "trade_time", request.GET.get("cursor"), _page_size(request))
+        return {"results": rows, "next_cursor": next_cursor}
+
+    allowed = lambda request: can_read_portfolio(request, portfolio_id)
+    return cached_json("transactions", lambda: [portfolio_version(portfolio_id)], build, allowed)(request)
+
+
+@require_GET
+def portfolio_analytics(request, portfolio_id):
+    """Valuation, allocation and XIRR: ?currency= (default VALUATION_CURRENCY)."""
+    def build(request):
+        currency = request.GET.get("currency") or None
+        return {
+            name: get_analytics(name, portfolio_id, currency=currency)
+            for name in ("valuation", "allocation", "xirr")
+        }
+
+    versions = lambda: current_versions(portfolio_id, ("portfolio", "prices", "fx"))
+    allowed = lambda request: can_read_portfolio(request, portfolio_id)
+    return cached_json("analytics", versions, build, allowed)(request)
+
+
+def _date_param(request, name, default):
+    value = request.GET.get(name)
+    if not value:
+        return default
+    try:
+        parsed = parse_date(value)
+    except ValueError:      # well-formed but impossible, e.g. 2020-13-01
+        parsed = None
+    if parsed is None:
+        raise BadRequest(f"{name} must be a date (YYYY-MM-DD)")
+    return parsed
+
+
+@require_GET
+def portfolio_values(request, portfolio_id):
+    """Daily value series for charts: ?since=&until= (default: the last year)."""
+    def build(request):
+        until = _date_param(request, "until", timezone.localdate())
+        since = _date_param(request, "since", until - timedelta(days=DEFAULT_SERIES_DAYS))
+        if since > until:
+            raise BadRequest("since must not be after until")
+        return {"since": since, "until": until, "results": value_series(portfolio_id, since, until)}
+
+    allowed = lambda request: can_read_portfolio(request, portfolio_id)
+    return cached_json("values", lambda: [values_version(portfolio_id)], build, allowed)(request)
+
+
+# ---------------------------------------------------------
+# Streaming exports
+# ---------------------------------------------------------
+EXPORT_CONTENT_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+@require_GET
+def export(request, kind):
+    """
+    /api/exports/<holdings|transactions>/?format=csv|ndjson&portfolio=&broker=
+    &asset_type=&since=&until=&gzip=1 — streamed, never cached. Non-staff
+    users only get rows of their own portfolios.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "authentication required"}, status=401)
+
+    fmt = request.GET.get("format", "csv")
+    if fmt not in exports.FORMATS:
+        return JsonResponse({"error": f"unknown format: {fmt}"}, status=400)
+    try:
+        with replica_reads():
+            columns, qs = exports.export_queryset(
+                kind,
+                portfolio=request.GET.get("portfolio"),
+                broker=request.GET.get("broker"),
+                asset_type=request.GET.get("asset_type"),
+                since=request.GET.get("since"),
+                until=request.GET.get("until"),
+                users=owned_users(request),
+            )
+    except exports.ExportError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    stream = exports.encode(exports.render(fmt, columns, qs))
+    filename = f"{kind}.{fmt}"
+    gzipped = request.GET.get("gzip") in ("1", "true")
+    if gzipped:
+        stream = exports.gzip_stream(stream)
+        filename += ".gz"
+
+    response = StreamingHttpResponse(
+        stream,
+        content_type="application/gzip" if gzipped else EXPORT_CONTENT_TYPES[fmt],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
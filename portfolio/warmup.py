@@ -0,0 +1,138 @@
+# portfolio/warmup.py
+"""
+Per-process warm-up for Celery workers.
+
+A freshly forked prefork child (and every replacement after
+worker_max_tasks_per_child) would otherwise pay on its first task for:
+importing the broker triggers, opening a database connection, creating the
+Redis and HTTP pools, opening the instrument index and loading the FX
+table. warm_up_process() does all of that when the child starts, before it
+takes a task. Pools without child processes (threads, solo) run it once
+when the worker is ready.
+
+The duration of each process's first task is recorded as "warm" or "cold"
+(WORKER_WARMUP=False) so the two can be compared with
+`manage.py worker_warmup_stats`.
+"""
+import importlib
+import logging
+import os
+import time
+
+import redis
+from celery.signals import task_postrun, task_prerun, worker_init, worker_process_init, worker_ready
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from portfolio.fx import get_rate_table
+from portfolio.http import get_http_session
+from portfolio.instruments import get_instrument_index
+from portfolio.redis_client import get_redis
+from portfolio.triggers import registry
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "worker:stats:first_task"
+
+_state = {"pid": None, "warm": False, "started": {}, "first_done": False}
+
+
+def preload_triggers():
+    """Import the trigger module of every broker with active accounts. Returns their codes."""
+    from portfolio.models import BrokerAccount
+
+    codes = set(
+        BrokerAccount.objects.filter(status="active")
+        .values_list("broker_type__code", flat=True)
+        .distinct()
+    )
+    for code in codes:
+        if registry.get_trigger_for_code(code):
+            continue
+        try:
+            importlib.import_module(f"portfolio.triggers.{code.lower()}")
+        except ImportError:
+            logger.warning("No trigger module for broker %s", code)
+    return sorted(c for c in codes if registry.get_trigger_for_code(c))
+
+
+def warm_up_process(**kwargs):
+    """Open this process's connections and load its caches; never fails the worker."""
+    _state.update(pid=os.getpid(), warm=False, started={}, first_done=False)
+    if not getattr(settings, "WORKER_WARMUP", True):
+        return
+
+    started = time.monotonic()
+    steps = [
+        ("database", lambda: connections[DEFAULT_DB_ALIAS].ensure_connection()),
+        ("triggers", preload_triggers),
+        ("redis", lambda: get_redis().ping()),
+        ("cache", lambda: cache.get("warmup")),
+        ("http", get_http_session),
+        ("instruments", get_instrument_index),
+        ("fx", get_rate_table),
+    ]
+    failed = []
+    for name, step in steps:
+        try:
+            step()
+        except Exception as exc:
+            logger.warning("Warm-up step %s failed: %s", name, exc)
+            failed.append(name)
+
+    _state["warm"] = not failed
+    logger.info(
+        "Worker process %s warmed up in %.0f ms%s",
+        os.getpid(), (time.monotonic() - started) * 1000,
+        f" (failed: {', '.join(failed)})" if failed else "",
+    )
+
+
+@worker_init.connect
+def install_warmup(sender=None, **kwargs):
+    # Connected here rather than at import so it runs after Celery's Django
+    # fixup has dropped the database connections the child inherited.
+    pool = str(getattr(sender, "pool_cls", "")).lower()
+    if "prefork" in pool:
+        worker_process_init.connect(warm_up_process, weak=False)
+    else:
+        worker_ready.connect(warm_up_process, weak=False)
+
+
+@task_prerun.connect
+def _first_task_started(task_id=None, **kwargs):
+    if _state["pid"] == os.getpid() and not _state["first_done"]:
+        _state["started"][task_id] = time.monotonic()
+
+
+@task_postrun.connect
+def _first_task_finished(task_id=None, task=None, **kwargs):
+    started = _state["started"].pop(task_id, None)
+    if started is None or _state["first_done"]:
+        return
+    _state["first_done"] = True
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    kind = "warm" if _state["warm"] else "cold"
+    logger.info("First task in process %s (%s): %s took %d ms", os.getpid(), kind, task.name, elapsed_ms)
+    try:
+        get_redis().pipeline(transaction=False).hincrby(STATS_KEY, f"{kind}:count", 1).hincrby(
+            STATS_KEY, f"{kind}:ms", elapsed_ms
+        ).execute()
+    except redis.RedisError:
+        logger.debug("Cannot record first-task latency", exc_info=True)
+
+
+def first_task_stats():
+    """{"warm"|"cold": {"count", "avg_ms"}} over all recorded worker processes."""
+    raw = get_redis().hgetall(STATS_KEY)
+    out = {}
+    for kind in ("cold", "warm"):
+        count = int(raw.get(f"{kind}:count", 0))
+        total = int(raw.get(f"{kind}:ms", 0))
+        out[kind] = {"count": count, "avg_ms": total / count if count else None}
+    return out
+
+
+def reset_first_task_stats():
+    get_redis().delete(STATS_KEY)
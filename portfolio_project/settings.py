@@ -31,6 +31,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'portfolio.query_budget.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'portfolio_project.urls'
@@ -57,6 +58,24 @@ DATABASES = {
     'default': env.db(default='sqlite:///db.sqlite3')
 }
 
+# Read replicas (comma-separated URLs) -> aliases replica_0, replica_1, ...
+# Only code wrapped in portfolio.db_router.replica_reads() reads from them;
+# replicas lagging more than REPLICA_MAX_LAG_SECONDS are skipped.
+DATABASE_REPLICAS = []
+for _i, _url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[])):
+    DATABASES[f'replica_{_i}'] = {**env.db_url_config(_url), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{_i}')
+DATABASE_ROUTERS = ['portfolio.db_router.ReplicaRouter']
+REPLICA_MAX_LAG_SECONDS = env.int('REPLICA_MAX_LAG_SECONDS', default=5)
+REPLICA_LAG_CHECK_SECONDS = env.int('REPLICA_LAG_CHECK_SECONDS', default=5)
+
+# Persistent connections: reused across requests / tasks for DB_CONN_MAX_AGE
+# seconds and checked before reuse, so a server-side disconnect costs a
+# reconnect instead of a failed query.
+for _db in DATABASES.values():
+    _db.setdefault('CONN_MAX_AGE', env.int('DB_CONN_MAX_AGE', default=60))
+    _db.setdefault('CONN_HEALTH_CHECKS', True)
+
 AUTH_PASSWORD_VALIDATORS = []
 
 LANGUAGE_CODE = 'en-us'
@@ -74,6 +93,14 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Kolkata'
+CELERY_WORKER_MAX_TASKS_PER_CHILD = env.int('WORKER_MAX_TASKS_PER_CHILD', default=0) or None
+
+# Each worker process opens its DB / Redis / HTTP connections and loads the
+# trigger modules, instrument index and FX table before its first task
+# (portfolio.warmup). Set to False to measure cold first-task latency.
+WORKER_WARMUP = env.bool('WORKER_WARMUP', default=True)
+HTTP_POOL_CONNECTIONS = env.int('HTTP_POOL_CONNECTIONS', default=10)
+HTTP_POOL_MAXSIZE = env.int('HTTP_POOL_MAXSIZE', default=32)
 
 # Use DB scheduler so django-celery-beat stores schedules in DB
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
@@ -81,6 +108,158 @@ CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 # If you want to use django-celery-results to persist task results:
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
 
+# Sync scheduling: the dispatcher spreads portfolios over this window in
+# PORTFOLIO_SYNC_SLOTS stable slots. Keep the interval equal to the beat
+# schedule of `active_users_data_sync_worker`.
+PORTFOLIO_SYNC_INTERVAL_SECONDS = env.int('PORTFOLIO_SYNC_INTERVAL_SECONDS', default=300)
+PORTFOLIO_SYNC_SLOTS = env.int('PORTFOLIO_SYNC_SLOTS', default=30)
+
+# Lease lock per (broker_account, action); expires on its own if a worker dies.
+# Should comfortably exceed one fetch + persist (retries extend it).
+SYNC_LOCK_TTL_SECONDS = env.int('SYNC_LOCK_TTL_SECONDS', default=600)
+
+# Task routing: dispatcher and portfolio-level (DB heavy) tasks run on the
+# `sync` queue; broker API calls go to one queue per broker code (see
+# portfolio.routing.broker_queue), unknown brokers to `broker.default`.
+BROKER_QUEUE_PREFIX = 'broker.'
+BROKER_QUEUE_CODES = [c.lower() for c in env.list('BROKER_QUEUE_CODES', default=['zerodha', 'coinswitch'])]
+
+CELERY_TASK_ROUTES = {
+    'portfolio.tasks.dispatcher.*': {'queue': 'sync'},
+    'portfolio.tasks.portfolio.*': {'queue': 'sync'},
+    'portfolio.tasks.prices.*': {'queue': 'sync'},
+    'portfolio.tasks.broker.broker_action_task': {'queue': f'{BROKER_QUEUE_PREFIX}default'},
+}
+
+# Worker profiles, one worker process per profile. Broker workers only wait
+# on HTTP, so they use the threads pool with high concurrency; the sync
+# worker keeps prefork. Print a command line with:
+#   python manage.py celery_worker_command <profile>
+CELERY_WORKER_PROFILES = {
+    'sync': {
+        'queues': ['celery', 'sync'],
+        'pool': 'prefork',
+        'concurrency': env.int('SYNC_WORKER_CONCURRENCY', default=4),
+    },
+    'broker-default': {
+        'queues': [f'{BROKER_QUEUE_PREFIX}default'],
+        'pool': 'threads',
+        'concurrency': env.int('BROKER_WORKER_CONCURRENCY', default=16),
+    },
+}
+for _code in BROKER_QUEUE_CODES:
+    CELERY_WORKER_PROFILES[f'broker-{_code}'] = {
+        'queues': [f'{BROKER_QUEUE_PREFIX}{_code}'],
+        'pool': 'threads',
+        'concurrency': env.int(
+            f'BROKER_{_code.upper()}_WORKER_CONCURRENCY',
+            default=env.int('BROKER_WORKER_CONCURRENCY', default=16),
+        ),
+    }
+
+# Bulk "sync now" (admin actions): per-broker requests per minute; tasks of
+# one broker are staggered with a countdown to stay under it.
+BROKER_SYNC_RATE_LIMITS = {
+    'zerodha': env.int('BROKER_ZERODHA_SYNC_RATE', default=120),
+    'coinswitch': env.int('BROKER_COINSWITCH_SYNC_RATE', default=60),
+}
+BROKER_SYNC_DEFAULT_RATE = env.int('BROKER_SYNC_DEFAULT_RATE', default=60)
+
+# Unacked messages (including countdown / ETA tasks waiting in a worker) are
+# redelivered by the Redis transport after visibility_timeout and would run
+# twice. Bulk syncs never schedule a task further out than
+# BULK_SYNC_MAX_SPREAD_SECONDS; keep it well below the timeout, and raise
+# both together. Accounts that do not fit are deferred to the next run.
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'visibility_timeout': env.int('CELERY_VISIBILITY_TIMEOUT', default=3600),
+}
+BULK_SYNC_MAX_SPREAD_SECONDS = min(
+    env.int('BULK_SYNC_MAX_SPREAD_SECONDS', default=3000),
+    CELERY_BROKER_TRANSPORT_OPTIONS['visibility_timeout'] - 300,
+)
+
+# Prices are refreshed by refresh_prices_task; holdings sync only writes a
+# Stock price when the stored one is older than this.
+HOLDINGS_PRICE_STALE_SECONDS = env.int('HOLDINGS_PRICE_STALE_SECONDS', default=60)
+
+# FX: rates are stored relative to FX_PIVOT_CURRENCY and refreshed daily by
+# refresh_fx_rates_task from FX_RATE_SOURCE ('static' uses FX_STATIC_RATES,
+# 'frankfurter' the ECB reference rates). Valuations are reported in
+# VALUATION_CURRENCY; aliases map e.g. stablecoins onto their fiat currency.
+FX_PIVOT_CURRENCY = 'INR'
+VALUATION_CURRENCY = env('VALUATION_CURRENCY', default='INR')
+FX_RATE_SOURCE = env('FX_RATE_SOURCE', default='static')
+FX_CURRENCIES = env.list('FX_CURRENCIES', default=['USD'])
+FX_CURRENCY_ALIASES = {'USDT': 'USD', 'USDC': 'USD'}
+FX_STATIC_RATES = {'USD': '83.00', 'EUR': '90.00', 'GBP': '105.00'}
+FX_TABLE_CHECK_SECONDS = env.int('FX_TABLE_CHECK_SECONDS', default=30)
+
+# In-process Kite token cache (see portfolio.token_cache): entries are re-read
+# after this many seconds even without an invalidation message, or when the
+# token is within the margin of its expiry.
+KITE_TOKEN_CACHE_SECONDS = env.int('KITE_TOKEN_CACHE_SECONDS', default=3600)
+KITE_TOKEN_REFRESH_MARGIN_SECONDS = env.int('KITE_TOKEN_REFRESH_MARGIN_SECONDS', default=300)
+
+# Kite instruments dump (URL or local CSV path) and the compiled, mmap-shared
+# index built from it daily by refresh_instruments_task / `manage.py refresh_instruments`.
+KITE_INSTRUMENTS_SOURCE = env('KITE_INSTRUMENTS_SOURCE', default='https://api.kite.trade/instruments')
+KITE_INSTRUMENTS_INDEX = env('KITE_INSTRUMENTS_INDEX', default=str(BASE_DIR / 'var' / 'kite_instruments.idx'))
+
+# Unreferenced RawSnapshot rows older than this are removed by prune_raw_snapshots_task.
+RAW_SNAPSHOT_RETENTION_DAYS = env.int('RAW_SNAPSHOT_RETENTION_DAYS', default=30)
+
+# Monthly partitions of history tables (Postgres only, see portfolio.partitions):
+# manage_partitions_task keeps this many future months created and detaches
+# months older than the retention (0 = keep all), moving them to the archive
+# schema if one is set. Retired months leave portfolio_transaction, so their
+# trades no longer count towards XIRR, adjusted positions or daily-value
+# backfills: only set a retention older than any history you report on.
+PARTITION_MONTHS_AHEAD = env.int('PARTITION_MONTHS_AHEAD', default=3)
+PARTITION_RETENTION_MONTHS = env.int('PARTITION_RETENTION_MONTHS', default=0)
+PARTITION_ARCHIVE_SCHEMA = env('PARTITION_ARCHIVE_SCHEMA', default='')
+
+# Read API: rendered bodies are cached by ETag; version bumps make old entries unreachable.
+API_CACHE_SECONDS = env.int('API_CACHE_SECONDS', default=300)
+
+# Admin: changelists of unfiltered tables above this many rows use the
+# planner's row estimate instead of COUNT(*) (Postgres only).
+ADMIN_ESTIMATED_COUNT_THRESHOLD = env.int('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=100000)
+ADMIN_DASHBOARD_CACHE_SECONDS = env.int('ADMIN_DASHBOARD_CACHE_SECONDS', default=60)
+
+# Query budgets (portfolio.query_budget): every task and request is counted;
+# going over the limits, or running one query shape more than
+# QUERY_BUDGET_MAX_DUPLICATES times (an N+1), is logged. QUERY_BUDGETS pins
+# tighter limits per task name / URL name: an int or {'queries', 'duplicates'}.
+QUERY_BUDGET_ENABLED = env.bool('QUERY_BUDGET_ENABLED', default=True)
+QUERY_BUDGET_MAX_QUERIES = env.int('QUERY_BUDGET_MAX_QUERIES', default=100)
+QUERY_BUDGET_MAX_DUPLICATES = env.int('QUERY_BUDGET_MAX_DUPLICATES', default=10)
+QUERY_BUDGETS = {
+    'portfolio.tasks.broker.broker_action_task': {'queries': 15, 'duplicates': 2},
+    'portfolio.tasks.portfolio.portfolio_sync_task': {'queries': 5, 'duplicates': 2},
+    'portfolio.tasks.portfolio.portfolio_sync_complete_task': {'queries': 5, 'duplicates': 2},
+    'portfolio.tasks.dispatcher.active_users_data_sync_worker': {'queries': 2, 'duplicates': 1},
+    # Session, auth user, ownership check, then the page itself.
+    'api-user-portfolios': 4,
+    'api-portfolio-holdings': 4,
+    'api-portfolio-transactions': 4,
+    'api-portfolio-values': 4,
+    'api-portfolio-analytics': 6,
+}
+
+# Holdings change events (portfolio.events): persist_holdings and price
+# refreshes XADD new / quantity / closed / price events to this stream after
+# commit; consumers read it through consumer groups.
+HOLDING_EVENTS_ENABLED = env.bool('HOLDING_EVENTS_ENABLED', default=True)
+HOLDING_EVENTS_STREAM = env('HOLDING_EVENTS_STREAM', default='holdings:events')
+HOLDING_EVENTS_MAXLEN = env.int('HOLDING_EVENTS_MAXLEN', default=100000)
+HOLDING_EVENTS_PRICE_MOVE_PCT = env.float('HOLDING_EVENTS_PRICE_MOVE_PCT', default=0)
+
+# Analytics results are keyed by data versions, so the TTL only frees memory.
+# A miss is computed by one caller; others wait up to ANALYTICS_WAIT_SECONDS.
+ANALYTICS_CACHE_SECONDS = env.int('ANALYTICS_CACHE_SECONDS', default=86400)
+ANALYTICS_LOCK_SECONDS = env.int('ANALYTICS_LOCK_SECONDS', default=60)
+ANALYTICS_WAIT_SECONDS = env.int('ANALYTICS_WAIT_SECONDS', default=10)
+
 REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
 
 # Optional: if you use django-redis cache backend, configure it too
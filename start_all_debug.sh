@@ -38,21 +38,40 @@ echo $! > logs/django.pid
 echo "✔ Django PID: $(cat logs/django.pid)"
 
 # ------------------------------------
-#  START CELERY WORKER (DEBUG MODE)
+#  START CELERY SYNC WORKER (dispatcher + portfolio tasks)
 # ------------------------------------
 echo ""
-echo "▶ Starting Celery Worker in DEBUG mode..."
+echo "▶ Starting Celery sync worker (prefork)..."
+DEBUG_ATTACH=0 $(python manage.py celery_worker_command sync) \
+  --loglevel=INFO \
+  > logs/worker_sync.log 2>&1 &
+
+echo $! > logs/celery_worker_sync.pid
+echo "✔ Celery sync worker PID: $(cat logs/celery_worker_sync.pid)"
+
+# ------------------------------------
+#  START CELERY BROKER WORKER (DEBUG MODE)
+# ------------------------------------
+# broker_action_task is where wait_for_debugger() runs, so in debug mode a
+# single solo worker consumes every broker queue. In production each
+# broker-* profile runs as its own threads-pool worker instead.
+echo ""
+echo "▶ Starting Celery broker worker in DEBUG mode..."
 export DEBUG_ATTACH=1
 export DEBUGPY_PORT=$DEBUGPY_PORT
 
+BROKER_QUEUES=$(python manage.py celery_worker_command --queues 'broker-*')
+
 celery -A $PROJECT worker \
+  -n broker-debug@%h \
+  -Q "$BROKER_QUEUES" \
   -P solo \
   --concurrency=1 \
   --loglevel=INFO \
   > logs/worker.log 2>&1 &
 
 echo $! > logs/celery_worker.pid
-echo "✔ Celery Worker PID: $(cat logs/celery_worker.pid)"
+echo "✔ Celery broker worker PID: $(cat logs/celery_worker.pid) (queues: $BROKER_QUEUES)"
 
 # ------------------------------------
 #  START CELERY BEAT
@@ -48,6 +48,7 @@ mkdir -p "$LOG_DIR"
 # 1. Kill by PID files first
 stop_by_pid "Django" "django.pid"
 stop_by_pid "Celery Worker" "celery_worker.pid" 
+stop_by_pid "Celery Sync Worker" "celery_worker_sync.pid"
 stop_by_pid "Celery Beat" "celery_beat.pid"
 stop_by_pid "Flower" "flower.pid"
 